@@ -30,8 +30,8 @@ from learning.transfer import (LinearTransfer, TanhTransfer, ReluTransfer,
                                GaussianTransfer, SoftmaxTransfer)
 
 # Add error functions
-from learning.error import (MeanSquaredError, CrossEntropyError, L1Penalty,
-                            L2Penalty)
+from learning.error import (MeanSquaredError, CrossEntropyError,
+                            BinaryCrossEntropyError, L1Penalty, L2Penalty)
 
 # Add model building
 from learning.base import Model
@@ -22,25 +22,351 @@
 # SOFTWARE.
 ###############################################################################
 """Layers and functions for a k-nearest-neighbors architecture."""
-import heapq
+import numpy
 
 from learning import calculate
 
+# Max number of distances held in memory at once by k_nearest_neighbors
+MAX_BLOCK_ELEMENTS = 2**22
+
+
+# k_nearest_neighbors uses a KNNIndex when matrix has at least this many rows,
+# at most this many columns, and there are at least this many queries.
+# Otherwise, brute force matrix products are faster.
+INDEX_MIN_ROWS = 50000
+INDEX_MAX_DIMENSIONS = 4
+INDEX_MIN_QUERIES = 1000
+
 
 def select_k_nearest_neighbors(matrix, center, k):
-    """Return the k indexes of rows in matrix nearest center."""
+    """Return the k indexes of rows in matrix nearest center.
+
+    Indexes are ordered from nearest to farthest.
+
+    Args:
+        matrix: Matrix with vectors in rows, or KNNIndex of such a matrix,
+            for repeated queries against the same matrix.
+        center: Query vector.
+        k: Number of neighbors to select.
+    """
+    return list(
+        k_nearest_neighbors(matrix, numpy.asarray(center)[None, :], k)[0])
+
+
+def k_nearest_neighbors(matrix, query_matrix, k, block_size=None):
+    """Return indexes of the k rows in matrix nearest each row of query_matrix.
+
+    Distances are calculated for blocks of query rows at a time,
+    so memory stays bounded for many queries.
+    For many queries against a large low dimensional matrix,
+    a KNNIndex is built and used instead.
+
+    Args:
+        matrix: Matrix with vectors in rows, to select neighbors from,
+            or KNNIndex of such a matrix.
+        query_matrix: Matrix with a query vector in each row.
+        k: Number of neighbors to select for each query.
+        block_size: Number of query rows in each block.
+            Defaults to as many as fit in MAX_BLOCK_ELEMENTS distances.
+
+    Returns:
+        numpy.array; Matrix with a row of k indexes for each query,
+            ordered from nearest to farthest.
+    """
+    if isinstance(matrix, KNNIndex):
+        return matrix.query(query_matrix, k)
+
+    matrix = numpy.asarray(matrix, dtype='d')
+    query_matrix = numpy.asarray(query_matrix, dtype='d')
     if k > len(matrix):
         raise ValueError('k must be less than the rows in the matrix')
 
-    # Calculate distances, for use in selecting closest
-    # TODO: calculate.distance should be able to take whole matrix
-    distances = [calculate.distance(vec, center) for vec in matrix]
+    if (len(matrix) >= INDEX_MIN_ROWS
+            and matrix.shape[1] <= INDEX_MAX_DIMENSIONS
+            and len(query_matrix) >= INDEX_MIN_QUERIES):
+        return KNNIndex(matrix).query(query_matrix, k)
 
-    # Find k vectors with smallest distances
-    # NOTE: Introselect algorithm, is O(n) instead of O(n log k)
-    #   However, the only implementation in python requires converting to a
-    #   numpy array.
-    nearest_indices = heapq.nsmallest(
-        k, range(len(distances)), key=distances.__getitem__)
+    if block_size is None:
+        block_size = max(1, MAX_BLOCK_ELEMENTS // len(matrix))
+
+    sq_norms = numpy.einsum('ij,ij->i', matrix, matrix)
+    nearest_indices = numpy.empty((len(query_matrix), k), dtype=int)
+    for start in range(0, len(query_matrix), block_size):
+        stop = start + block_size
+        nearest_indices[start:stop] = _k_smallest(
+            calculate.squared_distances(query_matrix[start:stop], matrix,
+                                        sq_norms), k)
 
     return nearest_indices
+
+
+def _k_smallest(distance_matrix, k):
+    """Return indexes of k smallest elements in each row, in ascending order."""
+    # Introselect, O(n) instead of O(n log n) for full sort
+    if k < distance_matrix.shape[1]:
+        indices = numpy.argpartition(distance_matrix, k - 1, axis=1)[:, :k]
+    else:
+        indices = numpy.tile(
+            numpy.arange(distance_matrix.shape[1]), (len(distance_matrix), 1))
+
+    # Only the k selected need to be sorted
+    rows = numpy.arange(len(distance_matrix))[:, None]
+    order = numpy.argsort(distance_matrix[rows, indices], axis=1)
+    return indices[rows, order]
+
+
+class KNNIndex(object):
+    """Spatial index of rows in a matrix, for repeated nearest neighbor queries.
+
+    Rows are recursively split at the median of their widest column,
+    until each leaf has at most leaf_size rows.
+    Nodes are stored in arrays, and each node covers a contiguous
+    range of the permuted rows.
+
+    Queries are grouped by the leaf they fall in,
+    and each group searches the tree together,
+    skipping nodes that cannot contain a nearer row,
+    and comparing against all rows of each remaining leaf at once.
+
+    Args:
+        matrix: Matrix with vectors in rows.
+        method: 'kd_tree' bounds each node by a box,
+            which is tight for few dimensions.
+            'ball_tree' bounds each node by a sphere,
+            which is tighter for more dimensions, or clustered data.
+        leaf_size: Max number of rows in each leaf.
+            Smaller leaves skip more rows, but take longer to traverse.
+    """
+
+    def __init__(self, matrix, method='kd_tree', leaf_size=40):
+        if method not in ('kd_tree', 'ball_tree'):
+            raise ValueError("method must be 'kd_tree' or 'ball_tree'")
+        if leaf_size < 1:
+            raise ValueError('leaf_size must be at least 1')
+
+        self.method = method
+        self.leaf_size = leaf_size
+
+        self._matrix = numpy.array(matrix, dtype='d')
+        self._indices = numpy.arange(len(self._matrix))
+        self._build()
+
+    def __len__(self):
+        return len(self._matrix)
+
+    def _build(self):
+        """Build node arrays, and permute rows so each node is contiguous."""
+        starts = []
+        stops = []
+        children = []
+        split_columns = []
+        split_values = []
+        nodes = [(0, len(self._matrix))]
+        # Nodes are numbered in order of creation,
+        # so children of node i are made after node i
+        i = 0
+        while i < len(nodes):
+            start, stop = nodes[i]
+            starts.append(start)
+            stops.append(stop)
+            i += 1
+
+            if stop - start <= self.leaf_size:
+                children.append(-1)
+                split_columns.append(0)
+                split_values.append(0.0)
+                continue
+
+            # Split at median of widest column
+            indices = self._indices[start:stop]
+            rows = self._matrix[indices]
+            column = numpy.argmax(rows.max(axis=0) - rows.min(axis=0))
+            middle = (stop - start) // 2
+            order = numpy.argpartition(rows[:, column], middle)
+            self._indices[start:stop] = indices[order]
+
+            split_columns.append(column)
+            split_values.append(rows[order[middle], column])
+
+            # Children are the next two nodes
+            children.append(len(nodes))
+            nodes.append((start, start + middle))
+            nodes.append((start + middle, stop))
+
+        self._starts = numpy.array(starts)
+        self._stops = numpy.array(stops)
+        self._children = numpy.array(children)
+        self._split_columns = numpy.array(split_columns)
+        self._split_values = numpy.array(split_values)
+
+        # Store rows in node order, so each leaf is a contiguous slice
+        self._sorted_matrix = self._matrix[self._indices]
+
+        # Bounds of each node
+        if self.method == 'kd_tree':
+            self._lower = numpy.array([
+                self._sorted_matrix[start:stop].min(axis=0)
+                for start, stop in zip(starts, stops)
+            ])
+            self._upper = numpy.array([
+                self._sorted_matrix[start:stop].max(axis=0)
+                for start, stop in zip(starts, stops)
+            ])
+        else:
+            self._centers = numpy.array([
+                self._sorted_matrix[start:stop].mean(axis=0)
+                for start, stop in zip(starts, stops)
+            ])
+            self._radii = numpy.array([
+                numpy.sqrt(
+                    calculate.squared_distances(
+                        self._centers[node][None, :],
+                        self._sorted_matrix[start:stop]).max())
+                for node, (start, stop) in enumerate(zip(starts, stops))
+            ])
+
+    def _query_groups(self, query_matrix):
+        """Return list of query indices in each group of nearby queries.
+
+        Queries are grouped by leaf they would fall in,
+        so each group shares most neighbors.
+        """
+        # Descend all queries at once, one level per loop
+        nodes = numpy.zeros(len(query_matrix), dtype=int)
+        internal = numpy.flatnonzero(self._children[nodes] != -1)
+        while len(internal) > 0:
+            internal_nodes = nodes[internal]
+            go_right = (query_matrix[internal, self._split_columns[
+                internal_nodes]] >= self._split_values[internal_nodes])
+            nodes[internal] = self._children[internal_nodes] + go_right
+            internal = internal[self._children[nodes[internal]] != -1]
+
+        order = numpy.argsort(nodes, kind='mergesort')
+        boundaries = numpy.flatnonzero(numpy.diff(nodes[order])) + 1
+        return numpy.split(order, boundaries)
+
+    def _min_sq_distance(self, lower, upper, node):
+        """Return lower bound of squared distance from box to rows of node.
+
+        Box is given by lower and upper corners,
+        and contains a group of queries.
+        """
+        if self.method == 'kd_tree':
+            # Gap between boxes, in each column
+            diff = numpy.maximum(
+                numpy.maximum(self._lower[node] - upper,
+                              lower - self._upper[node]), 0.0)
+            return diff.dot(diff)
+        else:
+            # Distance from box to surface of sphere
+            center = self._centers[node]
+            diff = numpy.maximum(
+                numpy.maximum(lower - center, center - upper), 0.0)
+            return max(numpy.sqrt(diff.dot(diff)) - self._radii[node],
+                       0.0)**2
+
+    def _search(self, query_block, get_max_sq_distance, visit_leaf):
+        """Visit leaves that may have rows within get_max_sq_distance().
+
+        visit_leaf is given row indexes of the leaf, and squared distances
+        between each query in query_block and each row of the leaf.
+        Nearer nodes are visited first, so bound shrinks quickly for k-NN.
+        """
+        lower = query_block.min(axis=0)
+        upper = query_block.max(axis=0)
+        query_sq_norms = numpy.einsum('ij,ij->i', query_block, query_block)
+
+        stack = [(0.0, 0)]
+        while stack:
+            min_sq_distance, node = stack.pop()
+            if min_sq_distance > get_max_sq_distance():
+                continue
+
+            left = self._children[node]
+            if left == -1:
+                start, stop = self._starts[node], self._stops[node]
+                visit_leaf(self._indices[start:stop],
+                           calculate.squared_distances(
+                               self._sorted_matrix[start:stop], query_block,
+                               query_sq_norms).T)
+                continue
+
+            # Push farther child first, so nearer is popped first
+            right = left + 1
+            left_distance = self._min_sq_distance(lower, upper, left)
+            right_distance = self._min_sq_distance(lower, upper, right)
+            if left_distance < right_distance:
+                stack.append((right_distance, right))
+                stack.append((left_distance, left))
+            else:
+                stack.append((left_distance, left))
+                stack.append((right_distance, right))
+
+    def query(self, query_matrix, k):
+        """Return indexes of the k rows nearest each row of query_matrix.
+
+        Returns:
+            numpy.array; Matrix with a row of k indexes for each query,
+                ordered from nearest to farthest.
+        """
+        if k > len(self._matrix):
+            raise ValueError('k must be less than the rows in the matrix')
+
+        query_matrix = numpy.asarray(query_matrix, dtype='d')
+        nearest_indices = numpy.empty((len(query_matrix), k), dtype=int)
+        for group in self._query_groups(query_matrix):
+            # Best k found so far, for each query in group
+            best_indices = numpy.zeros((len(group), k), dtype=int)
+            best_distances = numpy.empty((len(group), k))
+            best_distances.fill(calculate.INFINITY)
+            rows = numpy.arange(len(group))[:, None]
+
+            def visit_leaf(indices, sq_distances):
+                candidate_indices = numpy.hstack([
+                    best_indices,
+                    numpy.broadcast_to(indices, sq_distances.shape)
+                ])
+                candidate_distances = numpy.hstack(
+                    [best_distances, sq_distances])
+                selected = numpy.argpartition(
+                    candidate_distances, k - 1, axis=1)[:, :k]
+                best_indices[:] = candidate_indices[rows, selected]
+                best_distances[:] = candidate_distances[rows, selected]
+
+            self._search(query_matrix[group], best_distances.max,
+                         visit_leaf)
+
+            order = numpy.argsort(best_distances, axis=1)
+            nearest_indices[group] = best_indices[rows, order]
+
+        return nearest_indices
+
+    def query_radius(self, query_matrix, radius):
+        """Return indexes of rows within radius of each row of query_matrix.
+
+        Returns:
+            list; numpy.array of indexes for each query,
+                ordered from nearest to farthest.
+        """
+        query_matrix = numpy.asarray(query_matrix, dtype='d')
+        sq_radius = radius * radius
+
+        neighbors = [None] * len(query_matrix)
+        for group in self._query_groups(query_matrix):
+            found_indices = [[numpy.empty(0, dtype=int)] for _ in group]
+            found_distances = [[numpy.empty(0)] for _ in group]
+
+            def visit_leaf(indices, sq_distances):
+                for i, row_distances in enumerate(sq_distances):
+                    within = row_distances <= sq_radius
+                    found_indices[i].append(indices[within])
+                    found_distances[i].append(row_distances[within])
+
+            self._search(query_matrix[group], lambda: sq_radius, visit_leaf)
+
+            for i, query_index in enumerate(group):
+                indices = numpy.concatenate(found_indices[i])
+                neighbors[query_index] = indices[numpy.argsort(
+                    numpy.concatenate(found_distances[i]))]
+
+        return neighbors
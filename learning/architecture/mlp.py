@@ -29,7 +29,7 @@ import operator
 
 import numpy
 
-from learning import calculate, optimize
+from learning import calculate, optimize, parallel
 from learning import Model, LinearTransfer, ReluTransfer, MeanSquaredError
 from learning.transfer import Transfer
 from learning.optimize import Problem, SteepestDescent
@@ -51,14 +51,20 @@ class MLP(Model):
         error_func: ErrorFunc; Error function for optimizing weight matrices.
         jacobian_norm_break: Training will end if objective gradient norm
             is less than this value.
+        n_jobs: Number of processes used to calculate objective and jacobian
+            during train, each on a shard of dataset rows.
+            -1 uses all cpus. Worthwhile for large datasets,
+            where each evaluation takes much longer than process communication.
     """
+    supports_batch_activate = True
 
     def __init__(self,
                  shape,
                  transfers=None,
                  optimizer=None,
                  error_func=None,
-                 jacobian_norm_break=1e-10):
+                 jacobian_norm_break=1e-10,
+                 n_jobs=1):
         super(MLP, self).__init__()
 
         if transfers is None:
@@ -76,10 +82,14 @@ class MLP(Model):
 
         self._shape = shape
 
-        self._bias_vec = self._random_weight_matrix(
-            shape[1])  # Number of outputs of first layer
-        self._weight_matrices = []
-        self._setup_weight_matrices()
+        # Bias vector and weight matrices are views into one flat parameter vector,
+        # and their jacobians are views into one flat jacobian vector.
+        # This lets optimizers work on parameters without flattening,
+        # and jacobians are calculated in place.
+        num_parameters = _num_parameters(shape)
+        self._parameters = numpy.zeros(num_parameters)
+        self._jacobian = numpy.zeros(num_parameters)
+        self._setup_parameter_views()
         self._transfers = transfers
 
         # Parameter optimization for training
@@ -100,6 +110,13 @@ class MLP(Model):
         # Convergence criteria
         self._jacobian_norm_break = jacobian_norm_break
 
+        # Data parallel objective, only during train
+        self._num_processes = parallel.num_processes(n_jobs)
+        self._data_parallel = None
+
+        # Re-use objective values and jacobians calculated during line searches
+        self.evaluation_cache = optimize.EvaluationCache()
+
         # Activation vectors
         # 1 for input, then 2 for each hidden and output (1 for transfer, 1 for perceptron))
         # To help with jacobian calculation
@@ -108,14 +125,12 @@ class MLP(Model):
 
         self.reset()
 
-    def _setup_weight_matrices(self):
-        """Initialize weight matrices."""
-        self._weight_matrices = []
-        num_inputs = self._shape[0]
-        for num_outputs in self._shape[1:]:
-            self._weight_matrices.append(
-                self._random_weight_matrix((num_inputs, num_outputs)))
-            num_inputs = num_outputs
+    def _setup_parameter_views(self):
+        """Make bias vector and weight matrices (and jacobians) views of flat vectors."""
+        self._bias_vec, self._weight_matrices = _unflatten_weights(
+            self._parameters, self._shape)
+        self._bias_jacobian, self._weight_jacobians = _unflatten_weights(
+            self._jacobian, self._shape)
 
     def _random_weight_matrix(self, shape):
         """Return a random weight matrix."""
@@ -126,10 +141,12 @@ class MLP(Model):
         """Reset this model."""
         super(MLP, self).reset()
 
-        self._setup_weight_matrices()
-        self._bias_vec = self._random_weight_matrix(self._shape[1])
+        self._parameters[:] = self._random_weight_matrix(
+            self._parameters.shape)
+        self._setup_parameter_views()
 
         self._optimizer.reset()
+        self.evaluation_cache.reset()
 
     def activate(self, input_tensor):
         """Return the model outputs for given input_tensor."""
@@ -167,20 +184,64 @@ class MLP(Model):
 
         Train on a mini-batch.
         """
+        # Cached values are only valid for this dataset
+        self.evaluation_cache.check_objective(input_matrix, target_matrix)
+
+        if (self._data_parallel is not None
+                and self._data_parallel.input_matrix is input_matrix
+                and self._data_parallel.target_matrix is target_matrix):
+            obj_func = self._get_parallel_obj
+            obj_jac_func = self._get_parallel_obj_jac
+        else:
+            obj_func = lambda xk: self._get_obj(xk, input_matrix, target_matrix)
+            obj_jac_func = lambda xk: self._get_obj_jac(xk, input_matrix, target_matrix)
+
         error, flat_weights = self._optimizer.next(
             Problem(
-                obj_func=
-                lambda xk: self._get_obj(xk, input_matrix, target_matrix),
-                obj_jac_func=
-                lambda xk: self._get_obj_jac(xk, input_matrix, target_matrix)),
-            _flatten(self._bias_vec, self._weight_matrices))
-        self._bias_vec, self._weight_matrices = _unflatten_weights(
-            flat_weights, self._shape)
+                obj_func=obj_func,
+                obj_jac_func=obj_jac_func,
+                hess_vec_func=
+                lambda xk, vec: self._get_hess_vec(xk, vec, input_matrix, target_matrix),
+                residual_jac_func=
+                lambda xk: self._get_residual_jacobian(xk, input_matrix, target_matrix),
+                cache=self.evaluation_cache),
+            # Copy, because evaluating the objective writes to self._parameters
+            numpy.copy(self._parameters))
+        self._parameters[:] = flat_weights
 
         self.converged = self._optimizer.jacobian is not None and numpy.linalg.norm(
             self._optimizer.jacobian) < self._jacobian_norm_break
         return error
 
+    def _train(self, input_matrix, target_matrix, iterations, retries,
+               error_break, error_stagnant_distance, error_stagnant_threshold,
+               error_improve_iters, post_pattern_callback, retry_n_jobs=1):
+        """Train model on the given dataset.
+
+        With n_jobs, objective and jacobian are calculated in parallel,
+        with a pool of processes kept for all iterations and retries.
+        Attempts run in parallel with retry_n_jobs do not use this pool.
+        """
+        train_args = (iterations, retries, error_break,
+                      error_stagnant_distance, error_stagnant_threshold,
+                      error_improve_iters, post_pattern_callback, retry_n_jobs)
+        if (self._num_processes == 1
+                or (retries > 0 and parallel.num_processes(retry_n_jobs) > 1)):
+            return super(MLP, self)._train(input_matrix, target_matrix,
+                                           *train_args)
+
+        data_parallel = parallel.DataParallelObjective(
+            self, input_matrix, target_matrix, self._num_processes)
+        self._data_parallel = data_parallel
+        try:
+            return super(MLP, self)._train(input_matrix, target_matrix,
+                                           *train_args)
+        finally:
+            # NOTE: Retries may replace self.__dict__,
+            # so we close our own reference
+            data_parallel.close()
+            self._data_parallel = None
+
     def _post_train(self, input_matrix, target_matrix):
         """Call after Model.train.
 
@@ -188,30 +249,135 @@ class MLP(Model):
         """
         # Reset optimizer, because problem may change on next train call
         self._optimizer.reset()
+        self.evaluation_cache.clear()
 
     ######################################
     # Helper functions for optimizer
     ######################################
     def _get_obj(self, parameter_vec, input_matrix, target_matrix):
         """Helper function for Optimizer to get objective value."""
-        self._bias_vec, self._weight_matrices = _unflatten_weights(
-            parameter_vec, self._shape)
+        self._parameters[:] = parameter_vec
         return self._error_func(self.activate(input_matrix), target_matrix)
 
-
     def _get_obj_jac(self, parameter_vec, input_matrix, target_matrix):
-        """Helper function for Optimizer to get objective value and derivative."""
-        self._bias_vec, self._weight_matrices = _unflatten_weights(
-            parameter_vec, self._shape)
-        # Return error and flattened jacobians
-        return (lambda obj, vec, jac: (obj, _flatten(vec, jac)))(
-            *self._get_jacobians(input_matrix, target_matrix))
+        """Helper function for Optimizer to get objective value and derivative.
+
+        NOTE: Returned jacobian is overwritten by the next call.
+        """
+        self._parameters[:] = parameter_vec
+        error, _, _ = self._get_jacobians(input_matrix, target_matrix)
+
+        # Bias and weight jacobians are views of self._jacobian
+        return error, self._jacobian
+
+    def _get_parallel_obj(self, parameter_vec):
+        """Helper function for Optimizer to get objective value, in parallel."""
+        self._parameters[:] = parameter_vec
+        return self._data_parallel.get_obj(parameter_vec)
+
+    def _get_parallel_obj_jac(self, parameter_vec):
+        """Helper function for Optimizer to get objective value and derivative, in parallel.
+
+        NOTE: Returned jacobian is overwritten by the next call.
+        """
+        self._parameters[:] = parameter_vec
+        return self._data_parallel.get_obj_jac(
+            parameter_vec, out=self._jacobian)
+
+    def _get_hess_vec(self, parameter_vec, direction_vec, input_matrix,
+                      target_matrix):
+        """Helper function for Optimizer to get hessian vector product.
+
+        Gauss-Newton approximation of hessian is used, J^T H_e J,
+        where J is jacobian of outputs, with regard to parameters,
+        and H_e is hessian of error function, with regard to outputs.
+        Gauss-Newton hessian is positive semi-definite,
+        for convex error functions.
+        """
+        self._parameters[:] = parameter_vec
+        output_matrix = self.activate(input_matrix)
+        transfer_derivatives = self._transfer_derivatives()
+
+        # J v, with R-operator forward pass
+        # R{z_1} = X V_1 + v_b, R{a_i} = f_i'(z_i) R{z_i},
+        # R{z_i} = R{a_{i-1}} W_i + a_{i-1} V_i
+        bias_dir, weight_dirs = _unflatten_weights(direction_vec, self._shape)
+        transfer_input_dir = numpy.dot(input_matrix, weight_dirs[0]) + bias_dir
+        for i, transfer_derivative in enumerate(transfer_derivatives):
+            weight_input_dir = _matrix_or_diag_dot(transfer_derivative,
+                                                   transfer_input_dir)
+            if i + 1 < len(self._weight_matrices):
+                transfer_input_dir = (
+                    numpy.dot(weight_input_dir, self._weight_matrices[i + 1]) +
+                    numpy.dot(self._weight_inputs[i + 1], weight_dirs[i + 1]))
+
+        # H_e J v
+        error_hess_dot = self._error_func.hessian_vector_product(
+            output_matrix, target_matrix, weight_input_dir)
+
+        # J^T H_e J v, with backpropagation
+        hess_vec = numpy.empty(self._parameters.shape)
+        bias_hess_vec, weight_hess_vecs = _unflatten_weights(
+            hess_vec, self._shape)
+        self._backpropagate(error_hess_dot, transfer_derivatives,
+                            bias_hess_vec, weight_hess_vecs)
+        return hess_vec
+
+    def _get_residual_jacobian(self, parameter_vec, input_matrix,
+                               target_matrix):
+        """Helper function for Optimizer to get jacobian of residuals.
+
+        Only defined for MeanSquaredError, where error is ||r||^2,
+        with residuals r = (MLP(X) - Y) / sqrt(n).
+        Returns None for other error functions.
+
+        Each row is the derivative of one residual, with regard to parameters.
+        Rows are ordered by sample, then output.
+        """
+        if not isinstance(self._error_func, MeanSquaredError):
+            return None
+
+        self._parameters[:] = parameter_vec
+        output_matrix = self.activate(input_matrix)
+        transfer_derivatives = self._transfer_derivatives()
+
+        num_samples, num_outputs = output_matrix.shape
+        # Jacobian of each output is contiguous, while calculating
+        residual_jacobian = numpy.empty(
+            (num_outputs, num_samples, self._parameters.shape[0]))
+
+        # Backpropagate derivative of each output, without summing samples
+        output_jac = numpy.zeros(output_matrix.shape)
+        for k in range(num_outputs):
+            output_jac[:, k] = 1.0
+            partial_jacobians = self._partial_jacobians(output_jac,
+                                                        transfer_derivatives)
+            output_jac[:, k] = 0.0
+
+            bias_jacobians, weight_jacobians = _unflatten_sample_weights(
+                residual_jacobian[k], self._shape)
+            bias_jacobians[:] = partial_jacobians[0]
+            for weight_inputs, error_matrix, jacobians in zip(
+                    self._weight_inputs[:-1], partial_jacobians,
+                    weight_jacobians):
+                numpy.einsum('si,sj->sij', weight_inputs, error_matrix,
+                             out=jacobians)
+
+        # Residuals are scaled by 1 / sqrt(n), for mean
+        residual_jacobian /= numpy.sqrt(output_matrix.size)
+
+        # Order rows by sample, then output, like residuals
+        return residual_jacobian.transpose(1, 0, 2).reshape(
+            (output_matrix.size, self._parameters.shape[0]))
 
     ######################################
     # Objective Derivative
     ######################################
     def _get_jacobians(self, input_matrix, target_matrix):
-        """Return overall error, bias jacobian, and jacobian matrix for each weight matrix."""
+        """Return overall error, bias jacobian, and jacobian matrix for each weight matrix.
+
+        Jacobians are calculated in place, in views of self._jacobian.
+        """
         # Calculate derivative with regard to each weight matrix
         # d/dW_n e(MLP(X), Y) = f_{n-1}(...(f_1(X W_1 + b)...)W_{n-1}) e'(f_n(...(f_1(X W_1 + b)...)W_n), Y) f_n'(...(f_1(X W_1 + b)...)W_n)
         # d/dW_{n-1} e(MLP(X), Y) = f_{n-2}(...(f_1(X W_1 + b)...)W_{n-2}) e'(f_n(...(f_1(X W_1 + b)...)W_n), Y) f_n'(...(f_1(X W_1 + b)...)W_n) W_n^T f_{n-1}'(...(f_1(X W_1 + b)...)W_{n-1})
@@ -245,35 +411,79 @@ class MLP(Model):
         # ...
         # For d/dW_1: ((((e'(f_n(...(f_1(X W_1 + b)...)W_n), Y) f_n'(...(f_1(X W_1 + b)...)W_n)) W_n^T) f_{n-1}'(...(f_1(X W_1 + b)...)W_{n-1}) ... ) W_2^T) f_1'(X W_1 + b)
 
-        # TODO: Add optimization for cross entropy and softmax output (just o - t)
-        # Derivative of error_vec w.r.t. output transfer
-        partial_jacobians = [
-            _dot_diag_or_matrix(error_jac, self._transfers[-1].derivative(
-                self._transfer_inputs[-1], self._weight_inputs[-1]))
+        self._backpropagate(error_jac, self._transfer_derivatives(),
+                            self._bias_jacobian, self._weight_jacobians)
+
+        return error, self._bias_jacobian, self._weight_jacobians
+
+    def _transfer_derivatives(self):
+        """Return derivative of each transfer, for most recent activation."""
+        return [
+            transfer_func.derivative(transfer_inputs, weight_inputs)
+            for transfer_func, transfer_inputs, weight_inputs in zip(
+                self._transfers, self._transfer_inputs, self._weight_inputs[1:])
         ]
-        for weight_matrix, transfer_func, transfer_inputs, weight_inputs in reversed(
-                zip(self._weight_matrices[1:], self._transfers[:-1],
-                    self._transfer_inputs[:-1], self._weight_inputs[1:])):
-            partial_jacobians.append(
-                _dot_diag_or_matrix(partial_jacobians[-1].dot(weight_matrix.T),
-                                    transfer_func.derivative(
-                                        transfer_inputs, weight_inputs)))
-        # Reverse so partial_jacobians[0] corresponds to d/dW_1
-        partial_jacobians = list(reversed(partial_jacobians))
+
+    def _backpropagate(self, error_jac, transfer_derivatives, bias_out,
+                       weight_outs):
+        """Calculate derivatives of error_jac, with regard to bias and weights.
+
+        Derivatives are calculated in place, in bias_out and weight_outs.
+        """
+        partial_jacobians = self._partial_jacobians(error_jac,
+                                                    transfer_derivatives)
 
         # Finalize jacobian for each weight matrix
         # by multiplying final f_{i-1}(...(f_1(X W_1 + b)...)W_{i-1}) (or X for d/W_1)
         # with partial jacobian corresponding to d/dW_i
         # NOTE: self._weight_inputs[-1] is model output
         assert len(self._weight_inputs) - 1 == len(partial_jacobians)
-        jacobians = [
-            weight_inputs.T.dot(error_matrix)
-            for weight_inputs, error_matrix in zip(self._weight_inputs[:-1],
-                                                   partial_jacobians)
-        ]
+        for weight_inputs, error_matrix, jacobian in zip(
+                self._weight_inputs[:-1], partial_jacobians, weight_outs):
+            numpy.dot(weight_inputs.T, error_matrix, out=jacobian)
 
         # Bias is \vec{1}^T times partial jacobian (instead of inputs X)
-        return error, numpy.sum(partial_jacobians[0], axis=0), jacobians
+        numpy.sum(partial_jacobians[0], axis=0, out=bias_out)
+
+    def _partial_jacobians(self, error_jac, transfer_derivatives):
+        """Return derivative of error_jac, with regard to input of each transfer.
+
+        For each sample, in order from first to last layer.
+        """
+        # TODO: Add optimization for cross entropy and softmax output (just o - t)
+        # Derivative of error_vec w.r.t. output transfer
+        partial_jacobians = [
+            _dot_diag_or_matrix(error_jac, transfer_derivatives[-1])
+        ]
+        for weight_matrix, transfer_derivative in reversed(
+                zip(self._weight_matrices[1:], transfer_derivatives[:-1])):
+            partial_jacobians.append(
+                _dot_diag_or_matrix(partial_jacobians[-1].dot(weight_matrix.T),
+                                    transfer_derivative))
+        # Reverse so partial_jacobians[0] corresponds to d/dW_1
+        return list(reversed(partial_jacobians))
+
+    ######################################
+    # Pickle
+    ######################################
+    def __getstate__(self):
+        """Return state for pickle.
+
+        Views are not preserved by pickle, so they are re-made when unpickling.
+        """
+        state = self.__dict__.copy()
+        for name in ('_bias_vec', '_weight_matrices', '_bias_jacobian',
+                     '_weight_jacobians'):
+            del state[name]
+
+        # Process pool cannot be pickled, and is only used during train
+        state['_data_parallel'] = None
+        return state
+
+    def __setstate__(self, state):
+        """Set state from pickle."""
+        self.__dict__.update(state)
+        self._setup_parameter_views()
 
 
 def _dot_diag_or_matrix(tensor_a, tensor_b):
@@ -295,28 +505,29 @@ def _dot_diag_or_matrix(tensor_a, tensor_b):
         return numpy.einsum('ij,ijk->ik', tensor_a, tensor_b)
 
 
-def _mean_list_of_list_of_matrices(lol_matrices):
-    """Return mean of each matrix in list of lists of matrices."""
-    # Sum matrices
-    mean_matrices = lol_matrices[0]
-    for list_of_matrices in lol_matrices[1:]:
-        for i, matrix in enumerate(list_of_matrices):
-            mean_matrices[i] += matrix
+def _matrix_or_diag_dot(tensor_a, tensor_b):
+    """Dot either tensor_a of diagonals or full jacobian with tensor_b.
 
-    # Divide each by number of lists of matrices
-    for matrix in mean_matrices:
-        matrix /= len(lol_matrices)
+    Like _dot_diag_or_matrix, but multiplies each jacobian by each
+    row of tensor_b, instead of each row of tensor_b by each jacobian.
+    """
+    if tensor_a.shape == tensor_b.shape:  # tensor_a is only diagonals of transfer jacobian
+        return tensor_a * tensor_b
+    else:
+        # dot each jacobian in tensor_a with each row of tensor_b
+        return numpy.einsum('ijk,ik->ij', tensor_a, tensor_b)
 
-    # Return list of mean matrices
-    return mean_matrices
 
-def _flatten(bias_vec, weight_matrices):
-    """Flatten bias vector and weight matrices into flat vector."""
-    return numpy.hstack([bias_vec] + [matrix.ravel() for matrix in weight_matrices])
+def _num_parameters(shape):
+    """Return number of values in bias vector and all weight matrices."""
+    return shape[1] + sum([i * j for i, j in zip(shape[:-1], shape[1:])])
 
 
 def _unflatten_weights(flat_weights, shape):
-    """Unravel flat_weights into bias vector and weight matrices."""
+    """Unravel flat_weights into bias vector and weight matrices.
+
+    Returned vector and matrices are views of flat_weights.
+    """
     bias_vec = flat_weights[:shape[1]]
     matrices = []
     index = shape[1]
@@ -327,6 +538,24 @@ def _unflatten_weights(flat_weights, shape):
     return bias_vec, matrices
 
 
+def _unflatten_sample_weights(flat_weights, shape):
+    """Unravel each row of flat_weights into bias vectors and weight matrices.
+
+    Like _unflatten_weights, with an additional first axis for samples.
+    Returned matrices and tensors are views of flat_weights.
+    """
+    num_samples = flat_weights.shape[0]
+    bias_vecs = flat_weights[:, :shape[1]]
+    tensors = []
+    index = shape[1]
+    for i, j in zip(shape[:-1], shape[1:]):
+        tensors.append(flat_weights[:, index:index + (i * j)].reshape(
+            (num_samples, i, j)))
+        index += (i * j)
+
+    return bias_vecs, tensors
+
+
 class DropoutMLP(MLP):
     def __init__(self,
                  shape,
@@ -399,6 +628,9 @@ class DropoutMLP(MLP):
         # Disable hidden neurons
         self._disable_hiddens()
 
+        # Disabled neurons change the objective
+        self.evaluation_cache.clear()
+
         error = super(DropoutMLP, self).train_step(input_matrix, target_matrix)
 
         # No longer in training mode
@@ -26,14 +26,38 @@ import numpy
 
 from learning import calculate
 from learning import Model
-from learning import calculate
+
+# Max number of similarities held in memory at once by PBNN.activate
+MAX_BLOCK_ELEMENTS = 2**22
 
 
 class PBNN(Model):
+    """Probabilistic neural network, classifying by similarity to stored patterns.
+
+    Args:
+        variance: float; Variance of Gaussian similarity.
+        scale_by_similarity: bool; Whether or not to normalize by total similarity.
+        scale_by_class: bool; Whether or not to normalize by number of
+            stored patterns of each class.
+        block_size: Number of input rows activated at once, when activating
+            a matrix. Defaults to as many as fit in MAX_BLOCK_ELEMENTS
+            similarities.
+        num_prototypes: If given, training patterns of each class are condensed
+            to k-means centroids, about num_prototypes in total
+            (at least one per class), so activate cost does not grow
+            with dataset size. Each centroid is weighted by number of
+            patterns it replaces, keeping class totals.
+        kmeans_iterations: Max iterations of k-means, for num_prototypes.
+    """
+    supports_batch_activate = True
+
     def __init__(self,
                  variance=None,
                  scale_by_similarity=True,
-                 scale_by_class=True):
+                 scale_by_class=True,
+                 block_size=None,
+                 num_prototypes=None,
+                 kmeans_iterations=20):
         super(PBNN, self).__init__()
 
         if variance is None:
@@ -43,10 +67,15 @@ class PBNN(Model):
             self._variance = variance
         self._scale_by_class = scale_by_class
         self._scale_by_similarity = scale_by_similarity
+        self._block_size = block_size
+        self._num_prototypes = num_prototypes
+        self._kmeans_iterations = kmeans_iterations
 
         self._input_matrix = None  # Inputs stored when training
         self._target_matrix = None  # Targets stored when training
         self._target_totals = None  # Sum of rows in target matrix
+        self._input_sq_norms = None  # Squared norm of rows in input matrix
+        self._input_weights = None  # Patterns represented by each stored input
 
     def reset(self):
         """Reset this model."""
@@ -55,48 +84,147 @@ class PBNN(Model):
         self._input_matrix = None
         self._target_matrix = None
         self._target_totals = None
+        self._input_sq_norms = None
+        self._input_weights = None
 
     def activate(self, inputs):
-        """Return the model outputs for given inputs."""
-        # Calculate similarity between input and each stored input
+        """Return the model outputs for given inputs.
+
+        inputs can be a vector, or a matrix with an input vector in each row.
+        """
+        inputs = numpy.asarray(inputs, dtype='d')
+        if len(inputs.shape) == 1:
+            return self._activate_block(inputs[None, :])[0]
+
+        block_size = self._block_size
+        if block_size is None:
+            block_size = max(1, MAX_BLOCK_ELEMENTS // len(self._input_matrix))
+
+        return numpy.vstack([
+            self._activate_block(inputs[start:start + block_size])
+            for start in range(0, len(inputs), block_size)
+        ])
+
+    def _activate_block(self, input_matrix):
+        """Return matrix of outputs, one row for each row of input_matrix."""
+        # Calculate similarity between each input and each stored input
         # (gaussian of each distance)
-        similarities = calculate.gaussian(
-            _distances(inputs, self._input_matrix), self._variance)
+        similarities = numpy.exp(-calculate.squared_distances(
+            input_matrix, self._input_matrix, self._input_sq_norms) /
+                                 self._variance)
+        if self._input_weights is not None:
+            # Each prototype counts once for each pattern it replaces
+            similarities *= self._input_weights
+
         # Then scale each stored target by corresponding similarity, and sum
-        output_vec = _weighted_sum_rows(self._target_matrix, similarities)
+        output_matrix = _weighted_sum_rows(self._target_matrix, similarities)
 
         if self._scale_by_similarity:
-            output_vec /= numpy.sum(similarities)
+            output_matrix /= numpy.sum(similarities, axis=1, keepdims=True)
 
         if self._scale_by_class:
             # Scale output by number of classes (sum of targets)
             # This minimizes the effect of unbalanced classes
             # Return 0 when target total is 0
-            output_vec[:] = calculate.protvecdiv(output_vec,
-                                                 self._target_totals)
+            output_matrix *= calculate.protvecdiv(
+                numpy.ones(self._target_totals.shape), self._target_totals)
 
         # Convert output to probabilities, and return
-        output_vec /= sum(output_vec)
-        return output_vec
+        output_matrix /= numpy.sum(output_matrix, axis=1, keepdims=True)
+        return output_matrix
 
     def train(self, input_matrix, target_matrix, *args, **kwargs):
         # Store inputs to recall later
-        self._input_matrix = numpy.copy(input_matrix)
+        self._input_matrix = numpy.array(input_matrix, dtype='d')
 
         # Store targets to recall later
-        self._target_matrix = numpy.copy(target_matrix)
+        self._target_matrix = numpy.array(target_matrix, dtype='d')
 
         # Calculate target sum now, for efficiency
         self._target_totals = numpy.sum(self._target_matrix, axis=0)
 
-
-def _distances(x_vec, y_matrix):
-    """Return vector of distances between x_vec and each y_matrix row."""
-    diffs = x_vec - y_matrix
-    distances = [numpy.sqrt(d.dot(d)) for d in diffs]
-    return numpy.array(distances)
-
-
-def _weighted_sum_rows(x_matrix, scaling_vector):
-    """Return sum of rows in x_matrix, each row scaled by scalar in scaling_vector."""
-    return numpy.sum(x_matrix * scaling_vector[:, numpy.newaxis], axis=0)
+        # Replace stored patterns with fewer weighted prototypes
+        self._input_weights = None
+        if (self._num_prototypes is not None
+                and self._num_prototypes < len(self._input_matrix)):
+            (self._input_matrix, self._target_matrix,
+             self._input_weights) = _condense(
+                 self._input_matrix, self._target_matrix,
+                 self._num_prototypes, self._kmeans_iterations)
+
+        # Calculate input norms now, for efficiency
+        self._input_sq_norms = numpy.einsum(
+            'ij,ij->i', self._input_matrix, self._input_matrix)
+
+
+def _weighted_sum_rows(x_matrix, scaling_tensor):
+    """Return sum of rows in x_matrix, each row scaled by scalar in scaling_tensor.
+
+    If scaling_tensor is a matrix, return a sum for each row of scaling_tensor.
+    """
+    return numpy.dot(scaling_tensor, x_matrix)
+
+
+def _condense(input_matrix, target_matrix, num_prototypes, iterations):
+    """Return (prototype inputs, prototype targets, prototype weights).
+
+    Patterns of each class (unique target row) are replaced
+    by k-means centroids, with a share of num_prototypes proportional
+    to size of class. Each centroid is weighted by its number of patterns.
+    """
+    classes, labels = numpy.unique(target_matrix, axis=0, return_inverse=True)
+    class_sizes = numpy.bincount(labels)
+
+    # Largest remainder allocation of prototypes to classes,
+    # with at least one, and at most class size, for each class
+    shares = num_prototypes * class_sizes / float(len(labels))
+    allocations = numpy.floor(shares).astype(int)
+    remaining = num_prototypes - numpy.sum(allocations)
+    if remaining > 0:
+        allocations[numpy.argsort(allocations - shares)[:remaining]] += 1
+    allocations = numpy.clip(allocations, 1, class_sizes)
+
+    prototype_inputs = []
+    prototype_targets = []
+    prototype_weights = []
+    for class_, class_inputs, num_centroids in zip(
+            classes, [input_matrix[labels == i] for i in range(len(classes))],
+            allocations):
+        centroids, counts = _kmeans(class_inputs, num_centroids, iterations)
+        prototype_inputs.append(centroids)
+        prototype_targets.append(numpy.tile(class_, (len(centroids), 1)))
+        prototype_weights.append(counts)
+
+    return (numpy.vstack(prototype_inputs), numpy.vstack(prototype_targets),
+            numpy.concatenate(prototype_weights).astype('d'))
+
+
+def _kmeans(matrix, k, iterations):
+    """Return (centroids, number of rows nearest each centroid).
+
+    Centroids without rows are discarded.
+    """
+    # Start from k distinct rows
+    centroids = matrix[numpy.random.choice(len(matrix), k, replace=False)]
+    assignments = numpy.argmin(
+        calculate.squared_distances(matrix, centroids), axis=1)
+    for _ in range(iterations):
+        # Move each centroid to mean of its rows
+        # Sort rows by centroid, so rows of each centroid are contiguous
+        counts = numpy.bincount(assignments, minlength=k)
+        has_rows = counts > 0
+        starts = numpy.cumsum(counts) - counts
+        sums = numpy.add.reduceat(
+            matrix[numpy.argsort(assignments, kind='mergesort')],
+            starts[has_rows])
+        centroids[has_rows] = sums / counts[has_rows, None]
+
+        # Assign each row to nearest centroid, until assignments do not change
+        new_assignments = numpy.argmin(
+            calculate.squared_distances(matrix, centroids), axis=1)
+        if (new_assignments == assignments).all():
+            break
+        assignments = new_assignments
+
+    counts = numpy.bincount(assignments, minlength=k)
+    return centroids[counts > 0], counts[counts > 0]
@@ -87,9 +87,15 @@ class RBF(Model):
         self._variance = variance
 
         # Weight matrix and bias for output
+        # Bias vector and weight matrix are views into one flat parameter vector,
+        # and their jacobians are views into one flat jacobian vector.
+        # This lets optimizers work on parameters without flattening,
+        # and jacobians are calculated in place.
         self._shape = (num_clusters, num_outputs)
-        self._weight_matrix = self._random_weight_matrix(self._shape)
-        self._bias_vec = self._random_weight_matrix(self._shape[1])
+        self._parameters = self._random_weight_matrix(
+            num_outputs + num_clusters * num_outputs)
+        self._jacobian = numpy.zeros(self._parameters.shape)
+        self._setup_parameter_views()
 
         # Optimizer to optimize weight_matrix
         if optimizer is None:
@@ -106,6 +112,9 @@ class RBF(Model):
         # Convergence criteria
         self._jacobian_norm_break = jacobian_norm_break
 
+        # Re-use objective values and jacobians calculated during line searches
+        self.evaluation_cache = optimize.EvaluationCache()
+
         # Optional scaling output by total gaussian similarity
         self._scale_by_similarity = scale_by_similarity
 
@@ -118,23 +127,40 @@ class RBF(Model):
 
         self._clustering_model.reset()
         self._optimizer.reset()
+        self.evaluation_cache.reset()
 
-        self._weight_matrix = self._random_weight_matrix(
-            self._weight_matrix.shape)
-        self._bias_vec = self._random_weight_matrix(self._shape[1])
+        self._parameters[:] = self._random_weight_matrix(
+            self._parameters.shape)
+        self._setup_parameter_views()
 
         self._similarity_tensor = None
 
+    def _setup_parameter_views(self):
+        """Make bias vector and weight matrix (and jacobians) views of flat vectors."""
+        self._bias_vec, self._weight_matrix = _unflatten_weights(
+            self._parameters, self._shape)
+        self._bias_jacobian, self._weight_jacobian = _unflatten_weights(
+            self._jacobian, self._shape)
+
     def _random_weight_matrix(self, shape):
         """Return a random weight matrix."""
         # TODO: Random weight matrix should be a function user can pass in
         return (2 * numpy.random.random(shape) - 1) * INITIAL_WEIGHTS_RANGE
 
+    @property
+    def supports_batch_activate(self):
+        """Batch activation is supported if clustering_model supports it."""
+        return self._clustering_model.supports_batch_activate
+
     def activate(self, input_tensor):
         """Return the model outputs for given input_tensor."""
-        # Get distance to each cluster center, and apply gaussian for similarity
-        self._similarity_tensor = calculate.gaussian(
-            self._clustering_model.activate(input_tensor), self._variance)
+        # Get distance to each cluster center, and apply gaussian for similarity.
+        # Gaussian is applied in place, to avoid temporary tensors
+        # as large as the similarity tensor
+        self._similarity_tensor = numpy.square(
+            self._clustering_model.activate(input_tensor))
+        self._similarity_tensor /= -self._variance
+        numpy.exp(self._similarity_tensor, out=self._similarity_tensor)
 
         if self._scale_by_similarity:
             self._similarity_tensor /= numpy.sum(
@@ -162,16 +188,23 @@ class RBF(Model):
             # Update clusters
             self._clustering_model.train_step(input_matrix, target_matrix)
 
+            # New clusters change the objective
+            self.evaluation_cache.clear()
+
+        # Cached values are only valid for this dataset
+        self.evaluation_cache.check_objective(input_matrix, target_matrix)
+
         # Train RBF
         error, flat_weights = self._optimizer.next(
             Problem(
                 obj_func=
                 lambda xk: self._get_obj(xk, input_matrix, target_matrix),
                 obj_jac_func=
-                lambda xk: self._get_obj_jac(xk, input_matrix, target_matrix)),
-            _flatten_weights(self._weight_matrix, self._bias_vec))
-        self._bias_vec, self._weight_matrix = _unflatten_weights(
-            flat_weights, self._shape)
+                lambda xk: self._get_obj_jac(xk, input_matrix, target_matrix),
+                cache=self.evaluation_cache),
+            # Copy, because evaluating the objective writes to self._parameters
+            numpy.copy(self._parameters))
+        self._parameters[:] = flat_weights
 
         self.converged = self._optimizer.jacobian is not None and numpy.linalg.norm(
             self._optimizer.jacobian) < self._jacobian_norm_break
@@ -193,43 +226,66 @@ class RBF(Model):
         """
         # Reset optimizer, because problem may change on next train call
         self._optimizer.reset()
+        self.evaluation_cache.clear()
 
     ######################################
     # Helper functions for optimizer
     ######################################
     def _get_obj(self, parameter_vec, input_matrix, target_matrix):
         """Helper function for Optimizer to get objective value."""
-        self._bias_vec, self._weight_matrix = _unflatten_weights(parameter_vec, self._shape)
+        self._parameters[:] = parameter_vec
         return self._error_func(self.activate(input_matrix), target_matrix)
 
     def _get_obj_jac(self, parameter_vec, input_matrix, target_matrix):
-        """Helper function for Optimizer to get objective value and derivative."""
-        self._bias_vec, self._weight_matrix = _unflatten_weights(parameter_vec, self._shape)
-        error, weight_jacobian, bias_jacobian = self._get_jacobian(
-            input_matrix, target_matrix)
-        return error, _flatten_weights(weight_jacobian, bias_jacobian)
+        """Helper function for Optimizer to get objective value and derivative.
+
+        NOTE: Returned jacobian is overwritten by the next call.
+        """
+        self._parameters[:] = parameter_vec
+        error, _, _ = self._get_jacobian(input_matrix, target_matrix)
+
+        # Bias and weight jacobians are views of self._jacobian
+        return error, self._jacobian
 
     ######################################
     # Objective Derivative
     ######################################
     def _get_jacobian(self, input_matrix, target_matrix):
-        """Return jacobian and error for given dataset."""
+        """Return jacobian and error for given dataset.
+
+        Jacobians are calculated in place, in views of self._jacobian.
+        """
         output_matrix = self.activate(input_matrix)
 
         error, error_jac = self._error_func.derivative(output_matrix,
                                                        target_matrix)
 
-        weight_jacobian = self._similarity_tensor.T.dot(error_jac)
-        bias_jacobian = numpy.sum(error_jac, axis=0)
+        numpy.dot(self._similarity_tensor.T, error_jac,
+                  out=self._weight_jacobian)
+        numpy.sum(error_jac, axis=0, out=self._bias_jacobian)
 
-        return error, weight_jacobian, bias_jacobian
+        return error, self._weight_jacobian, self._bias_jacobian
 
+    ######################################
+    # Pickle
+    ######################################
+    def __getstate__(self):
+        """Return state for pickle.
+
+        Views are not preserved by pickle, so they are re-made when unpickling.
+        """
+        state = self.__dict__.copy()
+        for name in ('_bias_vec', '_weight_matrix', '_bias_jacobian',
+                     '_weight_jacobian'):
+            del state[name]
+        return state
 
-def _flatten_weights(weight_matrix, bias_vec):
-    """Return flat vector of model parameters."""
-    return numpy.hstack([bias_vec, weight_matrix.ravel()])
+    def __setstate__(self, state):
+        """Set state from pickle."""
+        self.__dict__.update(state)
+        self._setup_parameter_views()
 
 
 def _unflatten_weights(flat_weights, shape):
-    """Set model parameters from flat vector."""
+    """Return bias vector and weight matrix, as views of flat_weights."""
     return flat_weights[:shape[1]], flat_weights[shape[1]:].reshape(shape)
@@ -26,11 +26,16 @@ import operator
 
 import numpy
 
-from learning import calculate, optimize, Model, MeanSquaredError
+from learning import (calculate, optimize, Model, MeanSquaredError,
+                      BinaryCrossEntropyError, L1Penalty)
 from learning.optimize import Problem
 
 INITIAL_WEIGHTS_RANGE = 0.25
 
+# With more weights, LogisticRegressionModel uses NewtonCG instead of Newton,
+# because Newton factors the full hessian, taking O(n^3) time and O(n^2) memory
+NEWTON_MAX_PARAMETERS = 2000
+
 
 class RegressionModel(Model):
     """A model that optimizes the weight matrix of an equation of a set form.
@@ -40,10 +45,14 @@ class RegressionModel(Model):
         num_outputs: int; Number of output values in dataset.
             If onehot vector, this should equal the number of classes.
         optimizer: Instance of learning.optimize.optimizer.Optimizer.
+            Defaults to FISTA for L1Penalty,
+            because L1Penalty has no derivative at 0.
         error_func: Instance of learning.error.ErrorFunc.
+        penalty_func: Instance of learning.error.PenaltyFunc.
         jacobian_norm_break: Training will end if objective gradient norm
             is less than this value.
     """
+    supports_batch_activate = True
 
     def __init__(self,
                  attributes,
@@ -58,10 +67,17 @@ class RegressionModel(Model):
         self._weight_matrix = self._random_weight_matrix(
             self._weights_shape(attributes, num_outputs))
 
+        # Jacobian is calculated in place, to avoid allocating every evaluation
+        self._jacobian = numpy.zeros(self._weight_matrix.shape)
+
         # Optimizer to optimize weight_matrix
         if optimizer is None:
-            optimizer = optimize.make_optimizer(
-                reduce(operator.mul, self._weight_matrix.shape))
+            if isinstance(penalty_func, L1Penalty):
+                # Proximal gradient gives exact 0 weights
+                optimizer = optimize.FISTA()
+            else:
+                optimizer = optimize.make_optimizer(
+                    reduce(operator.mul, self._weight_matrix.shape))
 
         self._optimizer = optimizer
 
@@ -76,6 +92,9 @@ class RegressionModel(Model):
         # Convergence criteria
         self._jacobian_norm_break = jacobian_norm_break
 
+        # Re-use objective values and jacobians calculated during line searches
+        self.evaluation_cache = optimize.EvaluationCache()
+
     def reset(self):
         """Reset this model."""
         super(RegressionModel, self).reset()
@@ -86,6 +105,7 @@ class RegressionModel(Model):
 
         # Reset the optimizer
         self._optimizer.reset()
+        self.evaluation_cache.reset()
 
     def _random_weight_matrix(self, shape):
         """Return a random weight matrix."""
@@ -106,15 +126,28 @@ class RegressionModel(Model):
         Optional.
         Model must either override train_step or implement _train_increment.
         """
+        # Cached values are only valid for this dataset
+        self.evaluation_cache.check_objective(input_matrix, target_matrix)
+
         # Use an Optimizer to move weights in a direction that minimizes
         # error (as defined by given error function).
-        error, flat_weights = self._optimizer.next(
-            Problem(
+        if self._optimizer.uses_prox and self._penalty_func is not None:
+            problem = self._get_prox_problem(input_matrix, target_matrix)
+        else:
+            problem = Problem(
                 obj_func=
                 lambda xk: self._get_obj(xk, input_matrix, target_matrix),
                 obj_jac_func=
-                lambda xk: self._get_obj_jac(xk, input_matrix, target_matrix)),
-            self._weight_matrix.ravel())
+                lambda xk: self._get_obj_jac(xk, input_matrix, target_matrix),
+                hess_func=
+                lambda xk: self._get_hessian(xk, input_matrix, target_matrix),
+                hess_vec_func=
+                lambda xk, vec: self._get_hess_vec(xk, vec, input_matrix, target_matrix),
+                residual_jac_func=
+                lambda xk: self._get_residual_jacobian(xk, input_matrix, target_matrix),
+                cache=self.evaluation_cache)
+        error, flat_weights = self._optimizer.next(
+            problem, self._weight_matrix.ravel())
         self._weight_matrix = flat_weights.reshape(self._weight_matrix.shape)
 
         # TODO: Numerical Optimization uses ||grad_f_k||_inf < 10^-5 (1 + |f_k|) as a stopping criteria
@@ -130,6 +163,7 @@ class RegressionModel(Model):
         """
         # Reset optimizer, because problem may change on next train call
         self._optimizer.reset()
+        self.evaluation_cache.clear()
 
     ######################################
     # Helper functions for optimizer
@@ -140,12 +174,156 @@ class RegressionModel(Model):
         return self._get_objective_value(input_matrix, target_matrix)
 
     def _get_obj_jac(self, parameter_vec, input_matrix, target_matrix):
-        """Helper function for Optimizer to get objective value and derivative."""
+        """Helper function for Optimizer to get objective value and derivative.
+
+        NOTE: Returned jacobian is overwritten by the next call.
+        """
         self._weight_matrix = parameter_vec.reshape(self._weight_matrix.shape)
         error, jacobian = self._get_error_jacobian_with_penalty(
             input_matrix, target_matrix)
+
+        # Contiguous, so ravel does not copy
+        return error, jacobian.ravel()
+
+    def _get_prox_problem(self, input_matrix, target_matrix):
+        """Return Problem for proximal optimizers.
+
+        Objective and jacobian exclude weight penalty,
+        which is given by its proximal operator instead.
+        """
+        return Problem(
+            obj_func=
+            lambda xk: self._get_error(xk, input_matrix, target_matrix),
+            obj_jac_func=
+            lambda xk: self._get_error_jac(xk, input_matrix, target_matrix),
+            prox_func=self._penalty_func.proximal,
+            nonsmooth_obj_func=self._penalty_func,
+            cache=self.evaluation_cache)
+
+    def _get_error(self, parameter_vec, input_matrix, target_matrix):
+        """Helper function for Optimizer to get error, without weight penalty."""
+        self._weight_matrix = parameter_vec.reshape(self._weight_matrix.shape)
+        return self._error_func(self.activate(input_matrix), target_matrix)
+
+    def _get_error_jac(self, parameter_vec, input_matrix, target_matrix):
+        """Helper function for Optimizer to get error and derivative, without weight penalty.
+
+        NOTE: Returned jacobian is overwritten by the next call.
+        """
+        self._weight_matrix = parameter_vec.reshape(self._weight_matrix.shape)
+        error, jacobian = self._get_error_jacobian(input_matrix, target_matrix)
+
+        # Contiguous, so ravel does not copy
         return error, jacobian.ravel()
 
+    def _get_hess_vec(self, parameter_vec, direction_vec, input_matrix,
+                      target_matrix):
+        """Helper function for Optimizer to get hessian vector product.
+
+        Hessian is X^T C X, for each output,
+        where X is input_matrix with a bias column,
+        and C is diagonal, given by _output_curvature.
+        """
+        self._weight_matrix = parameter_vec.reshape(self._weight_matrix.shape)
+        direction_matrix = direction_vec.reshape(self._weight_matrix.shape)
+
+        # C X v
+        curvature_dot = self._output_curvature(input_matrix, target_matrix) * (
+            direction_matrix[0] + numpy.dot(input_matrix, direction_matrix[1:]))
+
+        # X^T C X v
+        hess_vec = numpy.empty(self._weight_matrix.shape)
+        hess_vec[0] = numpy.sum(curvature_dot, axis=0)
+        hess_vec[1:] = numpy.dot(input_matrix.T, curvature_dot)
+        hess_vec = hess_vec.ravel()
+
+        # Add weight penalty
+        if self._penalty_func is not None:
+            # NOTE: We ravel the weight matrix, to take vector norm
+            hess_vec += self._penalty_func.hessian_vector_product(
+                self._weight_matrix.ravel(), direction_vec)
+
+        return hess_vec
+
+    def _get_hessian(self, parameter_vec, input_matrix, target_matrix):
+        """Helper function for Optimizer to get hessian.
+
+        Like _get_hess_vec, but returns full hessian.
+        Output k only depends on column k of weight matrix,
+        so hessian is zero between weights of different outputs.
+        """
+        self._weight_matrix = parameter_vec.reshape(self._weight_matrix.shape)
+        num_weights, num_outputs = self._weight_matrix.shape
+
+        # X^T C_k X, for each output k
+        biased_inputs = _biased_inputs(input_matrix)
+        output_hessians = numpy.einsum(
+            'sa,sk,sb->kab', biased_inputs,
+            self._output_curvature(input_matrix, target_matrix),
+            biased_inputs)
+
+        # Weights are raveled by row, so weight (a, k) has index a*K + k
+        hessian = numpy.zeros((num_weights, num_outputs, num_weights,
+                               num_outputs))
+        for k, output_hessian in enumerate(output_hessians):
+            hessian[:, k, :, k] = output_hessian
+        hessian = hessian.reshape((self._weight_matrix.size,
+                                   self._weight_matrix.size))
+
+        # Add weight penalty, one column at a time
+        if self._penalty_func is not None:
+            flat_weights = self._weight_matrix.ravel()
+            for i, unit_vec in enumerate(numpy.identity(flat_weights.size)):
+                hessian[:, i] += self._penalty_func.hessian_vector_product(
+                    flat_weights, unit_vec)
+
+        return hessian
+
+    def _output_curvature(self, input_matrix, target_matrix):
+        """Return second derivative of error, for each sample and output.
+
+        With regard to W x, for equations of the form f(W x).
+        Gauss-Newton approximation, f'(W x)^2 e''(f(W x)),
+        which is exact when f is linear.
+        Error functions are assumed to have diagonal hessians.
+        """
+        output_matrix = self.activate(input_matrix)
+        # e'' is diagonal, so H_e 1 is its diagonal
+        error_hess_diag = self._error_func.hessian_vector_product(
+            output_matrix, target_matrix, numpy.ones(output_matrix.shape))
+        return self._equation_output_derivative(input_matrix)**2 * error_hess_diag
+
+    def _get_residual_jacobian(self, parameter_vec, input_matrix,
+                               target_matrix):
+        """Helper function for Optimizer to get jacobian of residuals.
+
+        Only defined for MeanSquaredError without penalty,
+        where error is ||r||^2, with residuals r = (f(X) - Y) / sqrt(n).
+        Returns None otherwise.
+
+        Each row is the derivative of one residual, with regard to weights.
+        Rows are ordered by sample, then output.
+        """
+        if (not isinstance(self._error_func, MeanSquaredError)
+                or self._penalty_func is not None):
+            return None
+
+        self._weight_matrix = parameter_vec.reshape(self._weight_matrix.shape)
+
+        # Output k only depends on column k of weight matrix
+        # d f(X)_{s,k} / dW_{a,l} = f'_{s,k} [1 X]_{s,a} I_{k,l}
+        num_samples = input_matrix.shape[0]
+        num_outputs = self._weight_matrix.shape[1]
+        residual_jacobian = numpy.einsum(
+            'sk,sa,kl->skal',
+            self._equation_output_derivative(input_matrix),
+            _biased_inputs(input_matrix), numpy.identity(num_outputs))
+
+        # Residuals are scaled by 1 / sqrt(n), for mean
+        residual_jacobian /= numpy.sqrt(num_samples * num_outputs)
+        return residual_jacobian.reshape((num_samples * num_outputs,
+                                          self._weight_matrix.size))
+
     ######################################
     # Objective Value
     ######################################
@@ -192,7 +370,8 @@ class RegressionModel(Model):
                 'target_matrix.shape does not match output_matrix.shape')
 
         error, error_jac = self._error_func.derivative(output_matrix, target_matrix)
-        jacobian = self._error_equation_derivative(input_matrix, error_jac)
+        jacobian = self._error_equation_derivative(input_matrix, error_jac,
+                                                   self._jacobian)
 
         assert reduce(operator.mul, jacobian.shape) == reduce(
             operator.mul, self._weight_matrix.shape)
@@ -207,16 +386,121 @@ class RegressionModel(Model):
         """Return the output of this models equation."""
         raise NotImplementedError()
 
-    def _error_equation_derivative(self, input_matrix, error_jac):
+    def _error_equation_derivative(self, input_matrix, error_jac, out):
         """Return the jacobian of this models equation corresponding to the given error.
 
         Derivative with regard to weights.
+        Jacobian is calculated in place, in out, which has the shape of the weight matrix.
+        """
+        raise NotImplementedError()
+
+    def _equation_output_derivative(self, input_matrix):
+        """Return derivative of output function of this models equation.
+
+        For equations of the form f(W x), with regard to W x.
         """
         raise NotImplementedError()
 
 
 class LinearRegressionModel(RegressionModel):
-    r"""Regression model with an equation of the form: f(\vec{x}) = W \vec{x}."""
+    r"""Regression model with an equation of the form: f(\vec{x}) = W \vec{x}.
+
+    With MeanSquaredError and no penalty, weights can also be found directly,
+    without iterative training, with solve or solve_chunks.
+    """
+
+    def solve(self, input_matrix, target_matrix, method='cholesky'):
+        """Set weights to the least squares solution for the given dataset.
+
+        Args:
+            input_matrix: A matrix with samples in rows and attributes in columns.
+            target_matrix: A matrix with samples in rows and target values in columns.
+            method: 'cholesky' to solve the normal equations,
+                X^T X W = X^T Y, with a cholesky factorization.
+                Fastest, but less accurate for ill-conditioned X.
+                Falls back to 'lstsq' if X^T X is singular.
+                'lstsq' to solve X W = Y with numpy.linalg.lstsq.
+
+        Returns:
+            Mean squared error on the given dataset.
+        """
+        self._check_solvable()
+        if method == 'cholesky':
+            return self._solve_normal_equations(
+                *_least_squares_statistics(input_matrix, target_matrix))
+        elif method == 'lstsq':
+            self._set_solved_weights(
+                _lstsq(_biased_inputs(input_matrix), target_matrix))
+            return self._get_objective_value(input_matrix, target_matrix)
+        else:
+            raise ValueError('Invalid method: %s' % method)
+
+    def solve_chunks(self, chunks):
+        """Set weights to the least squares solution, over all given chunks.
+
+        Each chunk is only used once, to accumulate X^T X and X^T Y,
+        so the full dataset never needs to be in memory.
+
+        Args:
+            chunks: Iterable of (input_matrix, target_matrix) tuples,
+                such as a generator reading a large dataset from disk.
+
+        Returns:
+            Mean squared error over all chunks.
+        """
+        self._check_solvable()
+
+        statistics = None
+        for input_matrix, target_matrix in chunks:
+            chunk_statistics = _least_squares_statistics(
+                input_matrix, target_matrix)
+            if statistics is None:
+                statistics = chunk_statistics
+            else:
+                statistics = [
+                    total + chunk
+                    for total, chunk in zip(statistics, chunk_statistics)
+                ]
+
+        if statistics is None:
+            raise ValueError('chunks must contain at least one chunk')
+        return self._solve_normal_equations(*statistics)
+
+    def _check_solvable(self):
+        """Raise ValueError if weights cannot be found with least squares."""
+        if not isinstance(self._error_func, MeanSquaredError):
+            raise ValueError('Direct solve requires MeanSquaredError')
+        if self._penalty_func is not None:
+            raise ValueError('Direct solve does not support penalty_func')
+
+    def _solve_normal_equations(self, gram_matrix, input_target_matrix,
+                                target_sum_squares, num_values):
+        """Set weights from X^T X W = X^T Y, and return mean squared error."""
+        try:
+            lower = numpy.linalg.cholesky(gram_matrix)
+            weight_matrix = numpy.linalg.solve(
+                lower.T, numpy.linalg.solve(lower, input_target_matrix))
+        except numpy.linalg.LinAlgError:
+            # X^T X is singular, use minimum norm solution
+            weight_matrix = _lstsq(gram_matrix, input_target_matrix)
+        self._set_solved_weights(weight_matrix)
+
+        # ||X W - Y||^2 = Y^T Y - 2 W^T X^T Y + W^T X^T X W,
+        # so error does not need another pass over the dataset
+        sum_squares = (
+            target_sum_squares -
+            2.0 * numpy.sum(weight_matrix * input_target_matrix) + numpy.sum(
+                weight_matrix * gram_matrix.dot(weight_matrix)))
+        # Rounding can make a perfect fit slightly negative
+        return max(sum_squares, 0.0) / num_values
+
+    def _set_solved_weights(self, weight_matrix):
+        """Set weight matrix, found without the optimizer."""
+        self._weight_matrix = weight_matrix
+        self.converged = True
+
+        # Optimizer state does not apply to new weights
+        self._optimizer.reset()
 
     def _weights_shape(self, attributes, num_outputs):
         """Return shape of this models weight matrix."""
@@ -229,22 +513,28 @@ class LinearRegressionModel(RegressionModel):
         return self._weight_matrix[0] + numpy.dot(input_tensor,
                                                   self._weight_matrix[1:])
 
-    def _error_equation_derivative(self, input_matrix, error_jac):
+    def _error_equation_derivative(self, input_matrix, error_jac, out):
         """Return the jacobian of this models equation corresponding to the given error.
 
         Derivative with regard to weights.
+        Jacobian is calculated in place, in out, which has the shape of the weight matrix.
+        """
+        # Bias
+        numpy.sum(error_jac, axis=0, out=out[0])
+        # Weight matrix
+        numpy.dot(input_matrix.T, error_jac, out=out[1:])
+        return out
+
+    def _equation_output_derivative(self, input_matrix):
+        """Return derivative of output function of this models equation.
+
+        For equations of the form f(W x), with regard to W x.
         """
-        return numpy.vstack((
-            # Bias
-            numpy.sum(error_jac, axis=0),
-            # Weight matrix
-            input_matrix.T.dot(error_jac)
-        ))
+        # Output function is identity
+        return numpy.ones((input_matrix.shape[0], self._weight_matrix.shape[1]))
 
 
-# TODO: Logistic regression is expected to be paried with a specific
-# error function, which should be implemented and set as the default
-# error function.
+# Logistic regression is paired with the log likelihood,
 # L(W) = prod_i (y_i^{t_i} (1 - y_i)^{1 - t_i})
 # maximize_W L(W)
 # where, y_i is the model output for sample i, and t_i is the target of sample i
@@ -252,8 +542,47 @@ class LinearRegressionModel(RegressionModel):
 # Log likelihood is often used instead, maximize N^{-1} log(L(W))
 # Also, note that this is given as a maximization problem,
 # and should be implemented as -N^{-1} log(L(W)), so it is a minimization problem
+# (BinaryCrossEntropyError)
 class LogisticRegressionModel(RegressionModel):
-    r"""Regression model with an equation of the form: f(\vec{x}) = 1 / (1 + e^{- W \vec{x}})."""
+    r"""Regression model with an equation of the form: f(\vec{x}) = 1 / (1 + e^{- W \vec{x}}).
+
+    Defaults to error_func=BinaryCrossEntropyError(), trained with
+    optimize.Newton, which is iteratively reweighted least squares (IRLS).
+    With more than NEWTON_MAX_PARAMETERS weights, optimize.NewtonCG,
+    a matrix-free variant, is used instead.
+    Other error functions default to the optimizer of RegressionModel.
+
+    jacobian_norm_break defaults to 1e-8, because Newton steps on smaller
+    gradients change log loss by less than rounding error,
+    so the line search cannot make further progress.
+    """
+
+    def __init__(self,
+                 attributes,
+                 num_outputs,
+                 optimizer=None,
+                 error_func=None,
+                 penalty_func=None,
+                 jacobian_norm_break=1e-8):
+        if error_func is None:
+            error_func = BinaryCrossEntropyError()
+
+        if (optimizer is None
+                and isinstance(error_func, BinaryCrossEntropyError)
+                and not isinstance(penalty_func, L1Penalty)):
+            # Newton with exact hessian X^T S X is IRLS
+            if (attributes + 1) * num_outputs > NEWTON_MAX_PARAMETERS:
+                optimizer = optimize.NewtonCG()
+            else:
+                optimizer = optimize.Newton()
+
+        super(LogisticRegressionModel, self).__init__(
+            attributes,
+            num_outputs,
+            optimizer=optimizer,
+            error_func=error_func,
+            penalty_func=penalty_func,
+            jacobian_norm_break=jacobian_norm_break)
 
     def _weights_shape(self, attributes, num_outputs):
         """Return shape of this models weight matrix."""
@@ -268,10 +597,11 @@ class LogisticRegressionModel(RegressionModel):
         return calculate.logit(self._weight_matrix[0] + numpy.dot(
             input_tensor, self._weight_matrix[1:]))
 
-    def _error_equation_derivative(self, input_matrix, error_jac):
+    def _error_equation_derivative(self, input_matrix, error_jac, out):
         """Return the jacobian of this models equation corresponding to the given error.
 
         Derivative with regard to weights.
+        Jacobian is calculated in place, in out, which has the shape of the weight matrix.
         """
         # f = _equation_output
         # e = error_func
@@ -282,9 +612,70 @@ class LogisticRegressionModel(RegressionModel):
             self._weight_matrix[0] + numpy.dot(
                 input_matrix, self._weight_matrix[1:])) * error_jac
 
-        return numpy.vstack((
-            # Bias: de(f)/db = (d/db b)^T f'(X W + b) e'(f(X W + b)),
-            # where d/db b = vector of ones
-            numpy.sum(equation_derivative_times_error_jac, axis=0),
-            # Weight matrix: de(f)/dW = X^T f'(X W + b) e'(f(X W + b))
-            input_matrix.T.dot(equation_derivative_times_error_jac)))
+        # Bias: de(f)/db = (d/db b)^T f'(X W + b) e'(f(X W + b)),
+        # where d/db b = vector of ones
+        numpy.sum(equation_derivative_times_error_jac, axis=0, out=out[0])
+        # Weight matrix: de(f)/dW = X^T f'(X W + b) e'(f(X W + b))
+        numpy.dot(
+            input_matrix.T, equation_derivative_times_error_jac, out=out[1:])
+        return out
+
+    def _equation_output_derivative(self, input_matrix):
+        """Return derivative of output function of this models equation.
+
+        For equations of the form f(W x), with regard to W x.
+        """
+        return calculate.dlogit(self._weight_matrix[0] + numpy.dot(
+            input_matrix, self._weight_matrix[1:]))
+
+    def _output_curvature(self, input_matrix, target_matrix):
+        """Return second derivative of error, for each sample and output.
+
+        With regard to W x, for equations of the form f(W x).
+        Exact for BinaryCrossEntropyError, where it is y (1 - y) / n,
+        giving the IRLS hessian X^T S X.
+        """
+        if isinstance(self._error_func, BinaryCrossEntropyError):
+            output_matrix = self.activate(input_matrix)
+            return output_matrix * (1.0 - output_matrix) / output_matrix.size
+        return super(LogisticRegressionModel, self)._output_curvature(
+            input_matrix, target_matrix)
+
+
+def _biased_inputs(input_matrix):
+    """Return input_matrix, with a column of ones for bias."""
+    return numpy.hstack([numpy.ones((input_matrix.shape[0], 1)), input_matrix])
+
+
+def _lstsq(a_matrix, b_matrix):
+    """Return minimum norm solution of a_matrix x = b_matrix.
+
+    rcond is given explicitly, because rcond=None needs numpy >= 1.14.
+    It matches the default of newer numpy.
+    """
+    rcond = numpy.finfo(float).eps * max(a_matrix.shape)
+    return numpy.linalg.lstsq(a_matrix, b_matrix, rcond=rcond)[0]
+
+
+def _least_squares_statistics(input_matrix, target_matrix):
+    """Return sufficient statistics for least squares on given dataset.
+
+    X^T X and X^T Y, where X is input_matrix with a bias column,
+    sum of squared targets, and number of target values.
+    """
+    num_samples, num_attributes = input_matrix.shape
+
+    # Build in blocks, to avoid copying input_matrix with a bias column
+    gram_matrix = numpy.empty((num_attributes + 1, num_attributes + 1))
+    gram_matrix[0, 0] = num_samples
+    gram_matrix[0, 1:] = numpy.sum(input_matrix, axis=0)
+    gram_matrix[1:, 0] = gram_matrix[0, 1:]
+    gram_matrix[1:, 1:] = numpy.dot(input_matrix.T, input_matrix)
+
+    input_target_matrix = numpy.empty((num_attributes + 1,
+                                       target_matrix.shape[1]))
+    input_target_matrix[0] = numpy.sum(target_matrix, axis=0)
+    input_target_matrix[1:] = numpy.dot(input_matrix.T, target_matrix)
+
+    return (gram_matrix, input_target_matrix, numpy.sum(target_matrix**2),
+            target_matrix.size)
@@ -22,6 +22,7 @@
 # SOFTWARE.
 ###############################################################################
 
+import math
 import operator
 
 import numpy
@@ -29,25 +30,82 @@ import numpy
 from learning import Model
 from learning import calculate
 
+# Number of input rows in each block of distance calculation,
+# when activating a matrix
+BLOCK_SIZE = 1024
+
 
 class SOM(Model):
+    """Self organizing map, with neurons on a lattice.
+
+    Args:
+        attributes: int; Number of attributes in dataset.
+        neurons: int; Number of neurons.
+        move_rate: Rate that winning neuron moves towards each input,
+            when training incrementally.
+        neighborhood: Neurons within this distance of the winner,
+            on the lattice, also move.
+        neighbor_move_rate: Variance of gaussian that scales movement
+            of neighbors, by distance from winner on the lattice.
+        initial_weights_range: Weights are initialized in
+            [-initial_weights_range, initial_weights_range].
+        batch: If True, each train_step moves every neuron at once,
+            to mean of inputs won by it and its neighbors,
+            weighted by neighborhood. Otherwise,
+            neurons move towards one input at a time.
+        topology: Lattice of neurons. 'line' is a chain of neurons.
+            'rect' is a grid, where each neuron has 4 nearest neighbors.
+            'hex' is a grid with odd rows offset by half a neuron,
+            where each neuron has 6 nearest neighbors.
+        grid_shape: (rows, columns) of 'rect' or 'hex' lattice.
+            Defaults to the most square shape with given number of neurons.
+        decay_steps: If given, move_rate, neighborhood and width of
+            neighborhood gaussian shrink by exp(-step / decay_steps),
+            where step is number of calls to train_step since reset.
+    """
+    supports_batch_activate = True
+
     def __init__(self,
                  attributes,
                  neurons,
                  move_rate=0.1,
                  neighborhood=2,
                  neighbor_move_rate=1.0,
-                 initial_weights_range=1.0):
+                 initial_weights_range=1.0,
+                 batch=False,
+                 topology='line',
+                 grid_shape=None,
+                 decay_steps=None):
         super(SOM, self).__init__()
 
         self.move_rate = move_rate
         self.neighborhood = neighborhood
         self.neighbor_move_rate = neighbor_move_rate
         self.initial_weights_range = initial_weights_range
+        self.batch = batch
+        self.decay_steps = decay_steps
+
+        # Distance between each pair of neurons on the lattice,
+        # for neighborhood kernel
+        positions = _lattice_positions(neurons, topology, grid_shape)
+        self._lattice_distances = calculate.distance(positions[:, None, :],
+                                                     positions)
+        # Sorted distinct lattice distances, so neighborhood masks
+        # only change when neighborhood crosses one of them
+        self._distance_levels = numpy.unique(self._lattice_distances)
+
+        # Cached neighborhood kernel, and the parameters it was made with
+        self._neighborhood_kernel = None
+        self._neighborhood_kernel_params = None
+        # Indices of neurons within neighborhood of each winner,
+        # and number of distance levels they were found with
+        self._neighbor_indices = None
+        self._num_neighbor_levels = None
 
         self._size = (neurons, attributes)
         self._weights = numpy.zeros(self._size)
         self._distances = numpy.zeros(neurons)
+        self._step = 0
 
         self.reset()
 
@@ -55,13 +113,24 @@ class SOM(Model):
         """Reset this model."""
         super(SOM, self).reset()
 
+        self._step = 0
+
         # Randomize weights, between -1 and 1
         self._weights = (2 * numpy.random.random(self._size) - 1
                          ) * self.initial_weights_range
         self._distances = numpy.zeros(self._size)
 
-    def activate(self, input_tensor):
-        """Return the model outputs for given input_tensor."""
+    def activate(self, input_tensor, out=None):
+        """Return the model outputs for given input_tensor.
+
+        Output is distance from each input to each neuron.
+
+        Args:
+            input_tensor: Input vector, or matrix with an input vector in each row.
+            out: Optional C contiguous float array to store distances in,
+                with one element for each neuron, or a row for each input.
+                Avoids allocating a new array for every activation.
+        """
         if not isinstance(input_tensor, numpy.ndarray):
             input_tensor = numpy.array(input_tensor)
 
@@ -70,31 +139,86 @@ class SOM(Model):
             # Dot each row of diffs with itself (a.k.a. numpy.sum(diffs**2, axis=-1))
             # Then sqrt result
             self._distances = numpy.sqrt(
-                numpy.einsum('ij,ij->i', diff_matrix, diff_matrix))
+                numpy.einsum('ij,ij->i', diff_matrix, diff_matrix), out=out)
         elif len(input_tensor.shape) == 2:
-            # Reshape input_tensor to obtain the difference between
-            # each row of input_tensor and self._weights
-            diff_tensor = input_tensor.reshape(input_tensor.shape[0], 1,
-                                         input_tensor.shape[1]) - self._weights
-            # Dot each row of diffs with itself (a.k.a. numpy.sum(diffs**2, axis=-1))
-            # Then sqrt result
-            # For each difference matrix in diff_tensor
-            self._distances = numpy.sqrt(
-                numpy.einsum('ijk,ijk->ij', diff_tensor, diff_tensor))
+            if out is None:
+                out = numpy.empty((input_tensor.shape[0], self._size[0]))
+
+            # Expand ||x - w||^2 into ||x||^2 - 2 x.w + ||w||^2,
+            # so memory is only needed for distances, not every x - w.
+            # Blocks of rows keep intermediate products small
+            weight_sq_norms = numpy.einsum('ij,ij->i', self._weights,
+                                           self._weights)
+            for start in range(0, input_tensor.shape[0], BLOCK_SIZE):
+                stop = start + BLOCK_SIZE
+                calculate.squared_distances(
+                    input_tensor[start:stop], self._weights, weight_sq_norms,
+                    out=out[start:stop])
+            self._distances = numpy.sqrt(out, out=out)
         else:
             raise ValueError('Invalid shape of input_tensor.')
 
         return self._distances
 
+    def train_step(self, input_matrix, target_matrix):
+        """Adjust the model towards the targets for given inputs.
+
+        Train on a mini-batch.
+
+        Optional.
+        Model must either override train_step or implement _train_increment.
+        """
+        if self.batch:
+            error = self._batch_train_step(input_matrix)
+        else:
+            error = super(SOM, self).train_step(input_matrix, target_matrix)
+
+        # Advance decay schedule
+        self._step += 1
+        return error
+
+    def _batch_train_step(self, input_matrix):
+        """Move every neuron to neighborhood weighted mean of its inputs.
+
+        Returns:
+            Quantization error, mean distance from each input to its
+                closest neuron, before neurons move.
+        """
+        input_matrix = numpy.asarray(input_matrix, dtype='d')
+
+        # Perform a competition for every input at once
+        squared_distances = calculate.squared_distances(
+            input_matrix, self._weights)
+        closest = numpy.argmin(squared_distances, axis=1)
+        min_squared_distances = squared_distances[numpy.arange(
+            len(closest)), closest]
+
+        # Sum and count inputs won by each neuron
+        num_neurons = self._size[0]
+        win_counts = numpy.bincount(closest, minlength=num_neurons)
+        win_sums = numpy.array([
+            numpy.bincount(closest, weights=column, minlength=num_neurons)
+            for column in input_matrix.T
+        ]).T
+
+        # Spread sums and counts to neighbors, weighted by neighborhood,
+        # and move each neuron to its weighted mean
+        kernel = self._get_neighborhood_kernel()
+        weighted_sums = numpy.dot(kernel, win_sums)
+        weighted_counts = numpy.dot(kernel, win_counts)
+        moved = weighted_counts > 0
+        self._weights[moved] = (
+            weighted_sums[moved] / weighted_counts[moved, None])
+
+        # Rounding can make squared distances slightly negative
+        return numpy.mean(numpy.sqrt(numpy.maximum(min_squared_distances, 0.0)))
+
     def _train_increment(self, input_vec, target_vec):
         """Train on a single input, target pair.
 
         Optional.
         Model must either override train_step or implement _train_increment.
         """
-        # TODO (maybe): Train on bath of input_matrix target_matrix,
-        # instead of one vector at a time.
-        # This will change the behavior of training, but will be more efficient.
         self.activate(input_vec)
         self._move_neurons(input_vec)
 
@@ -104,12 +228,80 @@ class SOM(Model):
 
         # Move the winner and neighbors closer
         # The further the neighbor, the less it should move
-        for i in range(closest - self.neighborhood,
-                       closest + self.neighborhood + 1):
-            if i >= 0 and i < self._size[0]:  # if in range
-                neighbor_distance = float(abs(i - closest))
-                move_rate_modifier = calculate.gaussian(
-                    neighbor_distance, self.neighbor_move_rate)
-                final_rate = move_rate_modifier * self.move_rate
-
-                self._weights[i] += final_rate * (input_vec - self._weights[i])
+        neighbors = self._get_neighbor_indices()[closest]
+        decay = self._decay()
+        final_rates = decay * self.move_rate * calculate.gaussian(
+            self._lattice_distances[closest, neighbors],
+            self.neighbor_move_rate * decay * decay)
+        self._weights[neighbors] += final_rates[:, None] * (
+            input_vec - self._weights[neighbors])
+
+    def _decay(self):
+        """Return factor that shrinks move rate and neighborhood, for current step."""
+        if self.decay_steps is None:
+            return 1.0
+        return math.exp(-float(self._step) / self.decay_steps)
+
+    def _get_neighborhood_kernel(self):
+        """Return matrix of how much each neuron moves, when each neuron wins.
+
+        Element i, j is gaussian of lattice distance between neuron i and j,
+        or 0 if j is not within neighborhood of i.
+        """
+        self._get_neighbor_indices()
+        decay = self._decay()
+        params = (self._num_neighbor_levels,
+                  self.neighbor_move_rate * decay * decay)
+        if params != self._neighborhood_kernel_params:
+            self._neighborhood_kernel = calculate.gaussian(
+                self._lattice_distances, params[1])
+            max_distance = self._distance_levels[params[0] - 1]
+            self._neighborhood_kernel[
+                self._lattice_distances > max_distance] = 0.0
+            self._neighborhood_kernel_params = params
+
+        return self._neighborhood_kernel
+
+    def _get_neighbor_indices(self):
+        """Return indices of neurons within neighborhood, for each winner.
+
+        Only rebuilt when decayed neighborhood crosses a lattice distance.
+        """
+        # Small tolerance for rounding error in lattice distances
+        num_levels = numpy.searchsorted(
+            self._distance_levels,
+            self.neighborhood * self._decay() + 1e-9,
+            side='right')
+        if num_levels != self._num_neighbor_levels:
+            within = (self._lattice_distances <=
+                      self._distance_levels[num_levels - 1])
+            self._neighbor_indices = [numpy.flatnonzero(row) for row in within]
+            self._num_neighbor_levels = num_levels
+
+        return self._neighbor_indices
+
+
+def _lattice_positions(num_neurons, topology, grid_shape=None):
+    """Return matrix with position of each neuron on lattice in rows."""
+    if topology == 'line':
+        return numpy.arange(num_neurons, dtype='d')[:, None]
+    elif topology not in ('rect', 'hex'):
+        raise ValueError("topology must be 'line', 'rect', or 'hex'")
+
+    if grid_shape is None:
+        # Most square grid, with largest number of rows <= sqrt(neurons)
+        num_rows = max(
+            rows for rows in range(1, int(math.sqrt(num_neurons)) + 1)
+            if num_neurons % rows == 0)
+        grid_shape = (num_rows, num_neurons // num_rows)
+    if grid_shape[0] * grid_shape[1] != num_neurons:
+        raise ValueError('grid_shape must have one position for each neuron')
+
+    rows, columns = numpy.divmod(numpy.arange(num_neurons), grid_shape[1])
+    positions = numpy.column_stack([columns, rows]).astype('d')
+    if topology == 'hex':
+        # Offset odd rows by half a neuron, and bring rows closer,
+        # so each neuron is distance 1 from 6 neighbors
+        positions[:, 0] += 0.5 * (rows % 2)
+        positions[:, 1] *= math.sqrt(3.0) / 2.0
+    return positions
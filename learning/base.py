@@ -30,7 +30,7 @@ import numbers
 
 import numpy
 
-from learning import validation
+from learning import validation, parallel
 
 
 ##############################
@@ -76,6 +76,9 @@ def _selection_size_heuristic(num_samples):
 
 class Model(object):
     """A supervised learning model."""
+    # If True, activate accepts a matrix of inputs,
+    # and returns a matrix with one row of outputs for each row
+    supports_batch_activate = False
 
     def __init__(self):
         self._post_pattern_callback = None
@@ -143,7 +146,8 @@ class Model(object):
               error_stagnant_distance=5,
               error_stagnant_threshold=0.00001,
               error_improve_iters=20,
-              post_pattern_callback=None):
+              post_pattern_callback=None,
+              retry_n_jobs=1):
         """Train model on the given dataset.
 
         Note: Override this method for batch learning models.
@@ -161,6 +165,11 @@ class Model(object):
                 error_stagnant_distance iterations, or training ends.
             error_improve_iters: Best error must decrease within this many iterations,
                 or training ends.
+            retry_n_jobs: Number of processes for running attempts
+                (first try and retries) in parallel. -1 uses all cpus.
+                Each attempt has an independent random seed,
+                and remaining attempts stop when one converges.
+                post_pattern_callback is called in each attempts process.
         """
         # Even if we don't reset, users will expect the Model to train if train is called
         # So we reset self.converged
@@ -173,7 +182,7 @@ class Model(object):
         train_error = self._train(
             input_matrix, target_matrix, iterations, retries, error_break,
             error_stagnant_distance, error_stagnant_threshold,
-            error_improve_iters, post_pattern_callback)
+            error_improve_iters, post_pattern_callback, retry_n_jobs)
 
         # Post training callback
         self._post_train(input_matrix, target_matrix)
@@ -183,11 +192,22 @@ class Model(object):
 
     def _train(self, input_matrix, target_matrix, iterations, retries,
                error_break, error_stagnant_distance, error_stagnant_threshold,
-               error_improve_iters, post_pattern_callback):
+               error_improve_iters, post_pattern_callback, retry_n_jobs=1):
         """Train model on the given dataset."""
         self._reset_bookkeeping()
         self._post_pattern_callback = post_pattern_callback  # For calling in other method
 
+        # Attempts are independent, so they can run at the same time
+        retry_processes = parallel.num_processes(retry_n_jobs)
+        if retries > 0 and retry_processes > 1:
+            attempt_error, serialized_model = parallel.train_attempts(
+                self, input_matrix, target_matrix, retries + 1,
+                retry_processes,
+                (iterations, error_break, error_stagnant_distance,
+                 error_stagnant_threshold, error_improve_iters, None))
+            self.__dict__ = self.unserialize(serialized_model).__dict__
+            return attempt_error
+
         # Initialize variables for retries
         best_try = (float('inf'), None)  # (error, serialized_model)
 
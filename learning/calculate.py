@@ -30,9 +30,38 @@ INFINITY = float('inf')
 
 
 def distance(vec_a, vec_b):
-    # TODO: fix so it works with matrix inputs
+    """Return euclidean distance between vec_a and vec_b.
+
+    If either is a matrix, return distance for each row.
+    """
     diff = numpy.subtract(vec_a, vec_b)
-    return numpy.sqrt(diff.dot(diff))
+    return numpy.sqrt(numpy.einsum('...i,...i->...', diff, diff))
+
+
+def squared_distances(matrix_a, matrix_b, sq_norms_b=None, out=None):
+    """Return matrix of squared euclidean distance between rows of matrices.
+
+    Element i, j is distance between row i of matrix_a and row j of matrix_b.
+    Uses ||a||^2 - 2 a.b + ||b||^2, so most work is one matrix product.
+
+    Args:
+        matrix_a: Matrix with vectors in rows.
+        matrix_b: Matrix with vectors in rows.
+        sq_norms_b: Optional squared norm of each row of matrix_b,
+            to avoid recalculating for many calls with the same matrix_b.
+        out: Optional C contiguous float matrix to store result in,
+            avoiding a new matrix.
+    """
+    if sq_norms_b is None:
+        sq_norms_b = numpy.einsum('ij,ij->i', matrix_b, matrix_b)
+
+    distances = numpy.dot(matrix_a, matrix_b.T, out=out)
+    distances *= -2.0
+    distances += numpy.einsum('ij,ij->i', matrix_a, matrix_a)[:, None]
+    distances += sq_norms_b
+
+    # Rounding error can make distances between near rows slightly negative
+    return numpy.maximum(distances, 0.0, out=distances)
 
 
 def protvecdiv(vec_a, vec_b):
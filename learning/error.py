@@ -42,6 +42,14 @@ class ErrorFunc(object):
         """Return (error, derivative tensor)."""
         raise NotImplementedError()
 
+    def hessian_vector_product(self, tensor_a, tensor_b, direction_tensor):
+        """Return product of error hessian, with regard to tensor_a, and direction_tensor.
+
+        direction_tensor has the shape of tensor_a,
+        and the returned tensor has the shape of tensor_a.
+        """
+        raise NotImplementedError()
+
 
 class MeanSquaredError(ErrorFunc):
     """Mean squared error (MSE), defined by mean((tensor_a - tensor_b)^2)."""
@@ -63,6 +71,11 @@ class MeanSquaredError(ErrorFunc):
 
         return mse, error_tensor
 
+    def hessian_vector_product(self, tensor_a, tensor_b, direction_tensor):
+        """Return product of error hessian, with regard to tensor_a, and direction_tensor."""
+        # Hessian is 2/n I
+        return (2.0 / reduce(operator.mul, tensor_a.shape)) * direction_tensor
+
 
 class CrossEntropyError(ErrorFunc):
     """Cross entropy error, defined by -mean(log(tensor_a) * tensor_b).
@@ -115,6 +128,70 @@ class CrossEntropyError(ErrorFunc):
             return error, tensor_b_div_tensor_a / (
                 -reduce(operator.mul, tensor_a.shape[:-1]))
 
+    def hessian_vector_product(self, tensor_a, tensor_b, direction_tensor):
+        """Return product of error hessian, with regard to tensor_a, and direction_tensor."""
+        # Hessian is diagonal, with tensor_b / tensor_a^2 on diagonal
+        with numpy.errstate(invalid='ignore', divide='warn'):
+            hessian_diag = tensor_b / (tensor_a * tensor_a)
+
+        # Change nan (0/0) to 0, and inf (x/0) to 1.79769313e+308
+        hessian_diag = numpy.nan_to_num(hessian_diag)
+
+        if len(tensor_a.shape) == 1:  # Vector
+            return hessian_diag * direction_tensor
+        else:  # Matrix or tensor
+            return hessian_diag * direction_tensor / reduce(
+                operator.mul, tensor_a.shape[:-1])
+
+
+class BinaryCrossEntropyError(ErrorFunc):
+    """Binary cross entropy (log loss) error.
+
+    Defined by -mean(tensor_b * log(tensor_a) + (1 - tensor_b) * log(1 - tensor_a)).
+
+    Each element of tensor_a is the predicted probability of an
+    independent binary outcome, such as the output of logistic regression,
+    and tensor_b is the reference tensor, typically of 0s and 1s.
+    Minimizing binary cross entropy maximizes likelihood of tensor_b.
+    """
+
+    def __call__(self, tensor_a, tensor_b):
+        """Return the error between two tensors.
+
+        Typically, tensor_a is a model output, and tensor_b is a target tensor.
+
+        log(0) in tensor_a is changed to very negative value, to keep the spirit
+        of cross entropy, while avoiding numerical errors.
+        """
+        with numpy.errstate(invalid='raise', divide='ignore'):
+            log_a = numpy.nan_to_num(numpy.log(tensor_a))
+            log_one_minus_a = numpy.nan_to_num(numpy.log1p(-tensor_a))
+
+        return -numpy.mean(tensor_b * log_a + (1.0 - tensor_b) * log_one_minus_a)
+
+    def derivative(self, tensor_a, tensor_b):
+        """Return (error, derivative tensor)."""
+        # (a - b) / (a (1 - a)), with nan (0/0) changed to 0,
+        # and inf (x/0) changed to 1.79769313e+308
+        with numpy.errstate(invalid='ignore', divide='warn'):
+            error_tensor = numpy.nan_to_num(
+                (tensor_a - tensor_b) / (tensor_a * (1.0 - tensor_a)))
+
+        error_tensor /= reduce(operator.mul, tensor_a.shape)
+        return self(tensor_a, tensor_b), error_tensor
+
+    def hessian_vector_product(self, tensor_a, tensor_b, direction_tensor):
+        """Return product of error hessian, with regard to tensor_a, and direction_tensor."""
+        # Hessian is diagonal, with b / a^2 + (1 - b) / (1 - a)^2 on diagonal
+        one_minus_a = 1.0 - tensor_a
+        with numpy.errstate(invalid='ignore', divide='warn'):
+            hessian_diag = numpy.nan_to_num(
+                tensor_b / (tensor_a * tensor_a) +
+                (1.0 - tensor_b) / (one_minus_a * one_minus_a))
+
+        return hessian_diag * direction_tensor / reduce(
+            operator.mul, tensor_a.shape)
+
 
 #############################
 # Penalty Functions
@@ -151,6 +228,20 @@ class PenaltyFunc(object):
         return self._penalty_weight * self._derivative(weight_tensor,
                                                        penalty_output)
 
+    def hessian_vector_product(self, weight_tensor, direction_tensor):
+        """Return product of hessian of given weight tensor, and direction_tensor."""
+        return self._penalty_weight * self._hessian_vector_product(
+            weight_tensor, direction_tensor)
+
+    def proximal(self, weight_tensor, step_size):
+        """Return proximal operator of this penalty, at given weight tensor.
+
+        argmin_W' penalty(W') + ||W' - W||^2 / (2 step_size).
+        Used by proximal gradient optimizers,
+        which do not require a derivative of this penalty.
+        """
+        return self._proximal(weight_tensor, step_size * self._penalty_weight)
+
     def _penalty(self, weight_tensor):
         """Return penalty of given weight tensor."""
         raise NotImplementedError
@@ -159,6 +250,14 @@ class PenaltyFunc(object):
         """Return jacobian of given weight tensor."""
         raise NotImplementedError
 
+    def _hessian_vector_product(self, weight_tensor, direction_tensor):
+        """Return product of hessian of given weight tensor, and direction_tensor."""
+        raise NotImplementedError
+
+    def _proximal(self, weight_tensor, threshold):
+        """Return proximal operator of unweighted penalty, scaled by threshold."""
+        raise NotImplementedError
+
 
 # TODO: Test and document if these norms function the same for
 # vectors and other tensors (because norms are defined differently for
@@ -176,6 +275,17 @@ class L1Penalty(PenaltyFunc):
         """Return jacobian of given weight tensor."""
         return numpy.sign(weight_tensor)
 
+    def _hessian_vector_product(self, weight_tensor, direction_tensor):
+        """Return product of hessian of given weight tensor, and direction_tensor."""
+        # Hessian is 0, where defined
+        return numpy.zeros(direction_tensor.shape)
+
+    def _proximal(self, weight_tensor, threshold):
+        """Return proximal operator of unweighted penalty, scaled by threshold."""
+        # Soft thresholding, weights within threshold of 0 become exactly 0
+        return numpy.sign(weight_tensor) * numpy.maximum(
+            numpy.abs(weight_tensor) - threshold, 0.0)
+
 
 class L2Penalty(PenaltyFunc):
     """Penalize weights by ||W||_2.
@@ -191,3 +301,18 @@ class L2Penalty(PenaltyFunc):
     def _derivative(self, weight_tensor, penalty_output):
         """Return jacobian of given weight tensor."""
         return weight_tensor / penalty_output
+
+    def _hessian_vector_product(self, weight_tensor, direction_tensor):
+        """Return product of hessian of given weight tensor, and direction_tensor."""
+        # Hessian is (I - W W^T / ||W||^2) / ||W||
+        norm = self._penalty(weight_tensor)
+        return (direction_tensor - weight_tensor *
+                (weight_tensor.dot(direction_tensor) / (norm * norm))) / norm
+
+    def _proximal(self, weight_tensor, threshold):
+        """Return proximal operator of unweighted penalty, scaled by threshold."""
+        # Block soft thresholding, shrink norm by threshold
+        norm = self._penalty(weight_tensor)
+        if norm <= threshold:
+            return numpy.zeros(weight_tensor.shape)
+        return weight_tensor * (1.0 - threshold / norm)
@@ -25,7 +25,7 @@
 # Make important classes available from here
 
 # Problem class for making problem instances to optimize
-from learning.optimize.problem import Problem
+from learning.optimize.problem import Problem, EvaluationCache
 
 # Initial step size strategies
 from learning.optimize.initialstep import (IncrPrevStep, FOChangeInitialStep,
@@ -36,5 +36,7 @@ from learning.optimize.linesearch import (SetStepSize, BacktrackingLineSearch,
                                           WolfeLineSearch)
 
 # Optimizers
-from learning.optimize.optimizer import (make_optimizer, SteepestDescent,
-                                         SteepestDescentMomentum, BFGS, LBFGS)
+from learning.optimize.optimizer import (
+    make_optimizer, SteepestDescent, SteepestDescentMomentum, NesterovMomentum,
+    Adagrad, RMSProp, Adam, ConjugateGradient, BFGS, LBFGS, Newton, NewtonCG,
+    LevenbergMarquardt, FISTA)
@@ -38,12 +38,32 @@ class StepSizeGetter(object):
     """Returns step size when called.
 
     Used by Optimizer.
+
+    Attributes:
+        evaluations: Number of objective evaluations in last call.
+        total_evaluations: Number of objective evaluations in all calls.
+            Not cleared by reset.
     """
 
+    def __init__(self):
+        self.evaluations = 0
+        self.total_evaluations = 0
+
     def reset(self):
         """Reset parameters."""
         pass
 
+    def _counted(self, func):
+        """Return func, wrapped to count evaluations for this call."""
+        self.evaluations = 0
+
+        def counted_func(*args):
+            self.evaluations += 1
+            self.total_evaluations += 1
+            return func(*args)
+
+        return counted_func
+
     def __call__(self, xk, obj_xk, jac_xk, step_dir, problem):
         """Return step size.
 
@@ -121,7 +141,7 @@ class BacktrackingLineSearch(StepSizeGetter):
             obj_xk,
             jac_xk,
             step_dir,
-            problem.get_obj,
+            self._counted(problem.get_obj),
             self._c_1,
             initial_step,
             decr_rate=self._decr_rate)
@@ -132,11 +152,36 @@ class BacktrackingLineSearch(StepSizeGetter):
 
 
 class WolfeLineSearch(StepSizeGetter):
-    """Specialized algorithm for finding step size that satisfies strong wolfe conditions."""
+    """Specialized algorithm for finding step size that satisfies strong wolfe conditions.
 
-    def __init__(self, c_1=1e-4, c_2=0.9, initial_step_getter=None):
+    Args:
+        interpolation: 'cubic', 'quadratic', or 'bisect';
+            Strategy for choosing trial step sizes.
+            'cubic' interpolates objective value and derivative
+            at both ends of an interval,
+            and extrapolates when increasing step size.
+            'quadratic' interpolates objective value at both ends,
+            and derivative at the low end.
+            Interpolated steps fall back to bisection when not safely
+            within an interval.
+            'bisect' halves intervals.
+            Defaults to 'cubic', which takes fewer trial steps.
+            Previously, trial steps were always chosen by bisection,
+            so pass 'bisect' to keep the old sequence of steps.
+    """
+
+    def __init__(self,
+                 c_1=1e-4,
+                 c_2=0.9,
+                 initial_step_getter=None,
+                 interpolation='cubic'):
         super(WolfeLineSearch, self).__init__()
 
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError('interpolation must be one of %s' %
+                             (INTERPOLATIONS, ))
+        self._interpolation = interpolation
+
         # "In practice, c_1 is chosen to be quite small, say c_1 = 10^-4"
         # ~Numerical Optimization (2nd) pp. 33
         self._c_1 = c_1
@@ -168,9 +213,10 @@ class WolfeLineSearch(StepSizeGetter):
         initial_step = self._initial_step_getter(xk, obj_xk, jac_xk, step_dir,
                                                  problem)
 
-        step_size = _line_search_wolfe(xk, obj_xk, jac_xk, step_dir,
-                                       problem.get_obj_jac, self._c_1,
-                                       self._c_2, initial_step)
+        step_size = _line_search_wolfe(
+            xk, obj_xk, jac_xk, step_dir,
+            self._counted(problem.get_obj_jac), self._c_1, self._c_2,
+            initial_step, self._interpolation)
 
         self._initial_step_getter.update(step_size)
         return step_size
@@ -225,10 +271,20 @@ def _backtracking_line_search(parameters,
 
 
 WOLFE_INCR_RATE = 1.5
+WOLFE_MAX_INCR_RATE = 10.0
+
+INTERPOLATIONS = ('cubic', 'quadratic', 'bisect')
 
 
-def _line_search_wolfe(parameters, obj_xk, jac_xk, step_dir, obj_jac_func, c_1,
-                       c_2, initial_step):
+def _line_search_wolfe(parameters,
+                       obj_xk,
+                       jac_xk,
+                       step_dir,
+                       obj_jac_func,
+                       c_1,
+                       c_2,
+                       initial_step,
+                       interpolation='cubic'):
     """Return step size that satisfies wolfe conditions.
 
     See Numerical Optimization (2nd) pp. 60
@@ -246,6 +302,8 @@ def _line_search_wolfe(parameters, obj_xk, jac_xk, step_dir, obj_jac_func, c_1,
         obj_jac_func: Function taking parameters and returning obj and jac at given parameters.
         c_1: Strictness parameter for Armijo rule.
         c_2: Strictness parameter for curvature condition.
+        interpolation: 'cubic', 'quadratic', or 'bisect';
+            Strategy for choosing trial step sizes.
     """
     if numpy.isnan(obj_xk):
         # Failsafe for erroneously calculated obj_xk (usually overflow or x/0)
@@ -261,6 +319,7 @@ def _line_search_wolfe(parameters, obj_xk, jac_xk, step_dir, obj_jac_func, c_1,
     # We need the current and previous step size for some operations
     prev_step_size = 0.0
     prev_step_obj = step_zero_obj
+    prev_step_grad = step_zero_grad
 
     step_size = initial_step
     for i in itertools.count(start=1):
@@ -279,9 +338,10 @@ def _line_search_wolfe(parameters, obj_xk, jac_xk, step_dir, obj_jac_func, c_1,
         # or armijo condition is False (step_obj > obj_xk + c_1*step_size*step_grad)
         if ((i > 1 and step_obj >= prev_step_obj)
                 or (step_obj > obj_xk + c_1 * step_size * step_grad)):
-            return _zoom_wolfe(prev_step_size, prev_step_obj, step_size,
-                               parameters, obj_xk, step_zero_grad, step_dir,
-                               obj_jac_func, c_1, c_2)
+            return _zoom_wolfe(prev_step_size, prev_step_obj, prev_step_grad,
+                               step_size, step_obj, step_grad, parameters,
+                               obj_xk, step_zero_grad, step_dir, obj_jac_func,
+                               c_1, c_2, interpolation)
 
         # Check if step size is already an acceptable step length
         # True when gradient is sufficiently small (magnitude wise)
@@ -291,14 +351,10 @@ def _line_search_wolfe(parameters, obj_xk, jac_xk, step_dir, obj_jac_func, c_1,
         # If objective value did not improve (first if statement)
         # and step size needs to increase (non-negative gradient)
         elif step_grad >= 0:
-            return _zoom_wolfe(step_size, step_obj, prev_step_size, parameters,
+            return _zoom_wolfe(step_size, step_obj, step_grad, prev_step_size,
+                               prev_step_obj, prev_step_grad, parameters,
                                obj_xk, step_zero_grad, step_dir, obj_jac_func,
-                               c_1, c_2)
-
-        # Increase step size, score current values for comparison to previous
-        prev_step_size = step_size
-        prev_step_obj = step_obj
-        prev_step_grad = step_grad
+                               c_1, c_2, interpolation)
 
         # Similar to zoom, we need to find a new trial step size
         # somewhere between current, and an arbitrary max
@@ -312,35 +368,54 @@ def _line_search_wolfe(parameters, obj_xk, jac_xk, step_dir, obj_jac_func, c_1,
         # it is important that the successive steps increase quickly enough to
         # reach the upper limit alpha_max in a finite number of iterations."
         # ~Numerical Optimization (2nd) pp. 61
-        # Use multiply by constant strategy
-        # TODO: Try other interpolation strategies
-        step_size *= WOLFE_INCR_RATE
+        min_step_size = step_size * WOLFE_INCR_RATE
+        if interpolation == 'cubic':
+            # Extrapolate minimizer of cubic,
+            # and increase at least as much as multiply by constant strategy
+            next_step_size = _cubic_minimizer(prev_step_size, prev_step_obj,
+                                              prev_step_grad, step_size,
+                                              step_obj, step_grad)
+            if next_step_size is None or not next_step_size > min_step_size:
+                next_step_size = min_step_size
+            next_step_size = min(next_step_size,
+                                 step_size * WOLFE_MAX_INCR_RATE)
+        else:
+            # Use multiply by constant strategy
+            next_step_size = min_step_size
+
+        # Increase step size, score current values for comparison to previous
+        prev_step_size = step_size
+        prev_step_obj = step_obj
+        prev_step_grad = step_grad
 
+        step_size = next_step_size
 
-def _zoom_wolfe(step_size_low, step_size_low_obj, step_size_high, parameters,
-                step_zero_obj, step_zero_grad, step_dir, obj_jac_func, c_1,
-                c_2):
+
+def _zoom_wolfe(step_size_low, step_size_low_obj, step_size_low_grad,
+                step_size_high, step_size_high_obj, step_size_high_grad,
+                parameters, step_zero_obj, step_zero_grad, step_dir,
+                obj_jac_func, c_1, c_2, interpolation='cubic'):
     """Zoom into acceptable step size within a given interval.
 
     Args:
         step_size_low: Step size with low objective value (good)
         step_size_high: Step size with high objective value (high)
+        interpolation: 'cubic', 'quadratic', or 'bisect';
+            Strategy for choosing trial step sizes.
     """
     # NOTE: lower objective values are better
     # (hence step_size_low better than step_size_high)
-    # TODO: Optimize by caching values repeatedly used in inequalities
 
     for i in itertools.count(start=1):
         # Choose step size
         # NOTE: step_size should not be too close to low or high
-        # TODO: Test other strategies (see Interpolation subsection of NumOpt)
         # "Interpolate (using quadratic, cubic, or bisection)
         # to find a trial step length alpha_j between alpha_lo and alpha_hi"
         # ~Numerical Optimization (2nd) pp. 61
-        # Use bisection
-        step_size = _bisect_value(
-            min(step_size_low, step_size_high),
-            max(step_size_low, step_size_high))
+        step_size = _interpolate_step_size(
+            step_size_low, step_size_low_obj, step_size_low_grad,
+            step_size_high, step_size_high_obj, step_size_high_grad,
+            interpolation)
         assert step_size >= 0
 
         if i >= 100:
@@ -362,6 +437,8 @@ def _zoom_wolfe(step_size_low, step_size_low_obj, step_size_high, parameters,
             # step_size is not an improvement
             # This step size is the new poor valued side of the interval
             step_size_high = step_size
+            step_size_high_obj = step_obj
+            step_size_high_grad = step_grad
 
         # step_size is an improvement
         else:
@@ -378,10 +455,102 @@ def _zoom_wolfe(step_size_low, step_size_low_obj, step_size_high, parameters,
                 # Set the current bad step size to the current good step size
                 # Because step_size is better (and will be set so in a couple lines)
                 step_size_high = step_size_low
+                step_size_high_obj = step_size_low_obj
+                step_size_high_grad = step_size_low_grad
 
             # Set step_size_low
             step_size_low = step_size
             step_size_low_obj = step_obj
+            step_size_low_grad = step_grad
+
+
+# Interpolated step sizes closer than this fraction of the interval
+# to either end of the interval are rejected
+_CUBIC_SAFEGUARD = 0.2
+_QUADRATIC_SAFEGUARD = 0.1
+
+
+def _interpolate_step_size(step_size_low, step_size_low_obj,
+                           step_size_low_grad, step_size_high,
+                           step_size_high_obj, step_size_high_grad,
+                           interpolation):
+    """Return trial step size between low and high step sizes.
+
+    Interpolated step sizes are safeguarded,
+    falling back to quadratic interpolation (for cubic), then bisection,
+    when the interpolated step size is undefined,
+    or too close to either end of the interval.
+    """
+    min_ = min(step_size_low, step_size_high)
+    max_ = max(step_size_low, step_size_high)
+    width = max_ - min_
+
+    if interpolation == 'cubic':
+        step_size = _cubic_minimizer(step_size_low, step_size_low_obj,
+                                     step_size_low_grad, step_size_high,
+                                     step_size_high_obj, step_size_high_grad)
+        if _within_interval(step_size, min_ + _CUBIC_SAFEGUARD * width,
+                            max_ - _CUBIC_SAFEGUARD * width):
+            return step_size
+
+    if interpolation in ('cubic', 'quadratic'):
+        step_size = _quadratic_minimizer(step_size_low, step_size_low_obj,
+                                         step_size_low_grad, step_size_high,
+                                         step_size_high_obj)
+        if _within_interval(step_size, min_ + _QUADRATIC_SAFEGUARD * width,
+                            max_ - _QUADRATIC_SAFEGUARD * width):
+            return step_size
+
+    # Use bisection
+    return _bisect_value(min_, max_)
+
+
+def _within_interval(value, min_, max_):
+    """Return True if value is a number between min and max."""
+    return value is not None and min_ <= value <= max_
+
+
+def _cubic_minimizer(step_size_a, obj_a, grad_a, step_size_b, obj_b, grad_b):
+    """Return minimizer of cubic interpolating objective and gradient at a and b.
+
+    See Numerical Optimization (2nd) pp. 59
+
+    Returns None if cubic has no minimizer.
+    """
+    with numpy.errstate(all='ignore'):
+        d_1 = grad_a + grad_b - 3.0 * (obj_a - obj_b) / (
+            step_size_a - step_size_b)
+        d_2_squared = d_1 * d_1 - grad_a * grad_b
+        if not d_2_squared >= 0.0:
+            return None
+        d_2 = numpy.sign(step_size_b - step_size_a) * numpy.sqrt(d_2_squared)
+
+        step_size = step_size_b - (step_size_b - step_size_a) * (
+            (grad_b + d_2 - d_1) / (grad_b - grad_a + 2.0 * d_2))
+
+    if not numpy.isfinite(step_size):
+        return None
+    return step_size
+
+
+def _quadratic_minimizer(step_size_a, obj_a, grad_a, step_size_b, obj_b):
+    """Return minimizer of quadratic interpolating objective and gradient at a, and objective at b.
+
+    See Numerical Optimization (2nd) pp. 58
+
+    Returns None if quadratic has no minimizer.
+    """
+    diff = step_size_b - step_size_a
+    curvature = obj_b - obj_a - grad_a * diff
+    if not curvature > 0.0:
+        return None
+
+    with numpy.errstate(all='ignore'):
+        step_size = step_size_a - grad_a * diff * diff / (2.0 * curvature)
+
+    if not numpy.isfinite(step_size):
+        return None
+    return step_size
 
 
 def _bisect_value(min_, max_):
@@ -24,18 +24,34 @@
 """Numerical optimization methods."""
 
 import logging
+import functools
 
 import numpy
 
-from learning.optimize import WolfeLineSearch, FOChangeInitialStep
+from learning.optimize import (WolfeLineSearch, IncrPrevStep,
+                               FOChangeInitialStep)
 
 
-def make_optimizer(num_parameters):
-    """Return a new optimizer, using simple heuristics."""
+def make_optimizer(num_parameters, low_memory=False):
+    """Return a new optimizer, using simple heuristics.
+
+    Args:
+        num_parameters: Number of parameters to optimize.
+        low_memory: Use an optimizer with O(n) memory,
+            instead of storing any approx hessian information.
+    """
     # TODO: More heuristics
 
+    if low_memory:
+        return ConjugateGradient()
+
     # If there are too many parameters, use an optimizer that doesn't use hessian matrix
-    if num_parameters > 500:  # NOTE: Cutoff value could use more testing
+    # NOTE: BFGS updates its approx inv hessian in O(n^2) time.
+    # With 2000 parameters, an update takes ~15ms (vs ~80ms for
+    # the previous O(n^3) update with 500 parameters),
+    # and the approx inv hessian takes 32MB of memory.
+    # Both grow quadratically beyond this
+    if num_parameters > 2000:
         # Too many weights, don't use hessian matrix
         return LBFGS()
     else:
@@ -48,6 +64,9 @@ def make_optimizer(num_parameters):
 ################################
 class Optimizer(object):
     """Optimizer for optimizing model parameters."""
+    # If True, optimizer expects problem.get_obj and get_jac
+    # to exclude nonsmooth objective, given by problem.get_prox
+    uses_prox = False
 
     def __init__(self):
         self.jacobian = None  # Last computed jacobian
@@ -66,10 +85,8 @@ class Optimizer(object):
 ################################
 # Optimizer Implementations
 ################################
-# TODO: Optimize optimizers by re-using objective and jacobians calculated
-# during line searches. Such as by caching these values, and checking cache before
-# calculating (Problem object can cache these (by parameters), but we need to make sure
-# model do not make another instance of an Problem if the problem is the same)
+# NOTE: Objective values and jacobians calculated during line searches
+# are re-used when a Problem is given an EvaluationCache
 class SteepestDescent(Optimizer):
     """Simple steepest descent with constant step size."""
 
@@ -145,6 +162,352 @@ class SteepestDescentMomentum(Optimizer):
         return obj_value, next_parameters
 
 
+class _AdaptiveOptimizer(Optimizer):
+    """Optimizer taking one step per objective evaluation, without line search.
+
+    Steps are calculated from state arrays,
+    allocated on first iteration, and updated in place.
+    Effective when objective changes between iterations,
+    such as minibatch or dropout training.
+    """
+
+    def __init__(self, step_size):
+        super(_AdaptiveOptimizer, self).__init__()
+
+        self._step_size = step_size
+        self._iteration = 0
+
+    def reset(self):
+        """Reset optimizer parameters."""
+        super(_AdaptiveOptimizer, self).reset()
+        self._iteration = 0
+        self._reset_state()
+
+    def next(self, problem, parameters):
+        """Return next iteration of this optimizer."""
+        obj_value, self.jacobian = problem.get_obj_jac(parameters)
+
+        if self._iteration == 0:
+            self._allocate_state(parameters.shape)
+        self._iteration += 1
+
+        return obj_value, parameters - self._get_step(self.jacobian)
+
+    def _reset_state(self):
+        """Discard state arrays."""
+        raise NotImplementedError()
+
+    def _allocate_state(self, shape):
+        """Allocate state arrays for parameters of shape."""
+        raise NotImplementedError()
+
+    def _get_step(self, jacobian):
+        """Update state with jacobian, and return step to subtract from parameters."""
+        raise NotImplementedError()
+
+
+class NesterovMomentum(_AdaptiveOptimizer):
+    """Steepest descent with Nesterov accelerated momentum.
+
+    v_{k+1} = mu v_k - a grad_f(x_k)
+    x_{k+1} = x_k + mu v_{k+1} - a grad_f(x_k)
+
+    where x_k are parameters after applying momentum,
+    so only one jacobian is calculated per iteration.
+
+    Ref: Bengio et al. 2013, Advances in Optimizing Recurrent Networks.
+    """
+
+    def __init__(self, step_size=0.01, momentum_rate=0.9):
+        super(NesterovMomentum, self).__init__(step_size)
+
+        self._momentum_rate = momentum_rate
+
+        self._velocity = None
+
+    def _reset_state(self):
+        """Discard state arrays."""
+        self._velocity = None
+
+    def _allocate_state(self, shape):
+        """Allocate state arrays for parameters of shape."""
+        self._velocity = numpy.zeros(shape)
+
+    def _get_step(self, jacobian):
+        """Update state with jacobian, and return step to subtract from parameters."""
+        step = self._step_size * jacobian
+
+        # v_{k+1} = mu v_k - a grad_f(x_k)
+        self._velocity *= self._momentum_rate
+        self._velocity -= step
+
+        # -(mu v_{k+1} - a grad_f(x_k))
+        step -= self._momentum_rate * self._velocity
+        return step
+
+
+class Adagrad(_AdaptiveOptimizer):
+    """Steepest descent with step size scaled by sum of squared jacobians.
+
+    x_{k+1} = x_k - a grad_f(x_k) / (sqrt(sum_i grad_f(x_i)^2) + epsilon)
+
+    Ref: Duchi et al. 2011, Adaptive Subgradient Methods for
+    Online Learning and Stochastic Optimization.
+    """
+
+    def __init__(self, step_size=0.01, epsilon=1e-8):
+        super(Adagrad, self).__init__(step_size)
+
+        self._epsilon = epsilon
+
+        self._squared_jacobian_sum = None
+
+    def _reset_state(self):
+        """Discard state arrays."""
+        self._squared_jacobian_sum = None
+
+    def _allocate_state(self, shape):
+        """Allocate state arrays for parameters of shape."""
+        self._squared_jacobian_sum = numpy.zeros(shape)
+
+    def _get_step(self, jacobian):
+        """Update state with jacobian, and return step to subtract from parameters."""
+        self._squared_jacobian_sum += jacobian * jacobian
+
+        denominator = numpy.sqrt(self._squared_jacobian_sum)
+        denominator += self._epsilon
+        return self._step_size * jacobian / denominator
+
+
+class RMSProp(_AdaptiveOptimizer):
+    """Steepest descent with step size scaled by moving average of squared jacobians.
+
+    v_{k+1} = rho v_k + (1 - rho) grad_f(x_k)^2
+    x_{k+1} = x_k - a grad_f(x_k) / (sqrt(v_{k+1}) + epsilon)
+
+    Ref: Tieleman and Hinton 2012, Lecture 6.5 - RMSProp.
+    """
+
+    def __init__(self, step_size=0.001, decay_rate=0.9, epsilon=1e-8):
+        super(RMSProp, self).__init__(step_size)
+
+        self._decay_rate = decay_rate
+        self._epsilon = epsilon
+
+        self._squared_jacobian_avg = None
+
+    def _reset_state(self):
+        """Discard state arrays."""
+        self._squared_jacobian_avg = None
+
+    def _allocate_state(self, shape):
+        """Allocate state arrays for parameters of shape."""
+        self._squared_jacobian_avg = numpy.zeros(shape)
+
+    def _get_step(self, jacobian):
+        """Update state with jacobian, and return step to subtract from parameters."""
+        self._squared_jacobian_avg *= self._decay_rate
+        self._squared_jacobian_avg += (1.0 - self._decay_rate) * (
+            jacobian * jacobian)
+
+        denominator = numpy.sqrt(self._squared_jacobian_avg)
+        denominator += self._epsilon
+        return self._step_size * jacobian / denominator
+
+
+class Adam(_AdaptiveOptimizer):
+    """Steepest descent with momentum, and step size scaled by moving average of squared jacobians.
+
+    m_{k+1} = beta_1 m_k + (1 - beta_1) grad_f(x_k)
+    v_{k+1} = beta_2 v_k + (1 - beta_2) grad_f(x_k)^2
+    x_{k+1} = x_k - a_k m_{k+1} / (sqrt(v_{k+1}) + epsilon)
+
+    where a_k = a sqrt(1 - beta_2^{k+1}) / (1 - beta_1^{k+1})
+    corrects bias from initializing m and v to 0.
+
+    Ref: Kingma and Ba 2014, Adam: A Method for Stochastic Optimization.
+    """
+
+    def __init__(self, step_size=0.001, beta_1=0.9, beta_2=0.999,
+                 epsilon=1e-8):
+        super(Adam, self).__init__(step_size)
+
+        self._beta_1 = beta_1
+        self._beta_2 = beta_2
+        self._epsilon = epsilon
+
+        self._jacobian_avg = None
+        self._squared_jacobian_avg = None
+
+    def _reset_state(self):
+        """Discard state arrays."""
+        self._jacobian_avg = None
+        self._squared_jacobian_avg = None
+
+    def _allocate_state(self, shape):
+        """Allocate state arrays for parameters of shape."""
+        self._jacobian_avg = numpy.zeros(shape)
+        self._squared_jacobian_avg = numpy.zeros(shape)
+
+    def _get_step(self, jacobian):
+        """Update state with jacobian, and return step to subtract from parameters."""
+        self._jacobian_avg *= self._beta_1
+        self._jacobian_avg += (1.0 - self._beta_1) * jacobian
+
+        self._squared_jacobian_avg *= self._beta_2
+        self._squared_jacobian_avg += (1.0 - self._beta_2) * (
+            jacobian * jacobian)
+
+        step_size = self._step_size * (
+            numpy.sqrt(1.0 - self._beta_2**self._iteration) /
+            (1.0 - self._beta_1**self._iteration))
+
+        denominator = numpy.sqrt(self._squared_jacobian_avg)
+        denominator += self._epsilon
+        return step_size * self._jacobian_avg / denominator
+
+
+CG_BETA_FORMULAS = ('fletcher_reeves', 'polak_ribiere', 'hestenes_stiefel')
+
+
+class ConjugateGradient(Optimizer):
+    """Nonlinear conjugate gradient optimizer.
+
+    p_k = -grad_f_k + beta_k p_{k-1}
+    where beta_k is given by beta_formula:
+    'fletcher_reeves': grad_f_k^T grad_f_k / grad_f_{k-1}^T grad_f_{k-1}
+    'polak_ribiere': max(0, grad_f_k^T y_k / grad_f_{k-1}^T grad_f_{k-1})
+    'hestenes_stiefel': max(0, grad_f_k^T y_k / y_k^T p_{k-1})
+    y_k = grad_f_k - grad_f_{k-1}
+
+    Ref: Numerical Optimization pp. 121
+
+    Only stores O(n) values, unlike quasi-Newton methods.
+
+    NOTE: Step size should satisfy strong Wolfe conditions,
+    with c_2 < 1/2 for Fletcher-Reeves,
+    to ensure each step direction is a descent direction.
+
+    Args:
+        beta_formula: 'fletcher_reeves', 'polak_ribiere', or 'hestenes_stiefel'.
+        iterations_per_restart: Restart with steepest descent every
+            iterations_per_restart iterations.
+            Defaults to number of parameters.
+        restart_threshold: Restart with steepest descent when
+            |grad_f_k^T grad_f_{k-1}| / grad_f_k^T grad_f_k
+            >= restart_threshold,
+            because successive gradients are far from orthogonal.
+            Ref: Numerical Optimization pp. 125
+    """
+
+    def __init__(self,
+                 step_size_getter=None,
+                 beta_formula='polak_ribiere',
+                 iterations_per_restart=None,
+                 restart_threshold=0.1):
+        super(ConjugateGradient, self).__init__()
+
+        if step_size_getter is None:
+            step_size_getter = WolfeLineSearch(
+                # Values recommended by Numerical Optimization 2nd, pp. 34
+                c_1=1e-4,
+                c_2=0.1,
+                initial_step_getter=FOChangeInitialStep())
+        self._step_size_getter = step_size_getter
+
+        if beta_formula not in CG_BETA_FORMULAS:
+            raise ValueError('beta_formula must be one of %s' %
+                             (CG_BETA_FORMULAS, ))
+        self._beta_formula = beta_formula
+
+        self._iterations_per_restart = iterations_per_restart
+        self._restart_threshold = restart_threshold
+
+        # CG Parameters
+        self._iteration = 0
+        self._prev_jacobian = None
+        self._prev_jac_dot_jac = None
+        self._prev_step_dir = None
+
+    def reset(self):
+        """Reset optimizer parameters."""
+        super(ConjugateGradient, self).reset()
+        self._step_size_getter.reset()
+
+        # Reset CG Parameters
+        self._iteration = 0
+        self._prev_jacobian = None
+        self._prev_jac_dot_jac = None
+        self._prev_step_dir = None
+
+    def next(self, problem, parameters):
+        """Return next iteration of this optimizer."""
+        obj_value, self.jacobian = problem.get_obj_jac(parameters)
+
+        step_dir = self._get_step_dir(self.jacobian)
+
+        step_size = self._step_size_getter(parameters, obj_value,
+                                           self.jacobian, step_dir, problem)
+
+        return obj_value, parameters + step_size * step_dir
+
+    def _get_step_dir(self, jacobian):
+        """Return conjugate step direction, and save values for next iteration."""
+        jac_dot_jac = jacobian.dot(jacobian)
+
+        iterations_per_restart = self._iterations_per_restart
+        if iterations_per_restart is None:
+            iterations_per_restart = jacobian.shape[0]
+
+        # Steepest descent on first iteration, and restarts
+        if (self._prev_step_dir is None
+                or self._iteration >= iterations_per_restart
+                or self._prev_jac_dot_jac == 0.0 or numpy.abs(
+                    jacobian.dot(self._prev_jacobian)) >=
+                self._restart_threshold * jac_dot_jac):
+            step_dir = -jacobian
+            self._iteration = 0
+        else:
+            beta = self._get_beta(jacobian, jac_dot_jac)
+
+            step_dir = beta * self._prev_step_dir - jacobian
+
+            # Failsafe if step direction is not a descent direction
+            # (can happen if step size does not satisfy strong Wolfe)
+            if step_dir.dot(jacobian) >= 0.0:
+                step_dir = -jacobian
+                self._iteration = 0
+
+        self._iteration += 1
+
+        # Save values from current iteration for next iteration
+        self._prev_jacobian = jacobian
+        self._prev_jac_dot_jac = jac_dot_jac
+        self._prev_step_dir = step_dir
+
+        return step_dir
+
+    def _get_beta(self, jacobian, jac_dot_jac):
+        """Return beta_k, for combining jacobian and previous step direction."""
+        if self._beta_formula == 'fletcher_reeves':
+            return jac_dot_jac / self._prev_jac_dot_jac
+
+        jac_dot_jac_diff = jac_dot_jac - jacobian.dot(self._prev_jacobian)
+        if self._beta_formula == 'polak_ribiere':
+            beta = jac_dot_jac_diff / self._prev_jac_dot_jac
+        else:  # hestenes_stiefel
+            # y_k^T p_{k-1} = grad_f_k^T p_{k-1} - grad_f_{k-1}^T p_{k-1}
+            denominator = (jacobian.dot(self._prev_step_dir) -
+                           self._prev_jacobian.dot(self._prev_step_dir))
+            if denominator == 0.0:
+                return 0.0
+            beta = jac_dot_jac_diff / denominator
+
+        # Negative beta can prevent convergence
+        # Ref: Numerical Optimization pp. 130
+        return max(0.0, beta)
+
+
 def initial_hessian_identity(param_diff, jacobian,
                              previous_jacobian):
     """Return identity matrix, regardless of arguments."""
@@ -253,7 +616,11 @@ class BFGS(Optimizer):
         return obj_value, parameters + self._prev_step
 
     def _get_approx_inv_hessian(self, jacobian):
-        """Calculate approx inv hessian for this iteration, and return it."""
+        """Calculate approx inv hessian for this iteration, and return it.
+
+        The approx inv hessian is updated in place,
+        so the returned matrix is overwritten on the next iteration.
+        """
         # If first iteration
         if self._prev_step is None:
             # Default to identity for approx inv hessian
@@ -264,17 +631,19 @@ class BFGS(Optimizer):
         else:
             # If second iteration
             if self._prev_inv_hessian is None:
-                H_kp1 = _bfgs_eq(
-                    self._initial_hessian_func(self._prev_step,
-                                               jacobian, self._prev_jacobian),
-                    self._prev_step,
-                    jacobian - self._prev_jacobian)
+                # Initial hessian is a new matrix,
+                # so we can update it in place
+                H_k = self._initial_hessian_func(
+                    self._prev_step, jacobian, self._prev_jacobian)
 
             # Every iteration > 2
             else:
-                H_kp1 = _bfgs_eq(self._prev_inv_hessian,
-                                 self._prev_step,
-                                 jacobian - self._prev_jacobian)
+                H_k = self._prev_inv_hessian
+
+            H_kp1 = _bfgs_eq(H_k,
+                             self._prev_step,
+                             jacobian - self._prev_jacobian,
+                             out=H_k)
 
             # Save inv hessian to update next iteration
             self._prev_inv_hessian = H_kp1
@@ -285,7 +654,11 @@ class BFGS(Optimizer):
         return H_kp1
 
 
-def _bfgs_eq(H_k, s_k, y_k):
+# Number of elements updated at once by _bfgs_eq
+_BFGS_UPDATE_BLOCK_SIZE = 2**16
+
+
+def _bfgs_eq(H_k, s_k, y_k, out=None):
     """Apply the bfgs update rule to obtain the next approx inverse hessian.
 
     H_{k+1} = (I - p_k s_k y_k^T) H_k (I - p_k y_k s_k^T) + p_k s_k s_k^T
@@ -298,44 +671,49 @@ def _bfgs_eq(H_k, s_k, y_k):
 
     Note that the current iteration is k+1, and k is the previous iteration.
     However s_k and y_k correspond to he current iteration (and previous).
-    """
-    # An implementation very close to the original, using matrices, and column matrices:
-    # I = numpy.matrix(I)
-
-    # H_k = numpy.matrix(H_k)
-    # s_k = numpy.matrix(s_k).T
-    # y_k = numpy.matrix(y_k).T
-
-    # p_k = float(1.0 / (y_k.T * s_k))
-
-    # p_k_times_s_k = p_k * s_k
-    # return numpy.array(
-    #     (I - p_k_times_s_k * y_k.T)
-    #     * H_k
-    #     * (I - p_k * y_k * s_k.T)
-    #     + (p_k_times_s_k * s_k.T)
-    # )
 
-    # More efficient implementation with arrays and fast [:, None] transposes
-    # Vectors are row vectors (1d, as given)
-    I = numpy.identity(s_k.shape[0])
+    Args:
+        out: If given, H_{k+1} is written into out, instead of a new matrix.
+            out may be H_k, to update H_k in place.
+    """
+    # Expanding the products gives an equivalent rank-2 update,
+    # which only requires O(n^2) time, instead of O(n^3):
+    # H_{k+1} = H_k - p_k (s_k (H_k y_k)^T + (H_k y_k) s_k^T)
+    #           + (p_k + p_k^2 y_k^T H_k y_k) s_k s_k^T
+    # Note that H_k is symmetric, so y_k^T H_k = (H_k y_k)^T
+    if out is None:
+        out = numpy.copy(H_k)
+    elif out is not H_k:
+        out[:] = H_k
 
     # Calculate p_k with failsafe for divide by zero errors
-    y_k_dot_s_k = y_k.dot(s_k)  # y_k.dot(s_k) == y_k.dot(s_k[:, None])
+    y_k_dot_s_k = y_k.dot(s_k)
     # Failsafe for divide by zero errors
     # y_k and s_k are change in jacobian and parameters respectively
     # If these values did not change, we can re-use previous inv hessian
     if y_k_dot_s_k == 0.0:
-        return H_k
+        return out
     p_k = 1.0 / y_k_dot_s_k
 
-    p_k_times_s_k = p_k * s_k
-    return (
-        (I - p_k_times_s_k[:, None] * y_k)
-        .dot(H_k)
-        .dot(I - (p_k * y_k)[:, None] * (s_k))
-        + (p_k_times_s_k[:, None] * s_k)
-    )
+    H_k_y_k = H_k.dot(y_k)
+    # H_{k+1} = H_k + s_k u^T + w s_k^T
+    u = (p_k + p_k * p_k * y_k.dot(H_k_y_k)) * s_k - p_k * H_k_y_k
+    w = -p_k * H_k_y_k
+
+    # Update a block of rows at a time,
+    # so no n x n temporary matrices are allocated
+    num_rows = max(1, _BFGS_UPDATE_BLOCK_SIZE // out.shape[1])
+    work = numpy.empty((min(num_rows, out.shape[0]), out.shape[1]))
+    for start in range(0, out.shape[0], num_rows):
+        out_block = out[start:start + num_rows]
+        work_block = work[:out_block.shape[0]]
+
+        numpy.multiply(s_k[start:start + num_rows, None], u, out=work_block)
+        out_block += work_block
+        numpy.multiply(w[start:start + num_rows, None], s_k, out=work_block)
+        out_block += work_block
+
+    return out
 
 
 def initial_hessian_one_scalar(param_diff, jac_diff):
@@ -362,6 +740,11 @@ def initial_hessian_gamma_scalar(param_diff, jac_diff):
         (param_diff.dot(jac_diff)) / jac_diff_dot_jac_diff)
 
 
+# Number of differences stored before growing history,
+# when LBFGS remembers unlimited iterations
+_LBFGS_INITIAL_CAPACITY = 16
+
+
 class LBFGS(Optimizer):
     """Low-memory quasi-Newton L-BFGS optimizer.
 
@@ -372,12 +755,21 @@ class LBFGS(Optimizer):
     to ensure curvature condition, y_k^T s_k > 0, is satisfied.
     Otherwise, the BFGS update rule is invalid, and could give
     poor performance.
+
+    Args:
+        compact_representation: Calculate step direction with the compact
+            representation of the approx inv hessian
+            (Numerical Optimization 2nd, pp. 181),
+            using a few matrix-vector products,
+            instead of the two-loop recursion.
+            Two-loop recursion is used when any y_k^T s_k == 0.
     """
 
     def __init__(self,
                  step_size_getter=None,
                  num_remembered_iterations=5,
-                 initial_hessian_scalar_func=initial_hessian_gamma_scalar):
+                 initial_hessian_scalar_func=initial_hessian_gamma_scalar,
+                 compact_representation=False):
         super(LBFGS, self).__init__()
 
         if step_size_getter is None:
@@ -392,12 +784,23 @@ class LBFGS(Optimizer):
 
         # L-BFGS Parameters
         self._num_remembered_iterations = num_remembered_iterations
+        self._compact_representation = compact_representation
 
         self._prev_step = None
         self._prev_jacobian = None
 
-        self._prev_param_diffs = []  # Previous s_k values
-        self._prev_jac_diffs = []  # Previous y_k values
+        # Previous s_k and y_k values are stored in rows of
+        # preallocated matrices, used as circular buffers
+        self._param_diffs = None  # Previous s_k values
+        self._jac_diffs = None  # Previous y_k values
+        self._rhos = None  # Previous 1 / (y_k^T s_k) values, 0 if undefined
+        self._num_diffs = 0
+        self._next_index = 0
+
+        # Inner products of stored differences, for compact representation
+        # Indexed by rows of _param_diffs and _jac_diffs
+        self._param_jac_dots = None  # s_i^T y_j
+        self._jac_jac_dots = None  # y_i^T y_j
 
     def reset(self):
         """Reset optimizer parameters."""
@@ -408,8 +811,14 @@ class LBFGS(Optimizer):
         self._prev_step = None
         self._prev_jacobian = None
 
-        self._prev_param_diffs = []  # Previous s_k values
-        self._prev_jac_diffs = []  # Previous y_k values
+        self._param_diffs = None
+        self._jac_diffs = None
+        self._rhos = None
+        self._num_diffs = 0
+        self._next_index = 0
+
+        self._param_jac_dots = None
+        self._jac_jac_dots = None
 
     def next(self, problem, parameters):
         """Return next iteration of this optimizer."""
@@ -419,7 +828,10 @@ class LBFGS(Optimizer):
         self._update_diffs(self.jacobian)
 
         # Approximate step direction, and update parameters
-        step_dir = self._lbfgs_step_dir(self.jacobian)
+        if self._compact_representation and self._rhos[:self._num_diffs].all():
+            step_dir = self._compact_step_dir(self.jacobian)
+        else:
+            step_dir = self._lbfgs_step_dir(self.jacobian)
 
         step_size = self._step_size_getter(parameters, obj_value,
                                            self.jacobian, step_dir, problem)
@@ -432,66 +844,183 @@ class LBFGS(Optimizer):
 
     def _update_diffs(self, jacobian):
         """Update stored differences."""
-        # Remove oldest, if over limit (after adding)
-        # Pop first to minimize how many elements are shifted
-        if len(self._prev_param_diffs) >= self._num_remembered_iterations:
-            self._prev_param_diffs.pop(0)
-            self._prev_jac_diffs.pop(0)
+        if self._param_diffs is None:
+            self._allocate_diffs(jacobian.shape[0])
 
-        # Add newest
+        # Add newest, overwriting oldest if over limit
         if self._prev_step is not None:
-            self._prev_param_diffs.append(self._prev_step)
-            self._prev_jac_diffs.append(jacobian - self._prev_jacobian)
+            if (self._num_diffs == self._param_diffs.shape[0]
+                    and self._num_diffs < self._num_remembered_iterations):
+                self._grow_diffs()
+
+            index = self._next_index
+            param_diff = self._param_diffs[index]
+            jac_diff = self._jac_diffs[index]
+
+            param_diff[:] = self._prev_step
+            numpy.subtract(jacobian, self._prev_jacobian, out=jac_diff)
+
+            # rho = 1 / (y_k^T s_k)
+            # y_k^T s_k == 0 is common for non-smooth gradients
+            # Store 0, to skip this difference, and avoid divide by 0
+            jac_diff_dot_param_diff = jac_diff.dot(param_diff)
+            if jac_diff_dot_param_diff != 0:
+                self._rhos[index] = 1.0 / jac_diff_dot_param_diff
+            else:
+                self._rhos[index] = 0.0
+
+            self._next_index = (index + 1) % self._param_diffs.shape[0]
+            self._num_diffs = min(self._num_diffs + 1,
+                                  self._param_diffs.shape[0])
 
-        assert len(self._prev_param_diffs) <= self._num_remembered_iterations
-        assert len(self._prev_param_diffs) == len(self._prev_jac_diffs)
+            if self._compact_representation:
+                self._update_dots(index)
+
+        assert self._num_diffs <= self._num_remembered_iterations
 
         # Store jacobian, for next _update_diffs
         self._prev_jacobian = jacobian
 
+    def _allocate_diffs(self, num_parameters):
+        """Allocate matrices for stored differences."""
+        if self._num_remembered_iterations == float('inf'):
+            capacity = _LBFGS_INITIAL_CAPACITY
+        else:
+            capacity = int(self._num_remembered_iterations)
+
+        self._param_diffs = numpy.zeros((capacity, num_parameters))
+        self._jac_diffs = numpy.zeros((capacity, num_parameters))
+        self._rhos = numpy.zeros(capacity)
+
+        if self._compact_representation:
+            self._param_jac_dots = numpy.zeros((capacity, capacity))
+            self._jac_jac_dots = numpy.zeros((capacity, capacity))
+
+    def _grow_diffs(self):
+        """Increase number of stored differences.
+
+        Only called when full, before any difference is overwritten,
+        so differences are in order from oldest to newest.
+        """
+        capacity = self._param_diffs.shape[0]
+        new_capacity = int(min(2 * capacity, self._num_remembered_iterations))
+
+        self._param_diffs = _grow_rows(self._param_diffs, new_capacity)
+        self._jac_diffs = _grow_rows(self._jac_diffs, new_capacity)
+        self._rhos = _grow_rows(self._rhos, new_capacity)
+
+        if self._compact_representation:
+            self._param_jac_dots = _grow_rows(
+                _grow_rows(self._param_jac_dots, new_capacity).T,
+                new_capacity).T
+            self._jac_jac_dots = _grow_rows(
+                _grow_rows(self._jac_jac_dots, new_capacity).T,
+                new_capacity).T
+
+        self._next_index = capacity
+
+    def _update_dots(self, index):
+        """Update inner products with the difference at index."""
+        param_diffs = self._param_diffs[:self._num_diffs]
+        jac_diffs = self._jac_diffs[:self._num_diffs]
+
+        # s_index^T y_j, and s_j^T y_index
+        self._param_jac_dots[index, :self._num_diffs] = jac_diffs.dot(
+            self._param_diffs[index])
+        self._param_jac_dots[:self._num_diffs, index] = param_diffs.dot(
+            self._jac_diffs[index])
+
+        # y_index^T y_j
+        self._jac_jac_dots[index, :self._num_diffs] = jac_diffs.dot(
+            self._jac_diffs[index])
+        self._jac_jac_dots[:self._num_diffs, index] = self._jac_jac_dots[
+            index, :self._num_diffs]
+
+    def _ordered_indices(self):
+        """Return indices of stored differences, from oldest to newest."""
+        # Before the buffer is full, _next_index == _num_diffs,
+        # and differences are stored in order
+        return (self._next_index + numpy.arange(self._num_diffs)) % max(
+            self._num_diffs, 1)
+
     def _lbfgs_step_dir(self, jacobian):
         """Return step_dir, approximated from previous param and jac differences."""
         newton_grad = numpy.copy(jacobian)
 
+        indices = self._ordered_indices()
+        alphas = numpy.zeros(self._num_diffs)
+
         # First pass, backwards pass (from newest to oldest)
         # rho = 1 / (y_k^T s_k), where y_k^T = jac_diff, and s_k = param_diff
-        rhos = []
-        alphas = []  # rho_i s_i^T q
-        for param_diff, jac_diff in reversed(
-                zip(self._prev_param_diffs, self._prev_jac_diffs)):
+        # rho == 0 skips a difference, to avoid divide by 0
+        for i in reversed(range(self._num_diffs)):
+            index = indices[i]
             # alpha_i <- rho_i s_i^T q, where q = newton_grad
             # q <- q - alpha_i y_i
-            rho = jac_diff.dot(param_diff)
-            if rho != 0:
-                alpha = param_diff.dot(newton_grad) / rho
-                newton_grad -= alpha * jac_diff
-            else:  # rho == 0. Common for non-smooth gradients
-                # Skip to avoid divide by 0
-                alpha = None
-
-            # Save rho and alpha, for second pass
-            # Lists will be revered later (more efficient than insert 0)
-            rhos.append(rho)
-            alphas.append(alpha)
-        # Reverse new lists so ordered from oldest to newest
-        rhos = reversed(rhos)
-        alphas = reversed(alphas)
+            alphas[i] = self._rhos[index] * self._param_diffs[index].dot(
+                newton_grad)
+            newton_grad -= alphas[i] * self._jac_diffs[index]
 
         # Second pass, forwards pass (from oldest to newest)
         newton_grad *= self._initial_inv_hessian_scalar()
-        for param_diff, jac_diff, rho, alpha in zip(
-                self._prev_param_diffs, self._prev_jac_diffs, rhos, alphas):
+        for i in range(self._num_diffs):
+            index = indices[i]
             # beta <- rho_i y_i^T r, where r = newton_grad
             # r <- r + s_i (alpha_i - beta)
-            if rho != 0:
-                newton_grad += param_diff * (
-                    alpha - jac_diff.dot(newton_grad) / rho)
-            # else
-            #   Skip to avoid divide by 0
+            newton_grad += self._param_diffs[index] * (
+                alphas[i] -
+                self._rhos[index] * self._jac_diffs[index].dot(newton_grad))
 
-            # Step direction is down the gradient
+        # Step direction is down the gradient
         return -newton_grad
 
+    def _compact_step_dir(self, jacobian):
+        """Return step_dir, using compact representation of approx inv hessian.
+
+        H_k = gamma I + [S_k gamma Y_k] M [S_k^T; gamma Y_k^T]
+        where
+        M = [[R_k^-T (D_k + gamma Y_k^T Y_k) R_k^-1, -R_k^-T], [-R_k^-1, 0]]
+        S_k, Y_k = matrices of s_i and y_i columns, from oldest to newest
+        R_k = upper triangle of S_k^T Y_k
+        D_k = diagonal of S_k^T Y_k
+
+        Ref: Numerical Optimization 2nd pp. 181
+        """
+        gamma = self._initial_inv_hessian_scalar()
+        if self._num_diffs == 0:
+            return -gamma * jacobian
+
+        indices = self._ordered_indices()
+        index_grid = numpy.ix_(indices, indices)
+        param_jac_dots = self._param_jac_dots[index_grid]
+        R_k = numpy.triu(param_jac_dots)
+
+        # Inner products with jacobian, in order from oldest to newest
+        param_diffs = self._param_diffs[:self._num_diffs]
+        jac_diffs = self._jac_diffs[:self._num_diffs]
+        param_diffs_dot_jac = param_diffs.dot(jacobian)[indices]
+        jac_diffs_dot_jac = jac_diffs.dot(jacobian)[indices]
+
+        # H_k g = gamma g + S_k p + gamma Y_k q
+        # where
+        # q = -R_k^-1 S_k^T g
+        # p = R_k^-T ((D_k + gamma Y_k^T Y_k) R_k^-1 S_k^T g - gamma Y_k^T g)
+        R_inv_dot = numpy.linalg.solve(R_k, param_diffs_dot_jac)
+        p = numpy.linalg.solve(
+            R_k.T, (numpy.diag(param_jac_dots) * R_inv_dot +
+                    gamma * self._jac_jac_dots[index_grid].dot(R_inv_dot) -
+                    gamma * jac_diffs_dot_jac))
+
+        # Re-order coefficients to match stored differences
+        p_coefficients = numpy.empty(self._num_diffs)
+        p_coefficients[indices] = p
+        q_coefficients = numpy.empty(self._num_diffs)
+        q_coefficients[indices] = -gamma * R_inv_dot
+
+        # Step direction is down the gradient
+        return -(gamma * jacobian + p_coefficients.dot(param_diffs) +
+                 q_coefficients.dot(jac_diffs))
+
     def _initial_inv_hessian_scalar(self):
         """Return scalar of identity matrix, for initial approximate inv-hessian.
 
@@ -501,8 +1030,381 @@ class LBFGS(Optimizer):
         without requiring the allocation and calculation of a full matrix.
         """
         # Handle first iteration (when no previous diffs)
-        if len(self._prev_param_diffs) == 0:
+        if self._num_diffs == 0:
             return 1.0
         else:
-            return self._initial_hessian_scalar_func(self._prev_param_diffs[0],
-                                                     self._prev_jac_diffs[0])
+            oldest_index = self._ordered_indices()[0]
+            return self._initial_hessian_scalar_func(
+                self._param_diffs[oldest_index], self._jac_diffs[oldest_index])
+
+
+class Newton(Optimizer):
+    """Newton optimizer, using a full hessian for Newton step.
+
+    Newton equations, H_k p_k = -grad_f_k, are solved with a
+    cholesky factorization of H_k, from problem.get_hess.
+    If H_k is not positive definite, steepest descent is used for that step.
+
+    Iteratively reweighted least squares (IRLS) for logistic regression
+    is Newton's method, with exact hessian X^T S X.
+
+    Each iteration takes O(n^3) time and O(n^2) memory,
+    for n parameters. See NewtonCG when n is large.
+
+    Ref: Numerical Optimization pp. 44
+    """
+
+    def __init__(self, step_size_getter=None):
+        super(Newton, self).__init__()
+
+        if step_size_getter is None:
+            step_size_getter = WolfeLineSearch(
+                # Values recommended by Numerical Optimization 2nd, pp. 161
+                c_1=1e-4,
+                c_2=0.9,
+                # Newton step size of 1 will eventually always be accepted
+                initial_step_getter=IncrPrevStep())
+        self._step_size_getter = step_size_getter
+
+    def reset(self):
+        """Reset optimizer parameters."""
+        super(Newton, self).reset()
+        self._step_size_getter.reset()
+
+    def next(self, problem, parameters):
+        """Return next iteration of this optimizer."""
+        obj_value, self.jacobian = problem.get_obj_jac(parameters)
+
+        step_dir = self._get_step_dir(problem, parameters, self.jacobian)
+
+        step_size = self._step_size_getter(parameters, obj_value,
+                                           self.jacobian, step_dir, problem)
+
+        return obj_value, parameters + step_size * step_dir
+
+    def _get_step_dir(self, problem, parameters, jacobian):
+        """Return solution to H_k p_k = -grad_f_k."""
+        hessian = problem.get_hess(parameters)
+        if hessian is None:
+            raise ValueError('Newton requires problem with hessian')
+
+        try:
+            # Cholesky fails if H_k is not positive definite
+            lower = numpy.linalg.cholesky(hessian)
+        except numpy.linalg.LinAlgError:
+            # Default to steepest descent
+            return -jacobian
+
+        return numpy.linalg.solve(lower.T, numpy.linalg.solve(lower, -jacobian))
+
+
+class NewtonCG(Newton):
+    """Truncated Newton optimizer, using conjugate gradient for Newton step.
+
+    Newton equations, H_k p_k = -grad_f_k, are approximately solved
+    with conjugate gradient, which only requires products of H_k
+    and vectors (from problem.get_hess_vec),
+    so a full hessian is never calculated or stored.
+
+    Conjugate gradient ends when residual is small relative to grad_f_k,
+    or when negative curvature is found.
+
+    Ref: Numerical Optimization pp. 168 (Line Search Newton-CG)
+
+    Args:
+        max_cg_iterations: Maximum conjugate gradient iterations
+            per Newton step. Defaults to number of parameters.
+    """
+
+    def __init__(self, step_size_getter=None, max_cg_iterations=None):
+        super(NewtonCG, self).__init__(step_size_getter)
+
+        self._max_cg_iterations = max_cg_iterations
+
+    def _get_step_dir(self, problem, parameters, jacobian):
+        """Return approximate solution to H_k p_k = -grad_f_k."""
+        max_cg_iterations = self._max_cg_iterations
+        if max_cg_iterations is None:
+            max_cg_iterations = jacobian.shape[0]
+
+        step_dir = _truncated_cg(
+            functools.partial(problem.get_hess_vec, parameters), jacobian,
+            max_cg_iterations)
+
+        if step_dir is None:
+            # Default to steepest descent
+            return -jacobian
+        return step_dir
+
+
+class LevenbergMarquardt(Optimizer):
+    """Levenberg-Marquardt optimizer, for least squares objectives.
+
+    Each iteration solves damped Gauss-Newton equations,
+    (G_k + lambda I) p_k = -grad_f_k,
+    where G_k = 2 J_k^T J_k is the Gauss-Newton hessian of f = ||r||^2,
+    and J_k is the jacobian of residuals r, with regard to parameters.
+    Steps that do not decrease the objective are rejected,
+    and lambda is increased, until a step is accepted.
+    lambda is decreased after an accepted step.
+
+    J_k is given by problem.get_residual_jac.
+    G_k is formed and factored directly when J_k is given,
+    and number of parameters is at most max_dense_parameters.
+    Otherwise, equations are solved with conjugate gradient,
+    using products of G_k and vectors from problem.get_hess_vec,
+    so J_k and G_k are never formed.
+
+    Ref: Numerical Optimization pp. 258
+
+    Args:
+        initial_damping: Initial lambda.
+        damping_increase: Multiply lambda by this, after a rejected step.
+        damping_decrease: Multiply lambda by this, after an accepted step.
+        max_damping_increases: Maximum rejected steps per iteration.
+            If reached, parameters are not changed this iteration.
+        max_dense_parameters: Solve with conjugate gradient when
+            number of parameters is larger.
+        max_cg_iterations: Maximum conjugate gradient iterations,
+            per step. Defaults to number of parameters.
+    """
+
+    def __init__(self,
+                 initial_damping=1e-3,
+                 damping_increase=10.0,
+                 damping_decrease=0.1,
+                 max_damping_increases=20,
+                 max_dense_parameters=2000,
+                 max_cg_iterations=None):
+        super(LevenbergMarquardt, self).__init__()
+
+        if damping_increase <= 1.0:
+            raise ValueError('damping_increase must be > 1')
+        if not 0.0 < damping_decrease < 1.0:
+            raise ValueError('damping_decrease must be in (0, 1)')
+
+        self._initial_damping = initial_damping
+        self._damping_increase = damping_increase
+        self._damping_decrease = damping_decrease
+        self._max_damping_increases = max_damping_increases
+        self._max_dense_parameters = max_dense_parameters
+        self._max_cg_iterations = max_cg_iterations
+
+        # LM Parameters
+        self._damping = initial_damping
+
+    def reset(self):
+        """Reset optimizer parameters."""
+        super(LevenbergMarquardt, self).reset()
+
+        # Reset LM Parameters
+        self._damping = self._initial_damping
+
+    def next(self, problem, parameters):
+        """Return next iteration of this optimizer."""
+        obj_value, self.jacobian = problem.get_obj_jac(parameters)
+        # Copy, because problem may re-use jacobian buffer
+        # while evaluating trial steps
+        self.jacobian = numpy.copy(self.jacobian)
+
+        gauss_newton_hessian = None
+        if parameters.shape[0] <= self._max_dense_parameters:
+            residual_jacobian = problem.get_residual_jac(parameters)
+            if residual_jacobian is not None:
+                gauss_newton_hessian = 2.0 * residual_jacobian.T.dot(
+                    residual_jacobian)
+
+        for _ in range(self._max_damping_increases):
+            if gauss_newton_hessian is not None:
+                try:
+                    step = self._dense_step(gauss_newton_hessian)
+                except numpy.linalg.LinAlgError:
+                    # Singular, increase damping and try again
+                    self._damping *= self._damping_increase
+                    continue
+            else:
+                step = self._cg_step(problem, parameters)
+
+            next_parameters = parameters + step
+            # Objective and jacobian, so an EvaluationCache
+            # can re-use them next iteration
+            next_obj_value, _ = problem.get_obj_jac(next_parameters)
+
+            if next_obj_value < obj_value:
+                # Accept step, and move towards Gauss-Newton
+                self._damping *= self._damping_decrease
+                return obj_value, next_parameters
+
+            # Reject step, and move towards steepest descent
+            self._damping *= self._damping_increase
+
+        # No step decreased objective
+        return obj_value, parameters
+
+    def _dense_step(self, gauss_newton_hessian):
+        """Return step, solving damped equations with formed G_k."""
+        damped_hessian = numpy.copy(gauss_newton_hessian)
+        damped_hessian.flat[::damped_hessian.shape[0] + 1] += self._damping
+        return numpy.linalg.solve(damped_hessian, -self.jacobian)
+
+    def _cg_step(self, problem, parameters):
+        """Return step, solving damped equations with conjugate gradient."""
+        max_cg_iterations = self._max_cg_iterations
+        if max_cg_iterations is None:
+            max_cg_iterations = parameters.shape[0]
+
+        damping = self._damping
+        step = _truncated_cg(
+            lambda vec: problem.get_hess_vec(parameters, vec) + damping * vec,
+            self.jacobian, max_cg_iterations)
+
+        if step is None:
+            # Failsafe if hessian vector product is not positive definite
+            return -self.jacobian / damping
+        return step
+
+
+class FISTA(Optimizer):
+    """Accelerated proximal gradient optimizer, with backtracking.
+
+    For objectives f + g, where f is smooth,
+    and g is nonsmooth, with an inexpensive proximal operator,
+    such as an L1 penalty.
+    Each iteration takes a gradient step on f, from an extrapolated point,
+    followed by the proximal operator of g (problem.get_prox),
+    so g never needs a derivative.
+    For L1 penalties, prox is soft thresholding,
+    which sets small weights to exactly 0.
+
+    Step size is 1 / L, where L is increased until
+    a quadratic upper bound on f holds.
+    Momentum is restarted when it moves away from the proximal step.
+
+    Also known as Fast Iterative Shrinkage-Thresholding Algorithm.
+    Ref: Beck and Teboulle (2009), A Fast Iterative Shrinkage-Thresholding
+    Algorithm for Linear Inverse Problems.
+    Ref: O'Donoghue and Candes (2015), Adaptive Restart for
+    Accelerated Gradient Schemes.
+
+    Args:
+        initial_lipschitz: Initial estimate of L,
+            the lipschitz constant of jacobian of f.
+        lipschitz_increase: Multiply L by this, until bound holds.
+    """
+    uses_prox = True
+
+    def __init__(self, initial_lipschitz=1.0, lipschitz_increase=2.0):
+        super(FISTA, self).__init__()
+
+        if lipschitz_increase <= 1.0:
+            raise ValueError('lipschitz_increase must be > 1')
+
+        self._initial_lipschitz = initial_lipschitz
+        self._lipschitz_increase = lipschitz_increase
+
+        # FISTA Parameters
+        self._lipschitz = initial_lipschitz
+        self._momentum = 1.0
+        self._prev_params = None
+
+    def reset(self):
+        """Reset optimizer parameters."""
+        super(FISTA, self).reset()
+
+        # Reset FISTA Parameters
+        self._lipschitz = self._initial_lipschitz
+        self._momentum = 1.0
+        self._prev_params = None
+
+    def next(self, problem, parameters):
+        """Return next iteration of this optimizer."""
+        obj_value = problem.get_obj(parameters) + problem.get_nonsmooth_obj(
+            parameters)
+
+        # Extrapolate from previous iterations
+        next_momentum = (1.0 + numpy.sqrt(1.0 + 4.0 * self._momentum**2)) / 2.0
+        if self._prev_params is None:
+            extrapolated = parameters
+        else:
+            extrapolated = parameters + (
+                (self._momentum - 1.0) / next_momentum) * (
+                    parameters - self._prev_params)
+
+        # Proximal gradient step, with backtracking
+        extrapolated_obj, extrapolated_jac = problem.get_obj_jac(extrapolated)
+        # Copy, because problem may re-use jacobian buffer
+        extrapolated_jac = numpy.copy(extrapolated_jac)
+        while True:
+            next_parameters = problem.get_prox(
+                extrapolated - extrapolated_jac / self._lipschitz,
+                1.0 / self._lipschitz)
+            step = next_parameters - extrapolated
+            if (problem.get_obj(next_parameters) <=
+                    extrapolated_obj + extrapolated_jac.dot(step) +
+                    0.5 * self._lipschitz * step.dot(step)):
+                break
+            self._lipschitz *= self._lipschitz_increase
+
+        # Gradient mapping, 0 at a minimum of f + g, like jacobian of f
+        self.jacobian = -self._lipschitz * step
+
+        # Restart momentum if it opposes proximal step
+        if self.jacobian.dot(next_parameters - parameters) > 0.0:
+            next_momentum = 1.0
+
+        self._momentum = next_momentum
+        self._prev_params = parameters
+        return obj_value, next_parameters
+
+
+def _truncated_cg(hess_vec_func, jacobian, max_iterations):
+    """Return approximate solution to H p = -jacobian, with conjugate gradient.
+
+    Iterations end when residual is small relative to jacobian,
+    or when negative curvature is found.
+    Returns None if negative curvature is found on the first iteration.
+
+    Ref: Numerical Optimization pp. 169 (Algorithm 7.1)
+    """
+    # Forcing sequence, for superlinear convergence
+    jacobian_norm = numpy.linalg.norm(jacobian)
+    tolerance = min(0.5, numpy.sqrt(jacobian_norm)) * jacobian_norm
+
+    # z = approximate step, r = residual, d = conjugate direction
+    step_dir = numpy.zeros(jacobian.shape)
+    residual = numpy.copy(jacobian)
+    conj_dir = -residual
+    residual_dot_residual = residual.dot(residual)
+    for i in range(max_iterations):
+        if numpy.sqrt(residual_dot_residual) <= tolerance:
+            break
+
+        hess_dot_conj_dir = hess_vec_func(conj_dir)
+        curvature = conj_dir.dot(hess_dot_conj_dir)
+        if curvature <= 0.0:
+            # Negative curvature, H is not positive definite
+            if i == 0:
+                return None
+            break
+
+        alpha = residual_dot_residual / curvature
+        step_dir += alpha * conj_dir
+        residual += alpha * hess_dot_conj_dir
+
+        prev_residual_dot_residual = residual_dot_residual
+        residual_dot_residual = residual.dot(residual)
+
+        conj_dir *= residual_dot_residual / prev_residual_dot_residual
+        conj_dir -= residual
+
+    if not step_dir.any():
+        # No step was taken
+        return None
+    return step_dir
+
+
+def _grow_rows(array, num_rows):
+    """Return copy of array, with zero rows added to total num_rows."""
+    new_array = numpy.zeros((num_rows, ) + array.shape[1:])
+    new_array[:array.shape[0]] = array
+    return new_array
@@ -25,6 +25,9 @@
 
 import functools
 import operator
+import collections
+
+import numpy
 
 
 ############################
@@ -46,6 +49,35 @@ class Problem(object):
 
         obj_jac_hess: obj_jac_hess_func, (obj_jac_func, hess), (obj_hess_func, jac),
             (obj, jac_hess_func), (obj, jac, hess)
+
+        hess_vec: hess_vec_func, hess.dot(vector), finite difference of jac
+        residual_jac: residual_jac_func
+        prox: prox_func, identity
+        nonsmooth_obj: nonsmooth_obj_func, 0
+
+    Args:
+        hess_vec_func: Function taking parameters and a vector,
+            and returning the product of the hessian (or an approximation)
+            at parameters, and vector.
+            Allows optimizers to use second order information,
+            without calculating a full hessian.
+        residual_jac_func: Function taking parameters, and returning
+            jacobian of residuals r, with regard to parameters,
+            for least squares objectives of the form ||r||^2.
+            Each row of the returned matrix is the derivative of one residual.
+            May return None, if objective is not least squares.
+        prox_func: Function taking parameters and a step size t, and returning
+            proximal operator of nonsmooth objective g,
+            argmin_x g(x) + ||x - parameters||^2 / (2 t).
+            When given, obj and jac are of smooth objective f,
+            and overall objective is f + g.
+        nonsmooth_obj_func: Function taking parameters, and returning
+            value of nonsmooth objective g.
+        cache: EvaluationCache; Optional. If given, obj, jac, and obj_jac
+            values are cached by parameters, and re-used when the same
+            parameters are evaluated again.
+            The same cache can be given to multiple Problem instances
+            for the same objective.
     """
 
     def __init__(self,
@@ -55,7 +87,12 @@ class Problem(object):
                  obj_jac_func=None,
                  obj_hess_func=None,
                  jac_hess_func=None,
-                 obj_jac_hess_func=None):
+                 obj_jac_hess_func=None,
+                 hess_vec_func=None,
+                 residual_jac_func=None,
+                 prox_func=None,
+                 nonsmooth_obj_func=None,
+                 cache=None):
         # Get objective function
         if obj_func is not None:
             self.get_obj = obj_func
@@ -149,6 +186,216 @@ class Problem(object):
             self.get_obj_jac_hess = functools.partial(
                 _bundle, (self.get_obj, self.get_jac, self.get_hess))
 
+        # Check cache before calculating values
+        # NOTE: Hessian values are not cached
+        if cache is not None:
+            self.get_obj = functools.partial(cache.get_obj, self.get_obj)
+            self.get_jac = functools.partial(cache.get_jac, self.get_jac)
+            self.get_obj_jac = functools.partial(cache.get_obj_jac,
+                                                 self.get_obj_jac)
+
+        # Get residual jacobian function
+        if residual_jac_func is not None:
+            self.get_residual_jac = residual_jac_func
+        else:
+            self.get_residual_jac = _return_none
+
+        # Get proximal operator, and nonsmooth objective function
+        # Without a nonsmooth objective, g(x) = 0, and prox is identity
+        if prox_func is not None:
+            self.get_prox = prox_func
+        else:
+            self.get_prox = _return_parameters
+        if nonsmooth_obj_func is not None:
+            self.get_nonsmooth_obj = nonsmooth_obj_func
+        else:
+            self.get_nonsmooth_obj = _return_zero
+
+        # Get hessian vector product function
+        if hess_vec_func is not None:
+            self.get_hess_vec = hess_vec_func
+        elif self.get_hess is not _return_none:
+            self.get_hess_vec = functools.partial(_hess_dot, self.get_hess)
+        else:
+            self.get_hess_vec = functools.partial(_finite_difference_hess_vec,
+                                                  self.get_jac)
+
+
+class EvaluationCache(object):
+    """Bounded cache of objective values and jacobians, keyed by parameters.
+
+    Optimizers often evaluate the same parameters more than once,
+    such as when the step size accepted by a line search is evaluated
+    again at the start of the next iteration.
+    Give to Problem to re-use these values.
+
+    Cached values are only valid for the objective they were calculated on.
+    Call check_objective, with the arguments that define the objective
+    (such as a dataset), or clear, whenever the objective may have changed.
+
+    Jacobians are copied when stored, so functions may re-use
+    a jacobian buffer between calls.
+    NOTE: Cached jacobians are returned directly, and should not be
+    modified in place.
+
+    Args:
+        max_size: int; Maximum number of parameter vectors to remember.
+            Least recently used values are discarded first.
+    """
+
+    def __init__(self, max_size=4):
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+        self.max_size = max_size
+
+        # Bookkeeping
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()  # key -> [obj, jac]
+        self._objective_args = None
+
+    def reset(self):
+        """Clear cache and counters."""
+        self.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """Discard all cached values."""
+        self._entries.clear()
+        self._objective_args = None
+
+    def check_objective(self, *objective_args):
+        """Clear cache if objective_args are not the objects given in the previous call.
+
+        Objects are compared by identity, not value.
+        """
+        if (self._objective_args is None
+                or len(objective_args) != len(self._objective_args) or any(
+                    arg is not prev_arg for arg, prev_arg in zip(
+                        objective_args, self._objective_args))):
+            self.clear()
+            self._objective_args = objective_args
+
+    def get_obj(self, obj_func, parameters):
+        """Return cached objective value, or obj_func(parameters)."""
+        key = _parameters_key(parameters)
+        entry = self._lookup(key, 0)
+        if entry is not None:
+            return entry[0]
+
+        obj_value = obj_func(parameters)
+        self._store(key, obj_value, None)
+        return obj_value
+
+    def get_jac(self, jac_func, parameters):
+        """Return cached jacobian, or jac_func(parameters)."""
+        key = _parameters_key(parameters)
+        entry = self._lookup(key, 1)
+        if entry is not None:
+            return entry[1]
+
+        # Return stored copy, in case jac_func re-uses its jacobian buffer
+        return self._store(key, None, jac_func(parameters))[1]
+
+    def get_obj_jac(self, obj_jac_func, parameters):
+        """Return cached objective value and jacobian, or obj_jac_func(parameters)."""
+        key = _parameters_key(parameters)
+        entry = self._lookup(key, 0, 1)
+        if entry is not None:
+            return entry[0], entry[1]
+
+        # Return stored copy, in case obj_jac_func re-uses its jacobian buffer
+        entry = self._store(key, *obj_jac_func(parameters))
+        return entry[0], entry[1]
+
+    def _lookup(self, key, *indices):
+        """Return entry for key, if it has values at all indices, and count hit or miss."""
+        try:
+            entry = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        if any(entry[i] is None for i in indices):
+            self.misses += 1
+            return None
+
+        # Move to end, so least recently used is discarded first
+        del self._entries[key]
+        self._entries[key] = entry
+
+        self.hits += 1
+        return entry
+
+    def _store(self, key, obj_value, jacobian):
+        """Add values to cache, discarding least recently used if full.
+
+        Return entry for key.
+        """
+        if jacobian is not None:
+            # Copy, because models may re-use jacobian buffers
+            jacobian = numpy.copy(jacobian)
+
+        try:
+            entry = self._entries.pop(key)
+        except KeyError:
+            entry = [None, None]
+            if len(self._entries) >= self.max_size:
+                self._entries.popitem(last=False)
+
+        if obj_value is not None:
+            entry[0] = obj_value
+        if jacobian is not None:
+            entry[1] = jacobian
+        self._entries[key] = entry
+
+        return entry
+
+    def __getstate__(self):
+        """Return state for pickle, without cached values.
+
+        Cached values are large, and only valid for the current objective.
+        """
+        state = self.__dict__.copy()
+        state['_entries'] = collections.OrderedDict()
+        state['_objective_args'] = None
+        return state
+
+
+def _parameters_key(parameters):
+    """Return hashable key for parameter vector.
+
+    Bytes of parameters are used, so only exactly equal parameters match.
+    """
+    parameters = numpy.asarray(parameters)
+    return parameters.dtype.str, parameters.shape, parameters.tobytes()
+
+
+def _hess_dot(hess_func, parameters, vector):
+    """Return hessian at parameters, dot vector."""
+    return hess_func(parameters).dot(vector)
+
+
+def _finite_difference_hess_vec(jac_func, parameters, vector):
+    """Return approximate product of hessian at parameters, and vector.
+
+    H v ~= (jac(x + epsilon v) - jac(x)) / epsilon
+    """
+    vector_norm = numpy.linalg.norm(vector)
+    if vector_norm == 0.0:
+        return numpy.zeros(vector.shape)
+
+    # sqrt(u) is theoretically optimal for forward difference,
+    # scaled by magnitude of parameters and vector
+    # ~Numerical Optimization 2nd, pp. 196-197, 170
+    epsilon = (1.1e-16**0.5) * (1.0 + numpy.linalg.norm(parameters)) / vector_norm
+
+    # Copy, in case jac_func re-uses its jacobian buffer
+    jacobian = numpy.copy(jac_func(parameters))
+    return (jac_func(parameters + epsilon * vector) - jacobian) / epsilon
+
 
 def _call_return_indices(func, indices, *args, **kwargs):
     """Return indices of func called with *args and **kwargs.
@@ -190,3 +437,13 @@ def _tuple_result(func, *args, **kwargs):
 def _return_none(*args, **kwargs):
     """Return None."""
     return None
+
+
+def _return_zero(*args, **kwargs):
+    """Return 0."""
+    return 0.0
+
+
+def _return_parameters(parameters, *args, **kwargs):
+    """Return parameters unchanged."""
+    return parameters
@@ -0,0 +1,271 @@
+###############################################################################
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Justin Lovinger
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+"""Helpers for running work in a pool of processes."""
+
+import copy
+import random
+import ctypes
+import multiprocessing
+
+import numpy
+
+
+def num_processes(n_jobs):
+    """Return number of processes for given n_jobs.
+
+    n_jobs < 0 counts back from number of cpus, so -1 uses all cpus.
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(multiprocessing.cpu_count() + 1 + n_jobs, 1)
+    if n_jobs == 0:
+        raise ValueError('n_jobs must not be 0')
+    return n_jobs
+
+
+def shared_array(array):
+    """Return copy of array, in memory shared with child processes.
+
+    Child processes forked after this call read the same memory,
+    instead of receiving a pickled copy.
+    """
+    array = numpy.asarray(array)
+    raw_array = multiprocessing.RawArray(ctypes.c_char, max(array.nbytes, 1))
+    shared = numpy.frombuffer(
+        raw_array, dtype=array.dtype, count=array.size).reshape(array.shape)
+    shared[...] = array
+    return shared
+
+
+class DataParallelObjective(object):
+    """Objective of a model, evaluated on row shards of a dataset, in parallel.
+
+    Dataset is copied into shared memory once,
+    and a pool of processes is kept until close is called.
+    Each process evaluates model._get_obj or model._get_obj_jac
+    on its shard, with the same code used without parallelism,
+    and shard results are combined in this process.
+
+    Objective must be a mean over samples,
+    so the overall objective is a weighted mean of shard objectives.
+
+    Args:
+        model: Model with _get_obj and _get_obj_jac helper functions,
+            taking (parameter_vec, input_matrix, target_matrix).
+        input_matrix: A matrix with samples in rows and attributes in columns.
+        target_matrix: A matrix with samples in rows and target values in columns.
+        processes: Number of processes, and shards.
+    """
+
+    def __init__(self, model, input_matrix, target_matrix, processes):
+        self.input_matrix = input_matrix
+        self.target_matrix = target_matrix
+
+        # Contiguous row ranges, as even as possible
+        num_samples = len(input_matrix)
+        boundaries = numpy.linspace(
+            0, num_samples, min(processes, num_samples) + 1).astype(int)
+        self._shards = zip(boundaries[:-1], boundaries[1:])
+        self._shard_weights = numpy.diff(boundaries) / float(num_samples)
+
+        self._pool = multiprocessing.Pool(
+            len(self._shards),
+            initializer=_init_worker,
+            initargs=(model, shared_array(input_matrix),
+                      shared_array(target_matrix)))
+
+    def get_obj(self, parameter_vec):
+        """Return objective value at parameter_vec."""
+        shard_objs = self._pool.map(_worker_obj, [
+            (parameter_vec, start, stop) for start, stop in self._shards
+        ])
+        return numpy.dot(self._shard_weights, shard_objs)
+
+    def get_obj_jac(self, parameter_vec, out=None):
+        """Return objective value and jacobian at parameter_vec.
+
+        Jacobian is summed in out, if given.
+        """
+        shard_obj_jacs = self._pool.map(_worker_obj_jac, [
+            (parameter_vec, start, stop) for start, stop in self._shards
+        ])
+
+        if out is None:
+            out = numpy.zeros(parameter_vec.shape)
+        else:
+            out[:] = 0.0
+        obj_value = 0.0
+        for weight, (shard_obj, shard_jac) in zip(self._shard_weights,
+                                                  shard_obj_jacs):
+            obj_value += weight * shard_obj
+            out += weight * shard_jac
+        return obj_value, out
+
+    def close(self):
+        """Stop all processes."""
+        self._pool.terminate()
+        self._pool.join()
+
+
+def train_attempts(model, input_matrix, target_matrix, num_attempts,
+                   processes, attempt_args):
+    """Train independent attempts of model in parallel, and return the best.
+
+    The first attempt starts from model as given,
+    and the rest start from model.reset().
+    Each attempt has its own random seed, drawn from numpy.random,
+    so attempts do not repeat each other, and results are reproducible
+    for a given seed and number of processes.
+    Remaining attempts are stopped as soon as one converges.
+
+    Args:
+        model: Model to train. Not modified.
+        input_matrix: A matrix with samples in rows and attributes in columns.
+        target_matrix: A matrix with samples in rows and target values in columns.
+        num_attempts: Number of attempts.
+        processes: Number of processes.
+        attempt_args: Tuple of arguments for Model._train_attempt,
+            after input_matrix and target_matrix.
+
+    Returns:
+        (error, serialized_model); Error and serialized model of
+            first converged attempt, or attempt with lowest error.
+    """
+    seeds = numpy.random.randint(0, 2**31 - 1, size=num_attempts)
+
+    pool = multiprocessing.Pool(
+        min(processes, num_attempts),
+        initializer=_init_worker,
+        initargs=(model, shared_array(input_matrix),
+                  shared_array(target_matrix)))
+    try:
+        best_try = (float('inf'), None)  # (error, serialized_model)
+        for error, converged, serialized_model in pool.imap_unordered(
+                _worker_train_attempt,
+            [(seed, attempt > 0, attempt_args)
+             for attempt, seed in enumerate(seeds)]):
+            if converged:
+                # No need to wait for other attempts
+                return error, serialized_model
+
+            if best_try[1] is None or error < best_try[0]:
+                best_try = (error, serialized_model)
+
+        return best_try
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def map_dataset(func, model, input_matrix, target_matrix, tasks, processes):
+    """Return [func(model, input_matrix, target_matrix, task) for task in tasks].
+
+    Tasks are run in parallel, and results are in order of tasks.
+    model and dataset are given to each process once,
+    instead of pickled with each task,
+    and dataset is shared in memory.
+    Each task has its own random seed, drawn from numpy.random.
+
+    Args:
+        func: Function taking (model, input_matrix, target_matrix, task).
+            Must be defined at module level, so it can be pickled.
+        model: Model given to func. func should not modify it,
+            because it is shared by all tasks in a process.
+        input_matrix: A matrix with samples in rows and attributes in columns.
+        target_matrix: A matrix with samples in rows and target values in columns.
+        tasks: List of picklable arguments, one for each call of func.
+        processes: Number of processes.
+    """
+    seeds = numpy.random.randint(0, 2**31 - 1, size=len(tasks))
+
+    pool = multiprocessing.Pool(
+        min(processes, len(tasks)),
+        initializer=_init_worker,
+        initargs=(model, shared_array(input_matrix),
+                  shared_array(target_matrix)))
+    try:
+        return pool.map(_worker_call, zip([func] * len(tasks), seeds, tasks))
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+# Model and dataset shared by all calls in each worker process
+_WORKER_STATE = {}
+
+
+def _init_worker(model, input_matrix, target_matrix):
+    """Set model and dataset, for this worker process."""
+    _WORKER_STATE['model'] = model
+    _WORKER_STATE['input_matrix'] = input_matrix
+    _WORKER_STATE['target_matrix'] = target_matrix
+
+
+def _worker_call(args):
+    """Return func(model, input_matrix, target_matrix, task), with given seed."""
+    func, seed, task = args
+
+    # Independent random stream for this task
+    random.seed(seed)
+    numpy.random.seed(seed)
+
+    return func(_WORKER_STATE['model'], _WORKER_STATE['input_matrix'],
+                _WORKER_STATE['target_matrix'], task)
+
+
+def _worker_train_attempt(args):
+    """Return error, converged, and serialized model, after one training attempt."""
+    seed, reset, attempt_args = args
+
+    # Independent random stream for this attempt
+    random.seed(seed)
+    numpy.random.seed(seed)
+
+    model = copy.deepcopy(_WORKER_STATE['model'])
+    if reset:
+        model.reset()
+
+    error = model._train_attempt(_WORKER_STATE['input_matrix'],
+                                 _WORKER_STATE['target_matrix'], *attempt_args)
+
+    # Callback is only for this process, and may not pickle
+    model._post_pattern_callback = None
+    return error, model.converged, model.serialize()
+
+
+def _worker_obj(args):
+    """Return objective value on rows start:stop."""
+    parameter_vec, start, stop = args
+    return _WORKER_STATE['model']._get_obj(
+        parameter_vec, _WORKER_STATE['input_matrix'][start:stop],
+        _WORKER_STATE['target_matrix'][start:stop])
+
+
+def _worker_obj_jac(args):
+    """Return objective value and jacobian on rows start:stop."""
+    parameter_vec, start, stop = args
+    return _WORKER_STATE['model']._get_obj_jac(
+        parameter_vec, _WORKER_STATE['input_matrix'][start:stop],
+        _WORKER_STATE['target_matrix'][start:stop])
@@ -173,49 +173,50 @@ def clean_dataset_depuration(input_matrix, target_matrix, k=3, k_prime=2):
     if not isinstance(target_matrix, numpy.ndarray):
         target_matrix = numpy.array(target_matrix)
 
-    patterns = zip(input_matrix, target_matrix)
-    indices = range(len(input_matrix))
-
-    if not ((k + 1) / 2 <= k_prime and k_prime <= k):
+    # k_prime > k / 2, so two classes cannot both have k_prime neighbours
+    if not (2 * k_prime > k and k_prime <= k):
         raise ValueError('k_prime must be between (k + 1) / 2 and k')
 
-    kept_inputs = []
-    kept_targets = []
-    changed_patterns = []
-    removed_patterns = []
-    for i in indices:
-        # Find k-NN of patternIi in patterns - {pattern_i}
-        # We do this by finding k+1 nearest indices, and ignoring index i
-        k_nearest = knn.select_k_nearest_neighbors(input_matrix,
-                                                   input_matrix[i], k + 1)
-        k_nearest.remove(i)
-
-        # if a class has at least k_prime representatives
-        # among the k neighbours
-        class_counts = _count_classes(target_matrix[k_nearest])
-        removed = True
-        for class_, count in class_counts.iteritems():
-            if count >= k_prime:
-                # Change the label of pattern to that class
-                # and add pattern to cleaned_patterns
-
-                # Keep input
-                # and the common class
-                kept_inputs.append(input_matrix[i])
-                kept_targets.append(class_)
-
-                # Check if new pattern is different than old pattern, track changed
-                if class_ != tuple(target_matrix[i]):
-                    changed_patterns.append(i)
-
-                removed = False
-                break
-        if removed:
-            # discard pattern (do not add to kept lists)
-            removed_patterns.append(i)
-
-    return ((numpy.array(kept_inputs), numpy.array(kept_targets)),
-            changed_patterns, removed_patterns)
+    # Find k-NN of each pattern_i in patterns - {pattern_i}
+    # We do this by finding k+1 nearest indices, and ignoring index i
+    k_nearest = _k_nearest_others(input_matrix, k)
+
+    # Count classes (unique target rows) among the k neighbours of each pattern
+    classes, labels = numpy.unique(
+        target_matrix, axis=0, return_inverse=True)
+    num_classes = len(classes)
+    class_counts = numpy.bincount(
+        (numpy.arange(len(input_matrix))[:, None] * num_classes +
+         labels[k_nearest]).ravel(),
+        minlength=len(input_matrix) * num_classes).reshape(-1, num_classes)
+
+    # If a class has at least k_prime representatives among the k neighbours,
+    # change the label of pattern to that class, and keep it.
+    # Otherwise discard pattern.
+    # Because k_prime > k / 2, at most one class can have k_prime representatives,
+    # so argmax never has to break a tie between kept classes
+    common_labels = numpy.argmax(class_counts, axis=1)
+    kept = class_counts[numpy.arange(len(input_matrix)),
+                        common_labels] >= k_prime
+
+    # Track changed and removed patterns
+    changed_patterns = numpy.flatnonzero(kept & (common_labels != labels))
+    removed_patterns = numpy.flatnonzero(~kept)
+
+    return ((input_matrix[kept], classes[common_labels[kept]]),
+            changed_patterns.tolist(), removed_patterns.tolist())
+
+
+def _k_nearest_others(input_matrix, k):
+    """Return indices of k nearest other rows, for each row in input_matrix."""
+    num_rows = len(input_matrix)
+    k_nearest = knn.k_nearest_neighbors(input_matrix, input_matrix, k + 1)
+
+    # Ignore index i in row i.
+    # With duplicate rows, i may not be selected, so ignore farthest instead
+    is_self = k_nearest == numpy.arange(num_rows)[:, None]
+    is_self[~is_self.any(axis=1), -1] = True
+    return k_nearest[~is_self].reshape(num_rows, k)
 
 
 def _list_minus_i(list_, i):
@@ -223,22 +224,6 @@ def _list_minus_i(list_, i):
     return list_[:i] + list_[i + 1:]
 
 
-def _count_classes(target_matrix):
-    """Count how many times each class appears in a set of points."""
-    # TODO: Fix to work with list of target values.
-    # Should we simply count a set of target values as one target?
-    # Or track a separate count for each position (targets[0], targets[1], etc.)?
-    class_counts = {}
-    for target in target_matrix:
-        key = tuple(target)
-        try:
-            class_counts[key] += 1
-        except KeyError:
-            class_counts[key] = 1
-
-    return class_counts
-
-
 #########################
 # PCA
 #########################
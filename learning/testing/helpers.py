@@ -30,7 +30,6 @@ import operator
 import numpy
 
 from learning import Model
-from learning.architecture import pbnn
 
 
 class EmptyModel(Model):
@@ -106,8 +105,10 @@ class WeightedSumModel(Model):
         self._stored_targets = None
 
     def activate(self, inputs):
-        return pbnn._weighted_sum_rows(self._stored_targets,
-                                       numpy.array(inputs))
+        # Sum of stored target rows, each scaled by inputs
+        return numpy.sum(
+            self._stored_targets * numpy.array(inputs)[:, numpy.newaxis],
+            axis=0)
 
     def train(self, input_matrix, target_matrix, *args, **kwargs):
         self._stored_targets = numpy.copy(target_matrix)
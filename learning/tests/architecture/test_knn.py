@@ -22,7 +22,10 @@
 # SOFTWARE.
 ###############################################################################
 
+import random
+
 import numpy
+import pytest
 
 from learning.architecture import knn
 
@@ -55,3 +58,105 @@ def test_select_k_nearest_neighbors_numpy_matrix():
 
     assert set(knn.select_k_nearest_neighbors(matrix, center, 2)) == set([0, 1])
     assert set(knn.select_k_nearest_neighbors(matrix, center, 3)) == set([0, 1, 2])
+
+
+def test_select_k_nearest_neighbors_ordered():
+    matrix = numpy.array([(3,), (0,), (2,), (1,)])
+    center = numpy.array([0])
+
+    assert knn.select_k_nearest_neighbors(matrix, center, 3) == [1, 3, 2]
+    assert knn.select_k_nearest_neighbors(matrix, center, 4) == [1, 3, 2, 0]
+
+
+def test_select_k_nearest_neighbors_k_too_large():
+    with pytest.raises(ValueError):
+        knn.select_k_nearest_neighbors([(0,), (1,)], [0], 3)
+
+
+@pytest.mark.parametrize('block_size', [None, 1, 3])
+def test_k_nearest_neighbors(block_size):
+    matrix = numpy.random.random((random.randint(10, 20), random.randint(1, 5)))
+    query_matrix = numpy.random.random((random.randint(5, 10), matrix.shape[1]))
+    k = random.randint(1, len(matrix))
+
+    nearest_indices = knn.k_nearest_neighbors(
+        matrix, query_matrix, k, block_size=block_size)
+    assert nearest_indices.shape == (len(query_matrix), k)
+
+    # Same as sorting all distances
+    for query_vec, indices in zip(query_matrix, nearest_indices):
+        distances = [numpy.linalg.norm(vec - query_vec) for vec in matrix]
+        assert list(indices) == list(numpy.argsort(distances)[:k])
+
+
+def test_k_nearest_neighbors_uses_index(monkeypatch):
+    monkeypatch.setattr(knn, 'INDEX_MIN_ROWS', 1)
+    monkeypatch.setattr(knn, 'INDEX_MIN_QUERIES', 1)
+    queries = []
+
+    def query(self, query_matrix, k):
+        queries.append(query_matrix)
+        return numpy.zeros((len(query_matrix), k), dtype=int)
+
+    monkeypatch.setattr(knn.KNNIndex, 'query', query)
+
+    knn.k_nearest_neighbors(numpy.random.random((10, 2)),
+                            numpy.random.random((3, 2)), 2)
+    assert len(queries) == 1
+
+    # Not for high dimensional matrix
+    knn.k_nearest_neighbors(
+        numpy.random.random((10, knn.INDEX_MAX_DIMENSIONS + 1)),
+        numpy.random.random((3, knn.INDEX_MAX_DIMENSIONS + 1)), 2)
+    assert len(queries) == 1
+
+
+###################
+# KNNIndex
+###################
+@pytest.mark.parametrize('method', ['kd_tree', 'ball_tree'])
+def test_knn_index_query(method):
+    matrix = numpy.random.random((random.randint(50, 100),
+                                  random.randint(1, 4)))
+    query_matrix = numpy.random.random((random.randint(5, 10),
+                                        matrix.shape[1]))
+    k = random.randint(1, 10)
+
+    index = knn.KNNIndex(
+        matrix, method=method, leaf_size=random.randint(1, 10))
+    assert (index.query(query_matrix, k) == knn.k_nearest_neighbors(
+        matrix, query_matrix, k)).all()
+
+    # Can be given in place of matrix
+    assert knn.select_k_nearest_neighbors(
+        index, query_matrix[0], k) == knn.select_k_nearest_neighbors(
+            matrix, query_matrix[0], k)
+
+
+@pytest.mark.parametrize('method', ['kd_tree', 'ball_tree'])
+def test_knn_index_query_radius(method):
+    matrix = numpy.random.random((random.randint(50, 100),
+                                  random.randint(1, 4)))
+    query_matrix = numpy.random.random((random.randint(5, 10),
+                                        matrix.shape[1]))
+    radius = random.uniform(0.0, 0.5)
+
+    neighbors = knn.KNNIndex(
+        matrix, method=method,
+        leaf_size=random.randint(1, 10)).query_radius(query_matrix, radius)
+
+    assert len(neighbors) == len(query_matrix)
+    for query_vec, indices in zip(query_matrix, neighbors):
+        distances = numpy.sqrt(numpy.sum((matrix - query_vec)**2, axis=1))
+        assert set(indices) == set(numpy.flatnonzero(distances <= radius))
+        # Ordered from nearest to farthest
+        assert (numpy.diff(distances[indices]) >= 0.0).all()
+
+
+def test_knn_index_invalid_args():
+    with pytest.raises(ValueError):
+        knn.KNNIndex([(0,), (1,)], method='not_a_tree')
+    with pytest.raises(ValueError):
+        knn.KNNIndex([(0,), (1,)], leaf_size=0)
+    with pytest.raises(ValueError):
+        knn.KNNIndex([(0,), (1,)]).query([(0,)], 3)
@@ -89,6 +89,17 @@ def test_mlp_convergence():
     assert validation.get_error(model, *dataset) <= 0.02
 
 
+def test_mlp_train_re_uses_line_search_values():
+    model = mlp.MLP((2, 2, 2))
+    model.logging = False
+    dataset = datasets.get_xor()
+
+    model.train(*dataset, iterations=10)
+    # Every iteration after the first starts at the step accepted by the
+    # previous line search
+    assert model.evaluation_cache.hits >= model.iteration - 1
+
+
 def test_mlp_classifier():
     # Run for a couple of iterations
     # assert that new error is less than original
@@ -126,18 +137,6 @@ def test_mlp_perceptron():
     assert (model.activate([1, 1]) == [3.0]).all()
 
 
-def test_mean_list_of_list_of_matrices():
-    lol_matrices = [[
-        numpy.array([[1, 2], [3, 4]]),
-        numpy.array([[-1, -2], [-3, -4]])
-    ], [numpy.array([[1, 2], [3, 4]]),
-        numpy.array([[1, 2], [3, 4]])]]
-    assert helpers.approx_equal(
-        mlp._mean_list_of_list_of_matrices(lol_matrices),
-        [numpy.array([[1, 2], [3, 4]]),
-         numpy.array([[0, 0], [0, 0]])])
-
-
 def test_mlp_obj_and_obj_jac_match_lin_out_mse():
     _check_obj_and_obj_jac_match(lambda s1, s2, s3: mlp.MLP(
         (s1, s2, s3), transfers=mlp.LinearTransfer(), error_func=MeanSquaredError()))
@@ -177,8 +176,7 @@ def _check_obj_and_obj_jac_match(make_model_func, classification=False):
 
     # Don't use exactly the same parameters, to ensure obj functions are actually
     # using the given parameters
-    parameters = random.uniform(-1.0, 1.0) * mlp._flatten(
-        model._bias_vec, model._weight_matrices)
+    parameters = random.uniform(-1.0, 1.0) * model._parameters
     assert helpers.approx_equal(
         model._get_obj(parameters, dataset[0], dataset[1]),
         model._get_obj_jac(parameters, dataset[0], dataset[1])[0])
@@ -218,10 +216,108 @@ def _check_jacobian(make_model_func):
     helpers.check_gradient(
         f,
         df,
-        f_arg_tensor=mlp._flatten(model._bias_vec, model._weight_matrices),
+        f_arg_tensor=numpy.copy(model._parameters),
         f_shape='scalar')
 
 
+def test_mlp_hess_vec_lin_out_mse():
+    _check_gauss_newton_hess_vec(lambda s1, s2, s3: mlp.MLP(
+        (s1, s2, s3), transfers=mlp.LinearTransfer(), error_func=MeanSquaredError()))
+
+
+def test_mlp_hess_vec_softmax_out_ce():
+    _check_gauss_newton_hess_vec(lambda s1, s2, s3: mlp.MLP(
+        (s1, s2, s3), transfers=SoftmaxTransfer(), error_func=CrossEntropyError()))
+
+
+def _check_gauss_newton_hess_vec(make_model_func):
+    attrs = random.randint(1, 10)
+    outs = random.randint(1, 10)
+
+    model = make_model_func(attrs, random.randint(1, 10), outs)
+    inp_matrix, tar_matrix = datasets.get_random_regression(random.randint(1, 10), attrs, outs)
+    parameters = numpy.copy(model._parameters)
+    direction_vec = numpy.random.random(parameters.shape)
+
+    # Gauss-Newton hessian is J^T H_e J,
+    # where J is jacobian of outputs with regard to parameters,
+    # and H_e is hessian of error function with regard to outputs
+    def activate(xk):
+        model._parameters[:] = xk
+        return model.activate(inp_matrix)
+    output_matrix = activate(parameters)
+    output_jac = helpers._approximate_gradient_jac(
+        activate, parameters, helpers.CENTRAL_DIFF_EPSILON).reshape(
+            (output_matrix.size, parameters.size))
+    error_hess_dot = model._error_func.hessian_vector_product(
+        output_matrix, tar_matrix,
+        output_jac.dot(direction_vec).reshape(output_matrix.shape))
+    expected = output_jac.T.dot(error_hess_dot.ravel())
+
+    assert helpers.approx_equal(
+        model._get_hess_vec(parameters, direction_vec, inp_matrix, tar_matrix),
+        expected)
+
+
+def test_mlp_residual_jacobian():
+    attrs = random.randint(1, 10)
+    outs = random.randint(1, 10)
+
+    model = mlp.MLP((attrs, random.randint(1, 10), outs),
+                    error_func=MeanSquaredError())
+    inp_matrix, tar_matrix = datasets.get_random_regression(
+        random.randint(1, 10), attrs, outs)
+    parameters = numpy.copy(model._parameters)
+
+    # Residuals are (MLP(X) - Y) / sqrt(n), so ||r||^2 is mean squared error
+    def residuals(xk):
+        model._parameters[:] = xk
+        return (model.activate(inp_matrix) - tar_matrix).ravel() / numpy.sqrt(
+            tar_matrix.size)
+    expected = helpers._approximate_gradient_jac(
+        residuals, parameters, helpers.CENTRAL_DIFF_EPSILON).reshape(
+            (tar_matrix.size, parameters.size))
+
+    assert helpers.approx_equal(
+        model._get_residual_jacobian(parameters, inp_matrix, tar_matrix),
+        expected)
+
+
+def test_mlp_residual_jacobian_not_mse():
+    model = mlp.MLP((2, 3, 2), error_func=CrossEntropyError())
+    inp_matrix, tar_matrix = datasets.get_random_regression(5, 2, 2)
+    assert model._get_residual_jacobian(
+        numpy.copy(model._parameters), inp_matrix, tar_matrix) is None
+
+
+def test_mlp_n_jobs():
+    # Data parallel training should not change results
+    dataset = datasets.get_xor()
+
+    model = mlp.MLP((2, 2, 2))
+    parallel_model = mlp.MLP((2, 2, 2), n_jobs=2)
+    parallel_model._parameters[:] = model._parameters
+
+    error = model.train(*dataset, iterations=10)
+    parallel_error = parallel_model.train(*dataset, iterations=10)
+
+    assert helpers.approx_equal(parallel_error, error)
+    assert helpers.approx_equal(parallel_model._parameters, model._parameters)
+    assert parallel_model._data_parallel is None
+
+
+def test_mlp_n_jobs_parallel_retries(monkeypatch):
+    # Attempts run in their own processes, so no data parallel pool is made
+    def fail(*args, **kwargs):
+        assert 0, 'DataParallelObjective should not be created'
+    monkeypatch.setattr(mlp.parallel, 'DataParallelObjective', fail)
+
+    model = mlp.MLP((2, 2, 2), n_jobs=2)
+    model.logging = False
+    model.train(*datasets.get_xor(), iterations=2, retries=1, retry_n_jobs=2)
+    assert model._data_parallel is None
+
+
 def test_MLP_reset():
     shape = (random.randint(1, 10), random.randint(1, 10), random.randint(1, 10))
 
@@ -246,6 +342,18 @@ def test_MLP_reset():
         numpy.random.seed(prev_seed)
 
 
+def test_MLP_weights_are_views_of_parameters_after_unserialize():
+    model = mlp.MLP((random.randint(1, 10), random.randint(1, 10),
+                     random.randint(1, 10)))
+    model = mlp.MLP.unserialize(model.serialize())
+
+    # Changing flat parameters should change bias and weight matrices
+    model._parameters[:] = numpy.arange(model._parameters.shape[0])
+    assert (numpy.hstack([model._bias_vec] + [
+        matrix.ravel() for matrix in model._weight_matrices
+    ]) == model._parameters).all()
+
+
 ##############################
 # DropoutMLP
 ##############################
@@ -22,7 +22,14 @@
 # SOFTWARE.
 ###############################################################################
 
+import random
+
+import numpy
+import pytest
+
 from learning import datasets, validation, PBNN
+from learning.architecture import pbnn
+from learning.testing import helpers
 
 
 def test_pbnn_convergence():
@@ -33,3 +40,82 @@ def test_pbnn_convergence():
 
     model.train(*dataset)
     assert validation.get_error(model, *dataset) <= 0.02
+
+
+@pytest.mark.parametrize('block_size', [None, 1, 3])
+def test_pbnn_activate_matrix(block_size):
+    model = PBNN(block_size=block_size)
+    dataset = datasets.get_random_classification(10, 2, 3)
+    model.train(*dataset)
+
+    input_matrix = numpy.random.random((random.randint(1, 10), 2))
+    assert helpers.approx_equal(
+        model.activate(input_matrix),
+        [model.activate(input_vec) for input_vec in input_matrix])
+
+
+def test_pbnn_activate_vector():
+    model = PBNN(variance=0.5)
+    model.train(numpy.array([[0.0], [1.0], [2.0]]),
+                numpy.array([[1, 0], [0, 1], [0, 1]]))
+
+    # Similarity to each stored pattern, summed by class,
+    # scaled by total similarity and number of patterns in class
+    similarities = numpy.exp(-numpy.array([0.25, 0.25, 2.25]) / 0.5)
+    expected = numpy.array(
+        [similarities[0], (similarities[1] + similarities[2]) / 2.0])
+    assert helpers.approx_equal(
+        model.activate(numpy.array([0.5])), expected / numpy.sum(expected))
+
+
+def test_pbnn_num_prototypes():
+    dataset = datasets.get_random_classification(100, 2, 3)
+    model = PBNN(num_prototypes=10)
+    model.train(*dataset)
+
+    # About num_prototypes stored, each representing patterns of one class
+    assert len(model._input_matrix) <= 12
+    assert numpy.sum(model._input_weights) == 100
+    assert (numpy.dot(model._input_weights, model._target_matrix) ==
+            numpy.sum(dataset[1], axis=0)).all()
+
+    outputs = model.activate(dataset[0])
+    assert outputs.shape == dataset[1].shape
+    assert helpers.approx_equal(numpy.sum(outputs, axis=1), [1.0] * 100)
+
+
+def test_pbnn_num_prototypes_more_than_patterns():
+    # Nothing to condense, same as storing all patterns
+    dataset = datasets.get_random_classification(10, 2, 3)
+    model = PBNN(num_prototypes=20)
+    model.train(*dataset)
+
+    full_model = PBNN()
+    full_model.train(*dataset)
+    assert helpers.approx_equal(
+        model.activate(dataset[0]), full_model.activate(dataset[0]))
+
+
+def test_pbnn_num_prototypes_convergence():
+    # Classes are separated by the sign of the first attribute
+    input_matrix, _ = datasets.get_random_classification(100, 2, 2)
+    positive = input_matrix[:, 0] > 0.0
+    target_matrix = numpy.column_stack([positive, ~positive]).astype(float)
+
+    model = PBNN(num_prototypes=10)
+    model.train(input_matrix, target_matrix)
+
+    # Dataset is condensed
+    assert model._input_weights is not None
+    assert validation.get_accuracy(model, input_matrix, target_matrix) >= 0.9
+
+
+def test_kmeans():
+    matrix = numpy.array([[0.0, 0.0], [0.0, 0.1], [5.0, 5.0], [5.0, 5.1],
+                          [5.1, 5.0]])
+    centroids, counts = pbnn._kmeans(matrix, 2, 20)
+
+    order = numpy.argsort(centroids[:, 0])
+    assert helpers.approx_equal(centroids[order],
+                                [[0.0, 0.05], [5.1 / 3 + 10.0 / 3, 15.1 / 3]])
+    assert list(counts[order]) == [2, 3]
@@ -86,6 +86,17 @@ def test_RBF_reset():
         numpy.random.seed(prev_seed)
 
 
+def test_RBF_weights_are_views_of_parameters_after_unserialize():
+    model = rbf.RBF(
+        random.randint(1, 10), random.randint(1, 10), random.randint(1, 10))
+    model = rbf.RBF.unserialize(model.serialize())
+
+    # Changing flat parameters should change bias and weight matrix
+    model._parameters[:] = numpy.arange(model._parameters.shape[0])
+    assert (numpy.hstack([model._bias_vec, model._weight_matrix.ravel()]) ==
+            model._parameters).all()
+
+
 ########################
 # Integration tests
 ########################
@@ -135,8 +146,7 @@ def test_rbf_obj_and_obj_jac_match():
 
     # Don't use exactly the same parameters, to ensure obj functions are actually
     # using the given parameters
-    parameters = random.uniform(-1.0, 1.0) * rbf._flatten_weights(
-        model._weight_matrix, model._bias_vec)
+    parameters = random.uniform(-1.0, 1.0) * model._parameters
     assert helpers.approx_equal(
         model._get_obj(parameters, dataset[0], dataset[1]),
         model._get_obj_jac(parameters, dataset[0], dataset[1])[0])
@@ -164,6 +174,5 @@ def _check_jacobian(make_model_func):
     helpers.check_gradient(
         f,
         df,
-        f_arg_tensor=rbf._flatten_weights(model._weight_matrix,
-                                          model._bias_vec),
+        f_arg_tensor=numpy.copy(model._parameters),
         f_shape='scalar')
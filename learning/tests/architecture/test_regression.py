@@ -27,9 +27,10 @@ import random
 import numpy
 import pytest
 
-from learning import (datasets, validation, error, LinearRegressionModel,
-                      LogisticRegressionModel)
+from learning import (datasets, validation, error, optimize,
+                      LinearRegressionModel, LogisticRegressionModel)
 
+from learning.architecture import regression
 from learning.testing import helpers
 
 
@@ -77,6 +78,131 @@ def test_LinearRegressionModel_jacobian_l2_penalty():
             penalty_weight=random.uniform(0.0, 2.0))))
 
 
+def test_LinearRegressionModel_hess_vec():
+    _check_hess_vec(lambda a, o: LinearRegressionModel(a, o))
+
+
+def test_LinearRegressionModel_hess_vec_l2_penalty():
+    _check_hess_vec(lambda a, o: LinearRegressionModel(
+        a, o, penalty_func=error.L2Penalty(
+            penalty_weight=random.uniform(0.0, 2.0))))
+
+
+def test_LinearRegressionModel_l1_penalty_fista():
+    model = LinearRegressionModel(
+        10, 1, penalty_func=error.L1Penalty(penalty_weight=0.1))
+    assert isinstance(model._optimizer, optimize.FISTA)
+
+    # Only first attribute is relevant
+    inp_matrix = numpy.random.uniform(-1.0, 1.0, (50, 10))
+    tar_matrix = 2.0 * inp_matrix[:, :1]
+    model.train(inp_matrix, tar_matrix, iterations=100, error_break=0.0)
+
+    # Proximal gradient gives exactly 0 weights
+    assert model._weight_matrix[1, 0] != 0.0
+    assert numpy.all(model._weight_matrix[2:] == 0.0)
+
+
+def test_LinearRegressionModel_hessian():
+    _check_hessian(lambda a, o: LinearRegressionModel(a, o))
+
+
+def test_LinearRegressionModel_hessian_l2_penalty():
+    _check_hessian(lambda a, o: LinearRegressionModel(
+        a, o, penalty_func=error.L2Penalty(
+            penalty_weight=random.uniform(0.0, 2.0))))
+
+
+def test_LinearRegressionModel_newton_cg():
+    # Exact hessian of linear model, so Newton-CG converges in few iterations
+    attrs = random.randint(1, 10)
+    outs = random.randint(1, 10)
+    model = LinearRegressionModel(attrs, outs, optimizer=optimize.NewtonCG())
+    dataset = datasets.get_random_regression(10, attrs, outs)
+
+    model.train(*dataset, iterations=10, error_break=0.0)
+    assert model.converged
+
+
+def test_LinearRegressionModel_residual_jacobian():
+    _check_residual_jacobian(lambda a, o: LinearRegressionModel(a, o))
+
+
+def test_LinearRegressionModel_residual_jacobian_l2_penalty():
+    model = LinearRegressionModel(
+        2, 2, penalty_func=error.L2Penalty(penalty_weight=1.0))
+    inp_matrix, tar_matrix = datasets.get_random_regression(10, 2, 2)
+    assert model._get_residual_jacobian(
+        numpy.copy(model._weight_matrix.ravel()), inp_matrix,
+        tar_matrix) is None
+
+
+def test_LinearRegressionModel_levenberg_marquardt():
+    # Residuals are linear in weights, so Gauss-Newton hessian is exact
+    attrs = random.randint(1, 10)
+    outs = random.randint(1, 10)
+    dataset = datasets.get_random_regression(10, attrs, outs)
+    model = LinearRegressionModel(attrs, outs)
+    expected_error = model.solve(*dataset)
+
+    model = LinearRegressionModel(
+        attrs, outs, optimizer=optimize.LevenbergMarquardt())
+    model.train(*dataset, iterations=20, error_break=0.0)
+    assert helpers.approx_equal(
+        validation.get_error(model, *dataset), expected_error)
+
+
+@pytest.mark.parametrize('method', ['cholesky', 'lstsq'])
+def test_LinearRegressionModel_solve(method):
+    # Solution should have zero jacobian
+    attrs = random.randint(1, 10)
+    outs = random.randint(1, 10)
+    model = LinearRegressionModel(attrs, outs)
+    inp_matrix, tar_matrix = datasets.get_random_regression(50, attrs, outs)
+
+    error = model.solve(inp_matrix, tar_matrix, method=method)
+    assert model.converged
+    assert helpers.approx_equal(
+        error, validation.get_error(model, inp_matrix, tar_matrix))
+
+    obj, jacobian = model._get_obj_jac(
+        numpy.copy(model._weight_matrix.ravel()), inp_matrix, tar_matrix)
+    assert helpers.approx_equal(jacobian, numpy.zeros(jacobian.shape))
+
+
+def test_LinearRegressionModel_solve_singular():
+    # Duplicate attribute makes X^T X singular
+    model = LinearRegressionModel(2, 1)
+    inp_matrix = numpy.random.random((10, 1)).repeat(2, axis=1)
+    tar_matrix = 2.0 * inp_matrix[:, :1]
+
+    assert helpers.approx_equal(model.solve(inp_matrix, tar_matrix), 0.0)
+    assert helpers.approx_equal(model.activate(inp_matrix), tar_matrix)
+
+
+def test_LinearRegressionModel_solve_chunks():
+    attrs = random.randint(1, 10)
+    outs = random.randint(1, 10)
+    inp_matrix, tar_matrix = datasets.get_random_regression(50, attrs, outs)
+
+    model = LinearRegressionModel(attrs, outs)
+    expected_error = model.solve(inp_matrix, tar_matrix)
+    expected_weights = numpy.copy(model._weight_matrix)
+
+    model = LinearRegressionModel(attrs, outs)
+    error = model.solve_chunks(
+        (inp_matrix[i:i + 7], tar_matrix[i:i + 7]) for i in range(0, 50, 7))
+    assert helpers.approx_equal(error, expected_error)
+    assert helpers.approx_equal(model._weight_matrix, expected_weights)
+
+
+def test_LinearRegressionModel_solve_penalty():
+    model = LinearRegressionModel(
+        2, 2, penalty_func=error.L2Penalty(penalty_weight=1.0))
+    with pytest.raises(ValueError):
+        model.solve(*datasets.get_random_regression(10, 2, 2))
+
+
 def test_LinearRegressionModel_get_obj_equals_get_obj_jac():
     _check_get_obj_equals_get_obj_jac(lambda a, o: LinearRegressionModel(a, o))
 
@@ -125,6 +251,64 @@ def test_LogisticRegressionModel_jacobian():
     _check_jacobian(lambda a, o: LogisticRegressionModel(a, o))
 
 
+def test_LogisticRegressionModel_hess_vec_binary_cross_entropy():
+    # Hessian is exact for binary cross entropy
+    _check_hess_vec(lambda a, o: LogisticRegressionModel(
+        a, o, error_func=error.BinaryCrossEntropyError()), binary=True)
+
+
+def test_LogisticRegressionModel_hessian_binary_cross_entropy():
+    _check_hessian(lambda a, o: LogisticRegressionModel(
+        a, o, error_func=error.BinaryCrossEntropyError()), binary=True)
+
+
+def test_LogisticRegressionModel_defaults_irls():
+    model = LogisticRegressionModel(2, 1)
+    assert isinstance(model._error_func, error.BinaryCrossEntropyError)
+    assert isinstance(model._optimizer, optimize.Newton)
+
+    model = LogisticRegressionModel(
+        regression.NEWTON_MAX_PARAMETERS, 1)
+    assert isinstance(model._optimizer, optimize.NewtonCG)
+
+
+def test_LogisticRegressionModel_irls_convergence():
+    # Default model is IRLS, which converges in few iterations
+    model = LogisticRegressionModel(2, 1)
+    # Overlapping classes, so maximum likelihood weights are finite
+    inp_matrix = numpy.random.normal(size=(100, 2))
+    tar_matrix = (inp_matrix[:, :1] + numpy.random.normal(size=(100, 1)) >
+                  0.0).astype(float)
+
+    model.train(inp_matrix, tar_matrix, iterations=100, error_break=0.0)
+    assert model.converged
+    assert model.iteration <= 10
+
+
+@pytest.mark.parametrize('optimizer_class', [optimize.Newton, optimize.NewtonCG])
+def test_LogisticRegressionModel_newton_binary_cross_entropy(optimizer_class):
+    # Newton with exact hessian (IRLS) converges in few iterations
+    model = LogisticRegressionModel(
+        2, 1, optimizer=optimizer_class(),
+        error_func=error.BinaryCrossEntropyError())
+    # Overlapping classes, so maximum likelihood weights are finite
+    inp_matrix = numpy.random.normal(size=(100, 2))
+    tar_matrix = (inp_matrix[:, :1] + numpy.random.normal(size=(100, 1)) >
+                  0.0).astype(float)
+
+    model.train(inp_matrix, tar_matrix, iterations=20, error_break=0.0)
+    assert model.iteration < 20
+
+    obj, jacobian = model._get_obj_jac(
+        numpy.copy(model._weight_matrix.ravel()), inp_matrix, tar_matrix)
+    assert numpy.linalg.norm(jacobian) < 1e-6
+
+
+def test_LogisticRegressionModel_residual_jacobian():
+    _check_residual_jacobian(lambda a, o: LogisticRegressionModel(
+        a, o, error_func=error.MeanSquaredError()))
+
+
 ######################################
 # Helpers
 ######################################
@@ -143,6 +327,71 @@ def _check_jacobian(make_model_func):
         f, df, f_arg_tensor=model._weight_matrix.ravel(), f_shape='scalar')
 
 
+def _random_dataset(attrs, outs, binary):
+    """Return random regression dataset, or with targets in {0, 1}."""
+    inp_matrix, tar_matrix = datasets.get_random_regression(10, attrs, outs)
+    if binary:
+        tar_matrix = (tar_matrix > 0.0).astype(float)
+    return inp_matrix, tar_matrix
+
+
+def _check_hess_vec(make_model_func, binary=False):
+    attrs = random.randint(1, 10)
+    outs = random.randint(1, 10)
+
+    model = make_model_func(attrs, outs)
+    inp_matrix, tar_matrix = _random_dataset(attrs, outs, binary)
+
+    # Hessian vector product is derivative of jacobian dot vector
+    direction_vec = numpy.random.random(model._weight_matrix.size)
+    f = lambda xk: model._get_obj_jac(xk, inp_matrix, tar_matrix)[1].dot(direction_vec)
+    df = lambda xk: model._get_hess_vec(xk, direction_vec, inp_matrix, tar_matrix)
+
+    helpers.check_gradient(
+        f, df, f_arg_tensor=numpy.copy(model._weight_matrix.ravel()),
+        f_shape='scalar')
+
+
+def _check_hessian(make_model_func, binary=False):
+    attrs = random.randint(1, 10)
+    outs = random.randint(1, 10)
+
+    model = make_model_func(attrs, outs)
+    inp_matrix, tar_matrix = _random_dataset(attrs, outs, binary)
+    flat_weights = numpy.copy(model._weight_matrix.ravel())
+
+    # Each column of hessian is product of hessian and unit vector
+    expected = numpy.column_stack([
+        model._get_hess_vec(flat_weights, unit_vec, inp_matrix, tar_matrix)
+        for unit_vec in numpy.identity(flat_weights.size)
+    ])
+
+    assert helpers.approx_equal(
+        model._get_hessian(flat_weights, inp_matrix, tar_matrix), expected)
+
+
+def _check_residual_jacobian(make_model_func):
+    attrs = random.randint(1, 10)
+    outs = random.randint(1, 10)
+
+    model = make_model_func(attrs, outs)
+    inp_matrix, tar_matrix = datasets.get_random_regression(10, attrs, outs)
+    flat_weights = numpy.copy(model._weight_matrix.ravel())
+
+    # Residuals are (f(X) - Y) / sqrt(n), so ||r||^2 is mean squared error
+    def residuals(xk):
+        model._weight_matrix = xk.reshape(model._weight_matrix.shape)
+        return (model.activate(inp_matrix) - tar_matrix).ravel() / numpy.sqrt(
+            tar_matrix.size)
+    expected = helpers._approximate_gradient_jac(
+        residuals, flat_weights, helpers.CENTRAL_DIFF_EPSILON).reshape(
+            (tar_matrix.size, flat_weights.size))
+
+    assert helpers.approx_equal(
+        model._get_residual_jacobian(flat_weights, inp_matrix, tar_matrix),
+        expected)
+
+
 def _check_get_obj_equals_get_obj_jac(make_model_func):
     attrs = random.randint(1, 10)
     outs = random.randint(1, 10)
@@ -26,6 +26,7 @@ import random
 import math
 
 import numpy
+import pytest
 
 from learning import datasets
 from learning.architecture import som
@@ -107,3 +108,166 @@ def test_som_reduces_distances_matrix():
     print new_closest
     for old_c, new_c in zip(all_closest, new_closest):
         assert new_c < old_c
+
+
+def test_som_move_neurons():
+    som_ = som.SOM(2, 6, move_rate=0.5, neighborhood=1,
+                   neighbor_move_rate=2.0)
+    weights = numpy.copy(som_._weights)
+    input_vec = numpy.array([0.5, -0.5])
+
+    som_.activate(input_vec)
+    closest = numpy.argmin(som_._distances)
+    som_._move_neurons(input_vec)
+
+    # Winner and neighbors move, scaled by gaussian of position from winner
+    for i in range(6):
+        if abs(i - closest) <= 1:
+            rate = 0.5 * math.exp(-(i - closest)**2 / 2.0)
+        else:
+            rate = 0.0
+        assert helpers.approx_equal(
+            som_._weights[i], weights[i] + rate * (input_vec - weights[i]))
+
+
+def test_som_batch_train_step():
+    som_ = som.SOM(2, 3, neighborhood=1, neighbor_move_rate=1.0, batch=True)
+    som_._weights = numpy.array([[0.0, 0.0], [5.0, 5.0], [20.0, 20.0]])
+    input_matrix = numpy.array([[0.0, 1.0], [1.0, 0.0], [21.0, 21.0]])
+
+    error = som_.train_step(input_matrix, None)
+
+    # Error is mean distance to closest neuron, before moving
+    assert helpers.approx_equal(error, (2.0 + math.sqrt(2.0)) / 3.0)
+
+    # Each neuron moves to neighborhood weighted mean of inputs won by
+    # itself and neighbors. Neuron 1 wins nothing, but neighbors do
+    neighbor = math.exp(-1.0)
+    assert helpers.approx_equal(som_._weights[0], [0.5, 0.5])
+    assert helpers.approx_equal(
+        som_._weights[1],
+        (neighbor * numpy.array([1.0, 1.0]) + neighbor * numpy.array(
+            [21.0, 21.0])) / (3 * neighbor))
+    assert helpers.approx_equal(som_._weights[2], [21.0, 21.0])
+
+
+def test_som_batch_reduces_distances():
+    input_matrix, target_matrix = datasets.get_xor()
+
+    num_neurons = random.randint(2, 10)
+    som_ = som.SOM(2, num_neurons, initial_weights_range=0.25, batch=True)
+
+    all_closest = numpy.min(som_.activate(input_matrix), axis=-1)
+    som_.train(input_matrix, target_matrix, iterations=20)
+    new_closest = numpy.min(som_.activate(input_matrix), axis=-1)
+    assert numpy.mean(new_closest) < numpy.mean(all_closest)
+
+
+def test_som_batch_train_error_break():
+    input_matrix, target_matrix = datasets.get_xor()
+    som_ = som.SOM(2, 4, neighborhood=0, batch=True)
+    som_.logging = False
+
+    # Each input gets its own neuron, so error reaches 0
+    som_._weights = input_matrix + 0.1
+    error = som_.train(input_matrix, target_matrix, iterations=10,
+                       error_break=1e-6)
+    assert error <= 1e-6
+    assert som_.iteration < 10
+
+
+@pytest.mark.parametrize('block_size', [1, 3, 1024])
+def test_SOM_activate_matrix_blocks(monkeypatch, block_size):
+    monkeypatch.setattr(som, 'BLOCK_SIZE', block_size)
+    som_ = som.SOM(3, 4)
+    input_matrix = numpy.random.random((random.randint(1, 10), 3))
+
+    assert helpers.approx_equal(
+        som_.activate(input_matrix),
+        [som_.activate(input_vec) for input_vec in input_matrix])
+
+
+def test_SOM_activate_out():
+    som_ = som.SOM(3, 4)
+    input_matrix = numpy.random.random((5, 3))
+    expected = som_.activate(input_matrix).copy()
+
+    out = numpy.empty((5, 4))
+    assert som_.activate(input_matrix, out=out) is out
+    assert helpers.approx_equal(out, expected)
+
+    out = numpy.empty(4)
+    assert som_.activate(input_matrix[0], out=out) is out
+    assert helpers.approx_equal(out, expected[0])
+
+
+def test_lattice_positions_rect():
+    assert (som._lattice_positions(6, 'rect', (2, 3)) == numpy.array(
+        [[0, 0], [1, 0], [2, 0], [0, 1], [1, 1], [2, 1]])).all()
+
+    # Defaults to most square grid
+    assert (som._lattice_positions(6, 'rect') == som._lattice_positions(
+        6, 'rect', (2, 3))).all()
+
+
+def test_lattice_positions_hex():
+    positions = som._lattice_positions(25, 'hex', (5, 5))
+
+    # Interior neuron has 6 nearest neighbors, all at distance 1
+    distances = numpy.sqrt(numpy.sum((positions - positions[12])**2, axis=1))
+    assert numpy.sum(numpy.abs(distances - 1.0) < 1e-9) == 6
+    assert numpy.min(distances[distances > 1.0 + 1e-9]) > 1.5
+
+
+def test_lattice_positions_invalid():
+    with pytest.raises(ValueError):
+        som._lattice_positions(6, 'not_a_topology')
+    with pytest.raises(ValueError):
+        som._lattice_positions(6, 'rect', (2, 2))
+
+
+def test_som_rect_neighborhood_kernel():
+    som_ = som.SOM(2, 9, neighborhood=1, topology='rect')
+    kernel = som_._get_neighborhood_kernel()
+
+    # Center neuron of 3x3 grid moves itself and 4 adjacent neurons
+    assert list(numpy.flatnonzero(kernel[4])) == [1, 3, 4, 5, 7]
+    assert list(som_._neighbor_indices[4]) == [1, 3, 4, 5, 7]
+    assert helpers.approx_equal(kernel[4, [1, 4]], [math.exp(-1.0), 1.0])
+
+
+def test_som_decay_steps_neighbor_indices_rebuilt_on_crossing():
+    # Neighborhood decays from 2 to 2 * exp(-0.5) ~= 1.2,
+    # so it only crosses lattice distance 2
+    som_ = som.SOM(2, 5, neighborhood=2, decay_steps=100.0)
+    input_matrix = numpy.random.random((3, 2))
+
+    all_neighbor_indices = []
+    for _ in range(50):
+        som_.train_step(input_matrix, input_matrix)
+        if not any(neighbor_indices is som_._neighbor_indices
+                   for neighbor_indices in all_neighbor_indices):
+            all_neighbor_indices.append(som_._neighbor_indices)
+
+    assert len(all_neighbor_indices) == 2
+    assert [list(indices) for indices in all_neighbor_indices[-1]] == [
+        [0, 1], [0, 1, 2], [1, 2, 3], [2, 3, 4], [3, 4]]
+
+
+def test_som_decay_steps():
+    som_ = som.SOM(2, 5, move_rate=0.5, neighborhood=2,
+                   neighbor_move_rate=1.0, decay_steps=1.0)
+    input_matrix = numpy.random.random((3, 2))
+    assert som_._decay() == 1.0
+
+    som_.train_step(input_matrix, input_matrix)
+    som_.train_step(input_matrix, input_matrix)
+    assert helpers.approx_equal(som_._decay(), math.exp(-2.0))
+
+    # Neighborhood shrinks to the winner
+    kernel = som_._get_neighborhood_kernel()
+    assert (kernel == numpy.eye(5)).all()
+
+    # Reset restarts schedule
+    som_.reset()
+    assert som_._decay() == 1.0
@@ -22,9 +22,13 @@
 # SOFTWARE.
 ###############################################################################
 
+import inspect
+
 import numpy
+import pytest
 
-from learning.optimize import linesearch
+from learning.optimize import (Problem, WolfeLineSearch, IncrPrevStep,
+                               linesearch)
 
 
 #########################
@@ -82,3 +86,96 @@ def _curvature_test(xk, step_size):
 
     return linesearch._curvature_condition(
         df(xk), -df(xk), df(xk - step_size * df(xk)), 0.1)
+
+
+#########################
+# Wolfe line search
+#########################
+def test_wolfe_line_search_invalid_interpolation():
+    with pytest.raises(ValueError):
+        WolfeLineSearch(interpolation='linear')
+
+
+def test_wolfe_line_search_interpolation_defaults_match():
+    interpolation = WolfeLineSearch()._interpolation
+    assert inspect.getargspec(
+        linesearch._line_search_wolfe).defaults[-1] == interpolation
+    assert inspect.getargspec(
+        linesearch._zoom_wolfe).defaults[-1] == interpolation
+
+
+def test_wolfe_line_search_satisfies_wolfe_conditions():
+    for interpolation in linesearch.INTERPOLATIONS:
+        for initial_step in [1e-3, 1.0, 1e3]:
+            _check_wolfe_line_search(interpolation, initial_step)
+
+
+def _check_wolfe_line_search(interpolation, initial_step):
+    # Quartic, so interpolation is not exact
+    f = lambda vec: numpy.sum(vec**4) + numpy.sum(vec**2)
+    df = lambda vec: 4.0 * vec**3 + 2.0 * vec
+
+    xk = numpy.array([1.0, -2.0])
+    step_size = linesearch._line_search_wolfe(
+        xk, f(xk), df(xk), -df(xk), lambda vec: (f(vec), df(vec)), 1e-4, 0.1,
+        initial_step, interpolation)
+
+    assert linesearch._wolfe_conditions(
+        step_size, xk, f(xk), df(xk), -df(xk), f(xk - step_size * df(xk)),
+        df(xk - step_size * df(xk)), 1e-4, 0.1)
+
+
+def test_wolfe_line_search_evaluations():
+    problem = Problem(
+        obj_jac_func=lambda vec: (numpy.sum(vec**4) + numpy.sum(vec**2),
+                                  4.0 * vec**3 + 2.0 * vec))
+    xk = numpy.array([1.0, -2.0])
+    obj_xk, jac_xk = problem.get_obj_jac(xk)
+
+    evaluations = {}
+    for interpolation in linesearch.INTERPOLATIONS:
+        step_size_getter = WolfeLineSearch(
+            c_2=0.1,
+            initial_step_getter=IncrPrevStep(),
+            interpolation=interpolation)
+
+        step_size_getter(xk, obj_xk, jac_xk, -jac_xk, problem)
+        assert step_size_getter.evaluations > 0
+        assert (step_size_getter.total_evaluations ==
+                step_size_getter.evaluations)
+        evaluations[interpolation] = step_size_getter.evaluations
+
+        # Counter is per call, total is not cleared by reset
+        step_size_getter.reset()
+        step_size_getter(xk, obj_xk, jac_xk, -jac_xk, problem)
+        assert (step_size_getter.total_evaluations ==
+                evaluations[interpolation] + step_size_getter.evaluations)
+
+    assert evaluations['cubic'] <= evaluations['bisect']
+
+
+def test_cubic_minimizer():
+    # Cubic interpolation is exact for cubic functions
+    f = lambda x: x**3 - 6.0 * x**2 + 9.0 * x
+    df = lambda x: 3.0 * x**2 - 12.0 * x + 9.0
+
+    # Local minimum at 3
+    assert numpy.isclose(
+        linesearch._cubic_minimizer(2.0, f(2.0), df(2.0), 5.0, f(5.0), df(5.0)),
+        3.0)
+    assert numpy.isclose(
+        linesearch._cubic_minimizer(5.0, f(5.0), df(5.0), 2.0, f(2.0), df(2.0)),
+        3.0)
+
+
+def test_quadratic_minimizer():
+    # Quadratic interpolation is exact for quadratic functions
+    f = lambda x: (x - 3.0)**2
+    df = lambda x: 2.0 * (x - 3.0)
+
+    assert numpy.isclose(
+        linesearch._quadratic_minimizer(0.0, f(0.0), df(0.0), 5.0, f(5.0)),
+        3.0)
+
+    # No minimizer, for negative curvature
+    assert linesearch._quadratic_minimizer(0.0, 0.0, -1.0, 1.0, -2.0) is None
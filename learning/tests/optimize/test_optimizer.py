@@ -23,11 +23,14 @@
 ###############################################################################
 
 import numpy
+import pytest
 
 from learning import optimize
 from learning.optimize import (Problem, BacktrackingLineSearch,
                                WolfeLineSearch, BFGS, LBFGS, SteepestDescent,
-                               SteepestDescentMomentum)
+                               SteepestDescentMomentum, NesterovMomentum,
+                               Adagrad, RMSProp, Adam, ConjugateGradient,
+                               Newton, NewtonCG, LevenbergMarquardt, FISTA)
 from learning.optimize import optimizer
 
 from learning.testing import helpers
@@ -62,6 +65,211 @@ def test_bfgs_eq():
     assert helpers.approx_equal(H_kp1.dot(y_k), s_k)
 
 
+def test_bfgs_eq_in_place_matches_matrix_equation():
+    # Large enough to update multiple blocks of rows
+    H_k = numpy.identity(300)
+    s_k = numpy.random.random(300)
+    y_k = numpy.random.random(300)
+
+    # H_{k+1} = (I - p_k s_k y_k^T) H_k (I - p_k y_k s_k^T) + p_k s_k s_k^T
+    I = numpy.identity(300)
+    p_k = 1.0 / y_k.dot(s_k)
+    expected = ((I - p_k * numpy.outer(s_k, y_k)).dot(H_k).dot(
+        I - p_k * numpy.outer(y_k, s_k)) + p_k * numpy.outer(s_k, s_k))
+
+    assert helpers.approx_equal(optimizer._bfgs_eq(H_k, s_k, y_k), expected)
+
+    # Update in place
+    H_kp1 = optimizer._bfgs_eq(H_k, s_k, y_k, out=H_k)
+    assert H_kp1 is H_k
+    assert helpers.approx_equal(H_k, expected)
+
+
+#########################
+# Conjugate Gradient
+#########################
+def test_conjugate_gradient_wolfe_line_search():
+    for beta_formula in optimizer.CG_BETA_FORMULAS:
+        check_optimize_sphere_function(
+            ConjugateGradient(beta_formula=beta_formula))
+
+
+def test_conjugate_gradient_invalid_beta_formula():
+    with pytest.raises(ValueError):
+        ConjugateGradient(beta_formula='dai_yuan')
+
+
+def test_conjugate_gradient_quadratic_converges_in_n_iterations():
+    # With exact line search, linear CG converges in at most n iterations
+    # on a convex quadratic, and all beta formulas are equivalent
+    A = numpy.random.random((5, 5))
+    A = A.T.dot(A) + numpy.identity(5)
+    f = lambda vec: 0.5 * vec.dot(A).dot(vec)
+    df = lambda vec: A.dot(vec)
+
+    for beta_formula in optimizer.CG_BETA_FORMULAS:
+        problem = Problem(obj_func=f, jac_func=df)
+        my_optimizer = ConjugateGradient(
+            step_size_getter=ExactQuadraticStepSize(A),
+            beta_formula=beta_formula,
+            restart_threshold=float('inf'))
+
+        vec = numpy.random.random(5)
+        for i in range(5):
+            _, vec = my_optimizer.next(problem, vec)
+
+        assert helpers.approx_equal(df(vec), numpy.zeros(5))
+
+
+class ExactQuadraticStepSize(optimize.linesearch.StepSizeGetter):
+    """Exact minimizer along step_dir of 0.5 x^T A x."""
+
+    def __init__(self, A):
+        super(ExactQuadraticStepSize, self).__init__()
+        self._A = A
+
+    def __call__(self, xk, obj_xk, jac_xk, step_dir, problem):
+        return -jac_xk.dot(step_dir) / step_dir.dot(self._A).dot(step_dir)
+
+
+def test_make_optimizer_low_memory():
+    assert isinstance(
+        optimize.make_optimizer(10, low_memory=True), ConjugateGradient)
+
+
+#########################
+# Newton
+#########################
+def test_newton_quadratic():
+    # Newton step solves quadratic exactly
+    A = numpy.random.random((10, 10))
+    A = A.T.dot(A) + numpy.identity(10)
+    f = lambda vec: 0.5 * vec.dot(A).dot(vec)
+    df = lambda vec: A.dot(vec)
+
+    problem = Problem(obj_func=f, jac_func=df, hess_func=lambda vec: A)
+
+    obj_value, vec = Newton().next(problem, numpy.random.random(10))
+    assert helpers.approx_equal(vec, numpy.zeros(10))
+
+
+def test_newton_not_positive_definite():
+    # Steepest descent when hessian is not positive definite
+    problem = Problem(
+        obj_func=lambda vec: vec[0]**2 - vec[1]**2,
+        jac_func=lambda vec: numpy.array([2.0 * vec[0], -2.0 * vec[1]]),
+        hess_func=lambda vec: numpy.diag([2.0, -2.0]))
+    jacobian = numpy.array([2.0, -2.0])
+
+    assert helpers.approx_equal(
+        Newton()._get_step_dir(problem, numpy.array([1.0, 1.0]), jacobian),
+        -jacobian)
+
+
+def test_newton_no_hessian():
+    problem = Problem(
+        obj_func=lambda vec: vec.dot(vec), jac_func=lambda vec: 2.0 * vec)
+    with pytest.raises(ValueError):
+        Newton().next(problem, numpy.random.random(2))
+
+
+#########################
+# Newton-CG
+#########################
+def test_newton_cg_wolfe_line_search():
+    # Hessian vector products from finite difference of jacobian
+    check_optimize_sphere_function(NewtonCG())
+
+
+def test_newton_cg_ill_conditioned_quadratic():
+    # Truncated Newton converges superlinearly,
+    # regardless of condition number
+    A = numpy.random.random((20, 20))
+    A = A.T.dot(A) + numpy.diag(numpy.logspace(-3, 3, 20))
+    f = lambda vec: 0.5 * vec.dot(A).dot(vec)
+    df = lambda vec: A.dot(vec)
+
+    problem = Problem(
+        obj_func=f, jac_func=df, hess_vec_func=lambda vec, d: A.dot(d))
+
+    my_optimizer = NewtonCG(max_cg_iterations=100)
+    vec = numpy.random.random(20)
+    for i in range(15):
+        obj_value, vec = my_optimizer.next(problem, vec)
+
+    assert f(vec) <= 1e-10
+
+
+#########################
+# Levenberg-Marquardt
+#########################
+def test_levenberg_marquardt_matrix_free():
+    # No residual jacobian, so steps are found with conjugate gradient
+    check_optimize_sphere_function(LevenbergMarquardt())
+
+
+def test_levenberg_marquardt_linear_least_squares():
+    # Gauss-Newton hessian is exact, for linear residuals
+    A = numpy.random.random((30, 10))
+    b = numpy.random.random(30)
+    f = lambda vec: (A.dot(vec) - b).dot(A.dot(vec) - b)
+    df = lambda vec: 2.0 * A.T.dot(A.dot(vec) - b)
+
+    problem = Problem(
+        obj_func=f, jac_func=df, residual_jac_func=lambda vec: A)
+
+    my_optimizer = LevenbergMarquardt()
+    vec = numpy.random.random(10)
+    for i in range(10):
+        obj_value, vec = my_optimizer.next(problem, vec)
+
+    assert helpers.approx_equal(
+        vec,
+        numpy.linalg.lstsq(
+            A, b, rcond=numpy.finfo(float).eps * max(A.shape))[0],
+        tol=1e-6)
+
+
+def test_levenberg_marquardt_invalid_damping():
+    with pytest.raises(ValueError):
+        LevenbergMarquardt(damping_increase=0.5)
+    with pytest.raises(ValueError):
+        LevenbergMarquardt(damping_decrease=2.0)
+
+
+#########################
+# FISTA
+#########################
+def test_fista_smooth():
+    # Without nonsmooth objective, FISTA is accelerated gradient descent
+    check_optimize_sphere_function(FISTA())
+
+
+def test_fista_lasso():
+    # min (x - 3)^2 + (y - 0.5)^2 + |x| + |y| is at (2.5, 0)
+    problem = Problem(
+        obj_func=lambda vec: numpy.sum((vec - [3.0, 0.5])**2),
+        jac_func=lambda vec: 2.0 * (vec - [3.0, 0.5]),
+        prox_func=lambda vec, t: numpy.sign(vec) * numpy.maximum(
+            numpy.abs(vec) - t, 0.0),
+        nonsmooth_obj_func=lambda vec: numpy.sum(numpy.abs(vec)))
+
+    my_optimizer = FISTA()
+    vec = numpy.random.random(2)
+    for i in range(100):
+        obj_value, vec = my_optimizer.next(problem, vec)
+
+    assert helpers.approx_equal(vec[0], 2.5)
+    # Soft thresholding gives exact 0
+    assert vec[1] == 0.0
+    assert helpers.approx_equal(my_optimizer.jacobian, numpy.zeros(2))
+
+
+def test_fista_invalid_lipschitz_increase():
+    with pytest.raises(ValueError):
+        FISTA(lipschitz_increase=1.0)
+
+
 #########################
 # L-BFGS
 #########################
@@ -127,6 +335,51 @@ def test_LBFGS_non_smooth_gradient():
     assert obj_value <= 1e-10
 
 
+def test_LBFGS_compact_representation_wolfe_line_search():
+    check_optimize_sphere_function(
+        LBFGS(step_size_getter=WolfeLineSearch(), compact_representation=True))
+
+
+def test_LBFGS_compact_representation_approx_equal_two_loop_recursion():
+    check_lbfgs_compact_representation(num_remembered_iterations=3)
+
+
+def test_LBFGS_compact_representation_approx_equal_two_loop_recursion_infinite_num_remembered_iterations():
+    # More iterations than initially allocated differences
+    check_lbfgs_compact_representation(
+        num_remembered_iterations=float('inf'),
+        iterations=optimizer._LBFGS_INITIAL_CAPACITY + 5)
+
+
+def check_lbfgs_compact_representation(num_remembered_iterations,
+                                       iterations=10):
+    # Ill-conditioned quadratic function
+    A = numpy.random.random((30, 30))
+    A = A.T.dot(A) + numpy.diag(numpy.random.uniform(0.1, 100.0, 30))
+    f = lambda vec: 0.5 * vec.dot(A).dot(vec)
+    df = lambda vec: A.dot(vec)
+
+    problem = Problem(obj_func=f, jac_func=df)
+
+    # Optimize
+    two_loop_vec = numpy.random.random(30)
+    compact_vec = numpy.copy(two_loop_vec)
+
+    two_loop_optimizer = LBFGS(
+        step_size_getter=WolfeLineSearch(),
+        num_remembered_iterations=num_remembered_iterations)
+    compact_optimizer = LBFGS(
+        step_size_getter=WolfeLineSearch(),
+        num_remembered_iterations=num_remembered_iterations,
+        compact_representation=True)
+
+    for i in range(iterations):
+        _, two_loop_vec = two_loop_optimizer.next(problem, two_loop_vec)
+        _, compact_vec = compact_optimizer.next(problem, compact_vec)
+
+        assert helpers.approx_equal(two_loop_vec, compact_vec)
+
+
 ############################
 # Backtracking Line Search
 ############################
@@ -148,6 +401,48 @@ def test_steepest_descent_wolfe_line_search():
         SteepestDescent(step_size_getter=WolfeLineSearch()))
 
 
+############################
+# Adaptive optimizers
+############################
+def test_nesterov_momentum():
+    check_optimize_sphere_function(NesterovMomentum(step_size=0.01))
+
+
+def test_adagrad():
+    check_optimize_sphere_function(Adagrad(step_size=1.0))
+
+
+def test_rmsprop():
+    check_optimize_sphere_function(RMSProp(step_size=0.1))
+
+
+def test_adam():
+    check_optimize_sphere_function(Adam(step_size=0.1))
+
+
+def test_adaptive_optimizers_one_evaluation_per_iteration():
+    for my_optimizer in [NesterovMomentum(), Adagrad(), RMSProp(), Adam()]:
+        evaluations = [0]
+
+        def obj_jac_func(vec):
+            evaluations[0] += 1
+            return numpy.sum(vec**2), 2.0 * vec
+
+        problem = Problem(obj_jac_func=obj_jac_func)
+
+        vec = numpy.array([10.0, 10.0])
+        for i in range(10):
+            _, vec = my_optimizer.next(problem, vec)
+        assert evaluations[0] == 10
+
+        # Reset discards state
+        my_optimizer.reset()
+        _, reset_vec = my_optimizer.next(problem, numpy.array([10.0, 10.0]))
+        my_optimizer.reset()
+        _, first_vec = my_optimizer.next(problem, numpy.array([10.0, 10.0]))
+        assert helpers.approx_equal(reset_vec, first_vec)
+
+
 ######################
 # Helpers
 ######################
@@ -22,7 +22,11 @@
 # SOFTWARE.
 ###############################################################################
 
-from learning.optimize import Problem
+import pickle
+
+import numpy
+
+from learning.optimize import Problem, EvaluationCache
 
 
 # NOTE: Not all combinations are tested
@@ -114,3 +118,163 @@ def test_optimizer_get_obj_jac_hess_individual_obj_jac_hess():
         jac_func=lambda x: x + 1,
         hess_func=lambda x: x + 2)
     assert tuple(problem.get_obj_jac_hess(1)) == (1, 2, 3)
+
+
+##################################
+# Problem.get_hess_vec
+##################################
+def test_optimizer_get_hess_vec_hess_vec_func():
+    problem = Problem(hess_vec_func=lambda x, v: x + v)
+    assert problem.get_hess_vec(1, 2) == 3
+
+
+def test_optimizer_get_hess_vec_hess_func():
+    A = numpy.random.random((3, 3))
+    problem = Problem(hess_func=lambda x: A)
+    vec = numpy.random.random(3)
+    assert numpy.allclose(problem.get_hess_vec(numpy.zeros(3), vec), A.dot(vec))
+
+
+def test_optimizer_get_hess_vec_finite_difference_jac():
+    # Quadratic, 0.5 x^T A x, with jacobian A x and hessian A
+    A = numpy.random.random((3, 3))
+    A = A + A.T
+
+    # Jacobian buffer is re-used between calls
+    jacobian = numpy.zeros(3)
+    def jac_func(x):
+        numpy.dot(A, x, out=jacobian)
+        return jacobian
+
+    problem = Problem(jac_func=jac_func)
+    vec = numpy.random.random(3)
+    assert numpy.allclose(
+        problem.get_hess_vec(numpy.random.random(3), vec), A.dot(vec),
+        atol=1e-5)
+
+
+##################################
+# Problem.get_prox
+##################################
+def test_optimizer_get_prox_prox_func():
+    problem = Problem(prox_func=lambda x, t: x - t)
+    assert problem.get_prox(3, 1) == 2
+
+
+def test_optimizer_get_prox_no_nonsmooth_obj():
+    # g(x) = 0, so prox is identity
+    problem = Problem(obj_func=lambda x: x)
+    assert problem.get_prox(3, 1) == 3
+    assert problem.get_nonsmooth_obj(3) == 0
+
+
+##################################
+# EvaluationCache
+##################################
+def test_problem_cache_obj_jac_re_uses_values():
+    calls = []
+
+    def obj_jac_func(x):
+        calls.append(x)
+        return numpy.sum(x**2), 2 * x
+
+    cache = EvaluationCache()
+    problem = Problem(obj_jac_func=obj_jac_func, cache=cache)
+
+    x = numpy.array([1.0, 2.0])
+    assert problem.get_obj_jac(x)[0] == 5.0
+    assert problem.get_obj_jac(numpy.copy(x))[0] == 5.0
+    assert problem.get_obj(x) == 5.0
+    assert (problem.get_jac(x) == [2.0, 4.0]).all()
+
+    assert len(calls) == 1
+    assert cache.misses == 1
+    assert cache.hits == 3
+
+
+def test_problem_cache_obj_does_not_satisfy_obj_jac():
+    cache = EvaluationCache()
+    problem = Problem(
+        obj_func=lambda x: numpy.sum(x**2), jac_func=lambda x: 2 * x,
+        cache=cache)
+
+    x = numpy.array([1.0, 2.0])
+    problem.get_obj(x)
+    obj, jac = problem.get_obj_jac(x)
+
+    assert obj == 5.0
+    assert (jac == [2.0, 4.0]).all()
+    assert cache.hits == 0
+    assert cache.misses == 2
+
+    # Now cached
+    problem.get_obj_jac(x)
+    assert cache.hits == 1
+
+
+def test_problem_cache_shared_between_problems():
+    cache = EvaluationCache()
+    x = numpy.array([1.0, 2.0])
+
+    Problem(obj_func=lambda x: numpy.sum(x), cache=cache).get_obj(x)
+    assert Problem(obj_func=lambda x: None, cache=cache).get_obj(x) == 3.0
+
+
+def test_problem_cache_max_size():
+    cache = EvaluationCache(max_size=2)
+    problem = Problem(obj_func=lambda x: numpy.sum(x), cache=cache)
+
+    problem.get_obj(numpy.array([1.0]))
+    problem.get_obj(numpy.array([2.0]))
+    problem.get_obj(numpy.array([3.0]))  # Discards [1.0]
+    assert cache.misses == 3
+
+    problem.get_obj(numpy.array([1.0]))
+    assert cache.misses == 4
+    problem.get_obj(numpy.array([3.0]))
+    assert cache.hits == 1
+
+
+def test_problem_cache_stores_copy_of_jacobian():
+    jac_buffer = numpy.zeros(2)
+
+    def obj_jac_func(x):
+        jac_buffer[:] = 2 * x
+        return numpy.sum(x**2), jac_buffer
+
+    problem = Problem(obj_jac_func=obj_jac_func, cache=EvaluationCache())
+    problem.get_obj_jac(numpy.array([1.0, 2.0]))
+    problem.get_obj_jac(numpy.array([3.0, 4.0]))
+
+    assert (problem.get_jac(numpy.array([1.0, 2.0])) == [2.0, 4.0]).all()
+
+
+def test_problem_cache_check_objective():
+    cache = EvaluationCache()
+    problem = Problem(obj_func=lambda x: numpy.sum(x), cache=cache)
+    x = numpy.array([1.0])
+    dataset = numpy.array([[1.0]])
+
+    cache.check_objective(dataset)
+    problem.get_obj(x)
+
+    # Same objective, values kept
+    cache.check_objective(dataset)
+    problem.get_obj(x)
+    assert cache.hits == 1
+
+    # Different objective, values discarded
+    cache.check_objective(numpy.copy(dataset))
+    problem.get_obj(x)
+    assert cache.hits == 1
+    assert cache.misses == 2
+
+
+def test_problem_cache_pickle_without_values():
+    cache = EvaluationCache()
+    problem = Problem(obj_func=lambda x: numpy.sum(x), cache=cache)
+    problem.get_obj(numpy.array([1.0]))
+
+    cache_copy = pickle.loads(pickle.dumps(cache, protocol=2))
+    assert cache_copy.misses == 1
+    assert len(cache_copy._entries) == 0
@@ -271,6 +271,67 @@ def test_model_train_retry():
     assert 0
 
 
+class RandomErrorModel(base.Model):
+    """Model with a random error, chosen on reset."""
+
+    def __init__(self):
+        super(RandomErrorModel, self).__init__()
+        self.error = 1.0
+
+    def reset(self):
+        super(RandomErrorModel, self).reset()
+        self.error = random.uniform(0.5, 1.0)
+
+    def train_step(self, input_matrix, target_matrix):
+        # Converge on reset attempts, with small enough error
+        self.converged = self.error < 0.6
+        return self.error
+
+
+class NonConvergingRandomErrorModel(RandomErrorModel):
+    """Model with a random error, that never converges."""
+
+    def train_step(self, input_matrix, target_matrix):
+        self.converged = False
+        return self.error
+
+
+def test_model_train_parallel_retries_best_attempt():
+    num_attempts = 6
+
+    # Each attempt is seeded from numpy.random,
+    # so errors of all attempts can be computed in advance
+    numpy.random.seed(0)
+    seeds = numpy.random.randint(0, 2**31 - 1, size=num_attempts)
+    attempt_errors = [1.0]  # First attempt is not reset
+    for seed in seeds[1:]:
+        random.seed(seed)
+        attempt_errors.append(random.uniform(0.5, 1.0))
+
+    numpy.random.seed(0)
+    model = NonConvergingRandomErrorModel()
+    model.logging = False
+    error = model.train([[0.0]], [[0.0]], iterations=1,
+                        retries=num_attempts - 1, error_break=0.0,
+                        retry_n_jobs=2)
+
+    # Best attempt is kept
+    assert error == min(attempt_errors)
+    assert model.error == min(attempt_errors)
+
+
+def test_model_train_parallel_retries_converged():
+    # If attempts did not have independent random streams,
+    # all reset attempts would have the same error
+    model = RandomErrorModel()
+    model.logging = False
+    error = model.train([[0.0]], [[0.0]], iterations=1, retries=40,
+                        error_break=0.0, retry_n_jobs=2)
+
+    assert model.converged
+    assert error < 0.6
+
+
 def test_Model_custom_converged():
     class ConvergeModel(helpers.SetOutputModel):
         def train_step(self, *args, **kwargs):
@@ -47,6 +47,42 @@ def test_protvecdiv_zero_den():
         numpy.array([2.0, 0.0, 0.0])) == numpy.array([0.5, 0.0, 0.0])).all()
 
 
+def test_distance_matrix():
+    matrix = numpy.random.random((random.randint(2, 5), random.randint(1, 5)))
+    vec = numpy.random.random(matrix.shape[1])
+
+    assert helpers.approx_equal(
+        calculate.distance(matrix, vec),
+        [calculate.distance(row, vec) for row in matrix])
+
+
+def test_squared_distances():
+    matrix_a = numpy.random.random((random.randint(1, 5), random.randint(1, 5)))
+    matrix_b = numpy.random.random((random.randint(1, 5), matrix_a.shape[1]))
+
+    expected = [[calculate.distance(vec_a, vec_b)**2 for vec_b in matrix_b]
+                for vec_a in matrix_a]
+    assert helpers.approx_equal(
+        calculate.squared_distances(matrix_a, matrix_b), expected)
+    assert helpers.approx_equal(
+        calculate.squared_distances(
+            matrix_a, matrix_b,
+            sq_norms_b=numpy.sum(matrix_b**2, axis=1)), expected)
+
+    # Never negative, even with rounding error
+    assert (calculate.squared_distances(matrix_a, matrix_a) >= 0.0).all()
+
+
+def test_squared_distances_out():
+    matrix_a = numpy.random.random((random.randint(1, 5), 3))
+    matrix_b = numpy.random.random((random.randint(1, 5), 3))
+
+    out = numpy.empty((len(matrix_a), len(matrix_b)))
+    assert calculate.squared_distances(matrix_a, matrix_b, out=out) is out
+    assert helpers.approx_equal(
+        out, calculate.squared_distances(matrix_a, matrix_b))
+
+
 #######################
 # Transfers
 #######################
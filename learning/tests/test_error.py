@@ -63,6 +63,14 @@ def test_mse_derivative_matrix():
     check_error_gradient(error.MeanSquaredError(), tensor_d=2)
 
 
+def test_mse_hessian_vector_product_vector():
+    check_error_hessian_vector_product(error.MeanSquaredError(), tensor_d=1)
+
+
+def test_mse_hessian_vector_product_matrix():
+    check_error_hessian_vector_product(error.MeanSquaredError(), tensor_d=2)
+
+
 def test_mse_derivative_error_equals_call_error_vec():
     check_derivative_error_equals_call_error(
         error.MeanSquaredError(), tensor_d=1)
@@ -119,6 +127,14 @@ def test_cross_entropy_derivative_matrix():
     check_error_gradient(error.CrossEntropyError(), tensor_d=2)
 
 
+def test_cross_entropy_hessian_vector_product_vector():
+    check_error_hessian_vector_product(error.CrossEntropyError(), tensor_d=1)
+
+
+def test_cross_entropy_hessian_vector_product_matrix():
+    check_error_hessian_vector_product(error.CrossEntropyError(), tensor_d=2)
+
+
 def test_cross_entropy_derivative_equal_tensors():
     """Should not raise error or return nan, when both inputs match.
 
@@ -138,6 +154,39 @@ def test_cross_entropy_derivative_error_equals_call_error_matrix():
         error.CrossEntropyError(), tensor_d=2)
 
 
+#########################
+# Binary cross entropy
+#########################
+def test_binary_cross_entropy():
+    assert error.BinaryCrossEntropyError()(
+        numpy.array([[0., 1.], [1., 0.]]), numpy.array([[0., 1.], [1., 0.]])) == 0
+    assert helpers.approx_equal(
+        error.BinaryCrossEntropyError()(numpy.array([0.5, 0.5]),
+                                        numpy.array([0., 1.])),
+        numpy.log(2.0))
+
+
+def test_binary_cross_entropy_derivative_vector():
+    # Away from 0 and 1, where derivative is large
+    check_error_gradient(
+        error.BinaryCrossEntropyError(), tensor_d=1, low=0.1, high=0.9)
+
+
+def test_binary_cross_entropy_derivative_matrix():
+    check_error_gradient(
+        error.BinaryCrossEntropyError(), tensor_d=2, low=0.1, high=0.9)
+
+
+def test_binary_cross_entropy_hessian_vector_product_matrix():
+    check_error_hessian_vector_product(
+        error.BinaryCrossEntropyError(), tensor_d=2, low=0.1, high=0.9)
+
+
+def test_binary_cross_entropy_derivative_error_equals_call_error():
+    check_derivative_error_equals_call_error(
+        error.BinaryCrossEntropyError(), tensor_d=2)
+
+
 #############################
 # Penalty Functions
 #############################
@@ -151,17 +200,50 @@ def test_L2Penalty_jacobian():
     helpers.check_gradient(penalty_func, penalty_func.derivative)
 
 
+def test_L1Penalty_hessian_vector_product():
+    check_penalty_hessian_vector_product(
+        error.L1Penalty(penalty_weight=random.uniform(0.0, 2.0)))
+
+
+def test_L2Penalty_hessian_vector_product():
+    check_penalty_hessian_vector_product(
+        error.L2Penalty(penalty_weight=random.uniform(0.0, 2.0)))
+
+
+def test_L1Penalty_proximal():
+    # Soft thresholding
+    penalty_func = error.L1Penalty(penalty_weight=0.5)
+    assert list(penalty_func.proximal(numpy.array([-2.0, -0.5, 0.2, 1.5]),
+                                      2.0)) == [-1.0, 0.0, 0.0, 0.5]
+
+
+def test_L1Penalty_proximal_minimizes():
+    check_penalty_proximal(
+        error.L1Penalty(penalty_weight=random.uniform(0.0, 2.0)))
+
+
+def test_L2Penalty_proximal_minimizes():
+    check_penalty_proximal(
+        error.L2Penalty(penalty_weight=random.uniform(0.0, 2.0)))
+
+
+def test_L2Penalty_proximal_large_step():
+    # Entire vector becomes 0
+    assert list(error.L2Penalty().proximal(numpy.array([0.3, 0.4]),
+                                           1.0)) == [0.0, 0.0]
+
+
 #############################
 # Helpers
 #############################
-def check_error_gradient(error_func, tensor_d=1):
+def check_error_gradient(error_func, tensor_d=1, low=0.0, high=1.0):
     tensor_shape = [random.randint(1, 10) for _ in range(tensor_d)]
 
     tensor_b = numpy.random.random(tensor_shape)
     helpers.check_gradient(
         lambda X: error_func(X, tensor_b),
         lambda X: error_func.derivative(X, tensor_b)[1],
-        f_arg_tensor=numpy.random.random(tensor_shape),
+        f_arg_tensor=numpy.random.uniform(low, high, tensor_shape),
         f_shape='scalar')
 
 
@@ -171,3 +253,43 @@ def check_derivative_error_equals_call_error(error_func, tensor_d=1):
     tensor_b = numpy.random.random(tensor_shape)
 
     assert error_func(tensor_a, tensor_b) == error_func.derivative(tensor_a, tensor_b)[0]
+
+
+def check_error_hessian_vector_product(error_func, tensor_d=1, low=0.5,
+                                       high=1.0):
+    tensor_shape = [random.randint(1, 10) for _ in range(tensor_d)]
+
+    # Hessian vector product is derivative of jacobian dot vector
+    tensor_b = numpy.random.random(tensor_shape)
+    direction_tensor = numpy.random.random(tensor_shape)
+    helpers.check_gradient(
+        lambda X: numpy.sum(error_func.derivative(X, tensor_b)[1] * direction_tensor),
+        lambda X: error_func.hessian_vector_product(X, tensor_b, direction_tensor),
+        # Away from 0, for cross entropy
+        f_arg_tensor=numpy.random.uniform(low, high, tensor_shape),
+        f_shape='scalar')
+
+
+def check_penalty_proximal(penalty_func):
+    # Prox minimizes penalty(W') + ||W' - W||^2 / (2 step_size)
+    weight_vec = numpy.random.uniform(-1.0, 1.0, random.randint(2, 10))
+    step_size = random.uniform(0.1, 1.0)
+    f = lambda W: penalty_func(W) + numpy.sum(
+        (W - weight_vec)**2) / (2.0 * step_size)
+
+    prox_vec = penalty_func.proximal(weight_vec, step_size)
+    for _ in range(10):
+        assert f(prox_vec) <= f(
+            prox_vec + numpy.random.uniform(-0.01, 0.01, weight_vec.shape))
+
+
+def check_penalty_hessian_vector_product(penalty_func):
+    weight_shape = random.randint(2, 10)
+
+    # Hessian vector product is derivative of jacobian dot vector
+    direction_vec = numpy.random.random(weight_shape)
+    helpers.check_gradient(
+        lambda W: penalty_func.derivative(W).dot(direction_vec),
+        lambda W: penalty_func.hessian_vector_product(W, direction_vec),
+        f_arg_tensor=numpy.random.uniform(0.5, 1.0, weight_shape),
+        f_shape='scalar')
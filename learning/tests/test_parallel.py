@@ -0,0 +1,87 @@
+###############################################################################
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Justin Lovinger
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+import multiprocessing
+
+import numpy
+import pytest
+
+from learning import parallel, MLP, SoftmaxTransfer, CrossEntropyError
+from learning.data import datasets
+
+from learning.testing import helpers
+
+
+############################
+# num_processes
+############################
+def test_num_processes():
+    assert parallel.num_processes(None) == 1
+    assert parallel.num_processes(3) == 3
+    assert parallel.num_processes(-1) == multiprocessing.cpu_count()
+
+
+def test_num_processes_zero():
+    with pytest.raises(ValueError):
+        parallel.num_processes(0)
+
+
+############################
+# shared_array
+############################
+def test_shared_array():
+    array = numpy.random.random((3, 4))
+    shared = parallel.shared_array(array)
+    assert shared.dtype == array.dtype
+    assert (shared == array).all()
+
+    # Copy, not a view
+    shared[0, 0] = 2.0
+    assert array[0, 0] != 2.0
+
+
+############################
+# DataParallelObjective
+############################
+def test_data_parallel_objective_matches_serial():
+    model = MLP((2, 3, 2), transfers=SoftmaxTransfer(),
+                error_func=CrossEntropyError())
+    input_matrix, target_matrix = datasets.get_random_classification(
+        11, 2, 2)
+    parameters = numpy.copy(model._parameters)
+
+    data_parallel = parallel.DataParallelObjective(model, input_matrix,
+                                                   target_matrix, 3)
+    try:
+        obj_value, jacobian = data_parallel.get_obj_jac(parameters)
+        assert helpers.approx_equal(
+            data_parallel.get_obj(parameters),
+            model._get_obj(parameters, input_matrix, target_matrix))
+        expected_obj, expected_jac = model._get_obj_jac(
+            parameters, input_matrix, target_matrix)
+    finally:
+        data_parallel.close()
+
+    assert helpers.approx_equal(obj_value, expected_obj)
+    assert helpers.approx_equal(jacobian, expected_jac)
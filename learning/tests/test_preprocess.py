@@ -24,6 +24,7 @@
 
 import random
 import copy
+import collections
 
 import pytest
 import numpy
@@ -149,22 +150,6 @@ def test_list_minus_i():
     assert preprocess._list_minus_i(list_, 2) == [0, 1]
 
 
-def test_count_classes():
-    _, target_matrix = datasets.get_xor()
-    class_counts = preprocess._count_classes(target_matrix)
-
-    assert len(class_counts) == 2
-    assert class_counts[(0, 1)] == 2
-    assert class_counts[(1, 0)] == 2
-
-    target_matrix = [['foo'], ['bar'], ['bar']]
-    class_counts = preprocess._count_classes(target_matrix)
-
-    assert len(class_counts) == 2
-    assert class_counts[('foo', )] == 1
-    assert class_counts[('bar', )] == 2
-
-
 def test_clean_dataset_depuration():
     dataset = [[
         [0.0],
@@ -216,6 +201,73 @@ def test_clean_dataset_depuration():
     assert removed_points == [4, 5]
 
 
+def test_clean_dataset_depuration_string_labels():
+    input_matrix = [[0.0], [1.0], [2.0], [2.6], [6.0], [7.3], [11.0], [12.0],
+                    [13.0], [10.4]]
+    target_matrix = [['foo'], ['foo'], ['foo'], ['bar'], ['baz'], ['baz'],
+                     ['bar'], ['bar'], ['bar'], ['foo']]
+
+    (inputs, targets), changed_patterns, removed_patterns = (
+        preprocess.clean_dataset_depuration(
+            input_matrix, target_matrix, k=3, k_prime=2))
+
+    # Outliers of each cluster are relabeled,
+    # and patterns between clusters have no majority class
+    assert inputs.tolist() == [[0.0], [1.0], [2.0], [2.6], [11.0], [12.0],
+                               [13.0], [10.4]]
+    assert targets.tolist() == [['foo'], ['foo'], ['foo'], ['foo'], ['bar'],
+                                ['bar'], ['bar'], ['bar']]
+    assert changed_patterns == [3, 9]
+    assert removed_patterns == [4, 5]
+
+
+@pytest.mark.parametrize('k, k_prime', [(4, 2), (3, 1), (3, 4)])
+def test_clean_dataset_depuration_invalid_k_prime(k, k_prime):
+    # With k = 4 and k_prime = 2, two classes could tie
+    with pytest.raises(ValueError):
+        preprocess.clean_dataset_depuration(
+            [[0.0], [1.0], [2.0], [3.0], [4.0]],
+            [[0], [0], [1], [1], [1]], k=k, k_prime=k_prime)
+
+
+def test_clean_dataset_depuration_matches_naive():
+    input_matrix, target_matrix = datasets.get_random_classification(
+        random.randint(20, 40), random.randint(1, 3), random.randint(2, 4))
+    k, k_prime = random.choice([(3, 2), (5, 3), (5, 4)])
+
+    # Naive depuration, one pattern at a time
+    expected_inputs = []
+    expected_targets = []
+    expected_changed = []
+    expected_removed = []
+    for i, (input_vec, target_vec) in enumerate(zip(input_matrix,
+                                                    target_matrix)):
+        distances = numpy.sum((input_matrix - input_vec)**2, axis=1)
+        distances[i] = float('inf')
+        class_counts = collections.Counter(
+            tuple(target)
+            for target in target_matrix[numpy.argsort(distances)[:k]])
+        for class_, count in class_counts.iteritems():
+            if count >= k_prime:
+                expected_inputs.append(input_vec)
+                expected_targets.append(class_)
+                if class_ != tuple(target_vec):
+                    expected_changed.append(i)
+                break
+        else:
+            expected_removed.append(i)
+
+    (inputs, targets), changed_points, removed_points = (
+        preprocess.clean_dataset_depuration(
+            input_matrix, target_matrix, k=k, k_prime=k_prime))
+    assert (inputs == numpy.array(expected_inputs).reshape(
+        -1, input_matrix.shape[1])).all()
+    assert (targets == numpy.array(expected_targets).reshape(
+        -1, target_matrix.shape[1])).all()
+    assert changed_points == expected_changed
+    assert removed_points == expected_removed
+
+
 ######################
 # PCA
 ######################
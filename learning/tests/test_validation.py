@@ -26,8 +26,9 @@ import random
 import time
 
 import numpy
+import pytest
 
-from learning import validation, MeanSquaredError
+from learning import validation, MeanSquaredError, MLP
 from learning.data import datasets
 
 from learning.testing import helpers
@@ -130,6 +131,43 @@ def test_cross_validate(monkeypatch):
     ]
 
 
+def test_cross_validate_n_jobs(monkeypatch):
+    # Patch time.clock so time attribute is deterministic
+    monkeypatch.setattr(time, 'clock', lambda: 0.0)
+
+    patterns = [([0], [1]), ([1], [1]), ([2], [1])]
+    model = helpers.SetOutputModel([1])
+
+    # Same stats as without parallelism
+    stats = validation.cross_validate(
+        model, zip(*patterns), num_folds=3, iterations=1, n_jobs=2)
+    assert (helpers.fix_numpy_array_equality(stats) ==
+            helpers.fix_numpy_array_equality(_CROSS_VALIDATION_STATS))
+
+
+def test_cross_validate_stratified_n_jobs(monkeypatch):
+    # Patch time.clock so time attribute is deterministic
+    monkeypatch.setattr(time, 'clock', lambda: 0.0)
+
+    # 3 samples of each class, in class order
+    patterns = [([0], [1, 0])] * 3 + [([1], [0, 1])] * 3
+    model = helpers.SetOutputModel([1, 0])
+
+    stats = validation.cross_validate(
+        model, zip(*patterns), num_folds=3, iterations=1, stratified=True)
+
+    # Every testing set has one sample of each class
+    for fold in stats['folds']:
+        assert (fold['testing_confusion_matrix'].sum(axis=1) == [1, 1]).all()
+
+    # Same stats as without parallelism
+    parallel_stats = validation.cross_validate(
+        model, zip(*patterns), num_folds=3, iterations=1, stratified=True,
+        n_jobs=2)
+    assert (helpers.fix_numpy_array_equality(parallel_stats) ==
+            helpers.fix_numpy_array_equality(stats))
+
+
 ################
 # Benchmark
 ################
@@ -181,6 +219,21 @@ def test_benchmark(monkeypatch):
     ]
 
 
+def test_benchmark_n_jobs(monkeypatch):
+    # Patch time.clock so time attribute is deterministic
+    monkeypatch.setattr(time, 'clock', lambda: 0.0)
+
+    patterns = [([0], [1]), ([1], [1]), ([2], [1])]
+    model = helpers.SetOutputModel([1])
+
+    # Same stats as without parallelism
+    stats = validation.benchmark(
+        model, zip(*patterns), num_folds=3, num_runs=2, iterations=1,
+        n_jobs=2)
+    assert (helpers.fix_numpy_array_equality(stats) ==
+            helpers.fix_numpy_array_equality(_BENCHMARK_STATS))
+
+
 ####################
 # Compare
 ####################
@@ -342,6 +395,45 @@ def test_get_accuracy():
                                    numpy.array([[0], [0]])) == 0.0
 
 
+def test_get_error_batch_matches_rows():
+    dataset = datasets.get_random_regression(
+        random.randint(10, 20), random.randint(2, 4), random.randint(1, 3))
+    model = MLP((len(dataset[0][0]), 3, len(dataset[1][0])))
+    assert model.supports_batch_activate
+
+    expected = numpy.mean([
+        MeanSquaredError()(model.activate(input_vec), target_vec)
+        for input_vec, target_vec in zip(*dataset)
+    ])
+    assert helpers.approx_equal(validation.get_error(model, *dataset),
+                                expected)
+    assert helpers.approx_equal(
+        validation.get_error(model, *dataset, chunk_size=3), expected)
+
+
+def test_get_accuracy_batch_matches_rows():
+    dataset = datasets.get_random_classification(
+        random.randint(10, 20), random.randint(2, 4), random.randint(2, 4))
+    model = MLP((len(dataset[0][0]), 3, len(dataset[1][0])))
+
+    expected = validation._get_accuracy(
+        validation._get_classes(
+            numpy.array([model.activate(input_vec)
+                         for input_vec in dataset[0]])),
+        validation._get_classes(dataset[1]))
+    assert validation.get_accuracy(model, *dataset) == expected
+    assert validation.get_accuracy(model, *dataset, chunk_size=3) == expected
+
+
+def test_activate_rows_without_batch_support():
+    model = helpers.RememberPatternsModel()
+    assert not model.supports_batch_activate
+    model.train(numpy.array([[0], [1]]), numpy.array([[2, 3], [4, 5]]))
+
+    assert (numpy.array(validation._activate_rows(model, numpy.array(
+        [[1], [0], [1]]))) == numpy.array([[4, 5], [2, 3], [4, 5]])).all()
+
+
 def test__get_accuracy():
     assert validation._get_accuracy(
         numpy.array([0, 1, 2, 3]), numpy.array([1, 0, 0, 0])) == 0.0
@@ -446,6 +538,95 @@ def test_split_dataset():
                                 (pattern[1] == other_pattern[1]).all())
 
 
+def test_fold_ranges_match_split_dataset():
+    num_samples = random.randint(10, 20)
+    num_folds = random.randint(2, 5)
+    input_matrix, target_matrix = datasets.get_random_regression(
+        num_samples, 2, 1)
+
+    sets = validation._split_dataset(input_matrix, target_matrix, num_folds)
+    for (start, stop), (set_inputs, set_targets) in zip(
+            validation._fold_ranges(num_samples, num_folds), sets):
+        assert (input_matrix[start:stop] == set_inputs).all()
+        assert (target_matrix[start:stop] == set_targets).all()
+
+
+def test_make_cross_validation_sets():
+    input_matrix, target_matrix = datasets.get_random_regression(10, 2, 1)
+    train_test_sets = validation.make_cross_validation_sets(
+        input_matrix, target_matrix, num_folds=3)
+
+    assert len(train_test_sets) == 3
+    # Last fold has remaining rows, and training set keeps row order
+    (train_inputs, train_targets), (test_inputs,
+                                    test_targets) = train_test_sets[2]
+    assert (test_inputs == input_matrix[6:]).all()
+    assert (test_targets == target_matrix[6:]).all()
+    assert (train_inputs == input_matrix[:6]).all()
+    assert (train_targets == target_matrix[:6]).all()
+
+
+def test_make_cross_validation_sets_testing_sets_are_views():
+    input_matrix, target_matrix = datasets.get_random_regression(10, 2, 1)
+    for _, (test_inputs, test_targets) in validation.make_cross_validation_sets(
+            input_matrix, target_matrix, num_folds=3):
+        assert test_inputs.base is input_matrix
+        assert test_targets.base is target_matrix
+
+
+def test_make_cross_validation_sets_too_many_folds():
+    with pytest.raises(ValueError):
+        validation.make_cross_validation_sets(
+            numpy.zeros((3, 1)), numpy.zeros((3, 1)), num_folds=4)
+
+
+def test_make_cross_validation_sets_lazy():
+    input_matrix, target_matrix = datasets.get_random_regression(10, 2, 1)
+    train_test_sets = validation.make_cross_validation_sets(
+        input_matrix, target_matrix, num_folds=3, lazy=True)
+    assert not isinstance(train_test_sets, list)
+
+    assert (helpers.fix_numpy_array_equality(list(train_test_sets)) ==
+            helpers.fix_numpy_array_equality(
+                validation.make_cross_validation_sets(
+                    input_matrix, target_matrix, num_folds=3)))
+
+
+def test_cross_validation_indices_shuffle():
+    num_samples = random.randint(10, 20)
+    num_folds = random.randint(2, 5)
+    folds = list(
+        validation.cross_validation_indices(
+            numpy.zeros((num_samples, 1)), num_folds, shuffle=True))
+
+    assert len(folds) == num_folds
+    # Testing sets partition all rows, and training sets are the rest
+    assert sorted(numpy.concatenate([test for _, test in folds
+                                     ])) == range(num_samples)
+    for train, test in folds:
+        assert sorted(numpy.concatenate([train, test])) == range(num_samples)
+
+
+def test_cross_validation_indices_stratified():
+    # 12 samples of class 0, 6 of class 1, in class order
+    target_matrix = numpy.array([[1, 0]] * 12 + [[0, 1]] * 6)
+    folds = list(
+        validation.cross_validation_indices(
+            target_matrix, 3, shuffle=random.choice([True, False]),
+            stratified=True))
+
+    assert sorted(numpy.concatenate([test for _, test in folds
+                                     ])) == range(len(target_matrix))
+    for _, test in folds:
+        assert list(numpy.bincount(validation._get_classes(
+            target_matrix[test]))) == [4, 2]
+
+
+def test_cross_validation_indices_too_many_folds():
+    with pytest.raises(ValueError):
+        list(validation.cross_validation_indices(numpy.zeros((3, 1)), 4))
+
+
 #############################
 # Statistics
 #############################
@@ -31,10 +31,18 @@ import collections
 
 import numpy
 
-from learning import MeanSquaredError
-
-
-def compare(names, models, datasets, num_folds=3, num_runs=30, all_kwargs={}):
+from learning import MeanSquaredError, parallel
+
+
+def compare(names,
+            models,
+            datasets,
+            num_folds=3,
+            num_runs=30,
+            all_kwargs={},
+            n_jobs=1,
+            shuffle=False,
+            stratified=False):
     """Compare a set of models on a set of datasets.
 
     Args:
@@ -42,6 +50,9 @@ def compare(names, models, datasets, num_folds=3, num_runs=30, all_kwargs={}):
             list of (name, model, (input_matrix, target_matrix), kwargs) tuples.
         num_folds: int; number of folds for each cross validation test.
         num_runs: int; number of runs for each benchmark.
+        n_jobs: int; number of processes for each benchmark.
+        shuffle: bool; if True, rows are assigned to folds in random order.
+        stratified: bool; if True, each fold has about the same proportion of each class.
     """
     # NOTE: Borrowed from Optimal:
     if not (isinstance(models, collections.Iterable)
@@ -66,7 +77,14 @@ def compare(names, models, datasets, num_folds=3, num_runs=30, all_kwargs={}):
     for (name, model, dataset, kwargs) in zip(names, models, datasets,
                                               all_kwargs):
         stats[name] = benchmark(
-            model, dataset, num_folds=num_folds, num_runs=num_runs, **kwargs)
+            model,
+            dataset,
+            num_folds=num_folds,
+            num_runs=num_runs,
+            n_jobs=n_jobs,
+            shuffle=shuffle,
+            stratified=stratified,
+            **kwargs)
 
     # Calculate meta stats
     means = [results['mean_of_means'] for results in stats.itervalues()]
@@ -107,13 +125,25 @@ def _isdataset(object_):
     return True
 
 
-def benchmark(model, dataset, num_folds=3, num_runs=30, **kwargs):
-    """Repeatedly cross validate model on dataset."""
+def benchmark(model, dataset, num_folds=3, num_runs=30, n_jobs=1,
+              shuffle=False, stratified=False, **kwargs):
+    """Repeatedly cross validate model on dataset.
+
+    With n_jobs, folds of all runs are validated in parallel processes.
+    With shuffle, each run assigns rows to folds in a new random order.
+    """
     # TODO (maybe): Just take a function, and aggregate stats for that function
-    runs = []
-    for _ in range(num_runs):
-        runs.append(
-            cross_validate(model, dataset, num_folds=num_folds, **kwargs))
+    processes = parallel.num_processes(n_jobs)
+    if processes > 1:
+        runs = _parallel_cross_validate(model, dataset, num_folds, num_runs,
+                                        processes, shuffle, stratified, kwargs)
+    else:
+        runs = []
+        for _ in range(num_runs):
+            runs.append(
+                cross_validate(model, dataset, num_folds=num_folds,
+                               shuffle=shuffle, stratified=stratified,
+                               **kwargs))
     stats = {'runs': runs}
 
     # Calculate meta stats
@@ -126,10 +156,23 @@ def benchmark(model, dataset, num_folds=3, num_runs=30, **kwargs):
     return stats
 
 
-def cross_validate(model, dataset, num_folds=3, **kwargs):
-    """Return various stats for model on all folds of dataset."""
+def cross_validate(model, dataset, num_folds=3, n_jobs=1, shuffle=False,
+                   stratified=False, **kwargs):
+    """Return various stats for model on all folds of dataset.
+
+    With n_jobs, folds are validated in parallel processes.
+    shuffle and stratified choose folds as in make_cross_validation_sets.
+    """
+    processes = parallel.num_processes(n_jobs)
+    if processes > 1:
+        return _parallel_cross_validate(model, dataset, num_folds, 1,
+                                        processes, shuffle, stratified,
+                                        kwargs)[0]
+
     # Get our sets, for use in cross validation
-    train_test_sets = make_cross_validation_sets(*dataset, num_folds=num_folds)
+    train_test_sets = make_cross_validation_sets(
+        *dataset, num_folds=num_folds, shuffle=shuffle,
+        stratified=stratified, lazy=True)
 
     # Get the stats on each set
     folds = []
@@ -150,6 +193,50 @@ def cross_validate(model, dataset, num_folds=3, **kwargs):
     return stats
 
 
+def _parallel_cross_validate(model, dataset, num_folds, num_runs, processes,
+                             shuffle, stratified, kwargs):
+    """Return stats for num_runs cross validations, with folds in parallel.
+
+    Dataset is shared with processes once, and each fold is given
+    by the rows of its testing set, matching make_cross_validation_sets.
+    Contiguous testing sets are given as slices, instead of row indices.
+    """
+    input_matrix = numpy.asarray(dataset[0])
+    target_matrix = numpy.asarray(dataset[1])
+    if shuffle or stratified:
+        # Each run has its own folds
+        tasks = [(test_indices, kwargs)
+                 for _ in range(num_runs)
+                 for _, test_indices in cross_validation_indices(
+                     target_matrix, num_folds, shuffle, stratified)]
+    else:
+        _check_num_folds(len(input_matrix), num_folds)
+        tasks = [(slice(start, stop), kwargs) for start, stop in
+                 _fold_ranges(len(input_matrix), num_folds)] * num_runs
+
+    folds = parallel.map_dataset(_validate_fold, model, input_matrix,
+                                 target_matrix, tasks, processes)
+
+    runs = []
+    for i in range(num_runs):
+        stats = {'folds': folds[i * num_folds:(i + 1) * num_folds]}
+        _add_mean_sd_to_stats(stats)
+        runs.append(stats)
+    return runs
+
+
+def _validate_fold(model, input_matrix, target_matrix, fold):
+    """Return stats for model, tested on rows test_rows, and trained on the rest.
+
+    test_rows is a slice or an array of row indices.
+    """
+    test_rows, kwargs = fold
+    training_set = (numpy.delete(input_matrix, test_rows, axis=0),
+                    numpy.delete(target_matrix, test_rows, axis=0))
+    testing_set = (input_matrix[test_rows], target_matrix[test_rows])
+    return _validate_model(model, training_set, testing_set, **kwargs)
+
+
 def train_test_validate(model, dataset, train_per_class, **kwargs):
     """Validate a classification dataset by splitting into a train and test set.
 
@@ -188,10 +275,14 @@ def _validate_model(model,
     stats['time'] = elapsed
     stats['epochs'] = model.iteration
 
+    # Activate once on each set, for both error and accuracy
+    training_outputs = _activate_rows(model, training_set[0])
+    testing_outputs = _activate_rows(model, testing_set[0])
+
     # Get error for training and testing set
     # TODO: Should use user provided error function
-    stats['training_error'] = get_error(model, *training_set)
-    stats['testing_error'] = get_error(model, *testing_set)
+    stats['training_error'] = _get_error(training_outputs, training_set[1])
+    stats['testing_error'] = _get_error(testing_outputs, testing_set[1])
 
     if _classification:
         if len(training_set[1][0]) == 1:
@@ -203,9 +294,7 @@ def _validate_model(model,
             num_classes = len(training_set[1][0])
 
         # Get accuracy and confusion matrix for training set
-        all_actual_training = _get_classes(
-            numpy.array(
-                [model.activate(inp_vec) for inp_vec in training_set[0]]))
+        all_actual_training = _get_classes(numpy.asarray(training_outputs))
         all_expected_training = _get_classes(training_set[1])
 
         stats['training_accuracy'] = _get_accuracy(all_actual_training,
@@ -214,9 +303,7 @@ def _validate_model(model,
             all_actual_training, all_expected_training, num_classes)
 
         # Get accuracy and confusion matrix for testing set
-        all_actual_testing = _get_classes(
-            numpy.array(
-                [model.activate(inp_vec) for inp_vec in testing_set[0]]))
+        all_actual_testing = _get_classes(numpy.asarray(testing_outputs))
         all_expected_testing = _get_classes(testing_set[1])
 
         stats['testing_accuracy'] = _get_accuracy(all_actual_testing,
@@ -233,25 +320,69 @@ def _validate_model(model,
 def get_error(model,
               input_matrix,
               target_matrix,
-              error_func=MeanSquaredError()):
-    """Return mean error of model on given dataset."""
-    # TODO: Activate model on matrix (once all models support it)
-    return numpy.mean([
-        error_func(model.activate(input_vec), target_vec)
-        for input_vec, target_vec in zip(input_matrix, target_matrix)
-    ])
+              error_func=MeanSquaredError(),
+              chunk_size=None):
+    """Return mean error of model on given dataset.
 
+    Args:
+        chunk_size: Max number of rows to activate at once,
+            for models that support batch activation. Defaults to all rows.
+    """
+    return _get_error(
+        _activate_rows(model, input_matrix, chunk_size), target_matrix,
+        error_func)
 
-def get_accuracy(model, input_matrix, target_matrix):
-    """Return accuracy of model on given dataset."""
-    # TODO: Activate model on matrix (once all models support it)
+
+def get_accuracy(model, input_matrix, target_matrix, chunk_size=None):
+    """Return accuracy of model on given dataset.
+
+    Args:
+        chunk_size: Max number of rows to activate at once,
+            for models that support batch activation. Defaults to all rows.
+    """
     return _get_accuracy(
         _get_classes(
-            numpy.array([model.activate(inp_vec)
-                         for inp_vec in input_matrix])),
+            numpy.asarray(_activate_rows(model, input_matrix, chunk_size))),
         _get_classes(target_matrix))
 
 
+def _activate_rows(model, input_matrix, chunk_size=None):
+    """Return model outputs for each row of input_matrix.
+
+    Models that support batch activation are activated on
+    chunks of chunk_size rows, returning a matrix.
+    Others are activated on one row at a time, returning a list,
+    because outputs may not be the same shape.
+    """
+    if not model.supports_batch_activate:
+        return [model.activate(input_vec) for input_vec in input_matrix]
+
+    input_matrix = numpy.asarray(input_matrix)
+    if chunk_size is None or chunk_size >= len(input_matrix):
+        return numpy.asarray(model.activate(input_matrix))
+    return numpy.vstack([
+        model.activate(input_matrix[start:start + chunk_size])
+        for start in range(0, len(input_matrix), chunk_size)
+    ])
+
+
+def _get_error(outputs, target_matrix, error_func=MeanSquaredError()):
+    """Return mean error of each output and target row.
+
+    Args:
+        outputs: Matrix or list of output rows, from _activate_rows.
+    """
+    if isinstance(outputs, numpy.ndarray):
+        # Error functions average over rows, so one call on
+        # the whole matrix gives the mean of each row error
+        return error_func(outputs, numpy.asarray(target_matrix))
+
+    return numpy.mean([
+        error_func(output_vec, target_vec)
+        for output_vec, target_vec in zip(outputs, target_matrix)
+    ])
+
+
 def _get_classes(matrix):
     """Return a list of classes given a matrix.
 
@@ -303,38 +434,109 @@ def _get_confusion_matrix(all_actual, all_expected, num_classes):
 ############################
 # Splitting datasets
 ############################
-def make_cross_validation_sets(input_matrix, target_matrix, num_folds=3):
+def make_cross_validation_sets(input_matrix, target_matrix, num_folds=3,
+                               shuffle=False, stratified=False, lazy=False):
     """Return a number of disjoint (training_set, testing_set) pairs.
 
     Each set is a (input_matrix, target_matrix) tuple.
+
+    Args:
+        input_matrix: attributes matrix. Each row is sample, each column is attribute.
+        target_matrix: targets matrix. Each row is sample, each column is target.
+        num_folds: Number of (training_set, testing_set) pairs.
+        shuffle: If True, rows are assigned to folds in random order.
+        stratified: If True, each fold has about the same proportion of each class.
+        lazy: If True, return a generator that makes each pair when needed,
+            so only one pair is in memory at a time.
     """
-    return _create_train_test_sets(
-        _split_dataset(input_matrix, target_matrix, num_folds))
+    input_matrix = numpy.asarray(input_matrix)
+    target_matrix = numpy.asarray(target_matrix)
+
+    if shuffle or stratified:
+        train_test_sets = (((input_matrix[train_indices],
+                             target_matrix[train_indices]),
+                            (input_matrix[test_indices],
+                             target_matrix[test_indices]))
+                           for train_indices, test_indices in
+                           cross_validation_indices(target_matrix, num_folds,
+                                                    shuffle, stratified))
+    else:
+        # Testing sets are views of contiguous rows, so only
+        # training sets are copied
+        _check_num_folds(len(input_matrix), num_folds)
+        train_test_sets = _contiguous_train_test_sets(
+            _split_dataset(input_matrix, target_matrix, num_folds))
+    if lazy:
+        return train_test_sets
+    return list(train_test_sets)
+
+
+def cross_validation_indices(target_matrix, num_folds=3, shuffle=False,
+                             stratified=False):
+    """Yield (training_indices, testing_indices) for each fold.
+
+    Without shuffle or stratified, each testing set is a contiguous
+    range of rows, given by _fold_ranges.
+
+    Args:
+        target_matrix: targets matrix. Each row is sample, each column is target.
+        num_folds: Number of folds.
+        shuffle: If True, rows are assigned to folds in random order.
+        stratified: If True, each fold has about the same proportion of each class.
+    """
+    num_samples = len(target_matrix)
+    _check_num_folds(num_samples, num_folds)
+
+    if shuffle:
+        order = numpy.random.permutation(num_samples)
+    else:
+        order = numpy.arange(num_samples)
+
+    if stratified:
+        # Group rows by class, then deal them out to folds in turn,
+        # so every class is spread evenly across folds
+        classes = _get_classes(numpy.asarray(target_matrix))
+        order = order[numpy.argsort(classes[order], kind='mergesort')]
+        test_sets = [
+            numpy.sort(order[i::num_folds]) for i in range(num_folds)
+        ]
+    else:
+        test_sets = [
+            order[start:stop]
+            for start, stop in _fold_ranges(num_samples, num_folds)
+        ]
+
+    for test_indices in test_sets:
+        train_mask = numpy.ones(num_samples, dtype=bool)
+        train_mask[test_indices] = False
+        yield numpy.flatnonzero(train_mask), test_indices
 
 
 def _split_dataset(input_matrix, target_matrix, num_sets):
-    """Split patterns into num_sets disjoint sets."""
-    # Zip for easier splitting
-    patterns = zip(input_matrix, target_matrix)
-
-    sets = []
-    start_pos = 0
-    set_size = len(patterns) / num_sets  # rounded down
-    for i in range(num_sets):
-        # For the last set, add all remaining items (in case sets don't split evenly)
-        if i == num_sets - 1:
-            new_set = patterns[start_pos:]
-        else:
-            new_set = patterns[start_pos:start_pos + set_size]
+    """Split patterns into num_sets disjoint sets.
+
+    Sets are views of contiguous rows, so no data is copied.
+    """
+    input_matrix = numpy.asarray(input_matrix)
+    target_matrix = numpy.asarray(target_matrix)
+    return [(input_matrix[start:stop], target_matrix[start:stop])
+            for start, stop in _fold_ranges(len(input_matrix), num_sets)]
+
 
-        # Transpose back into (input_matrix, target_matrix)
-        set_input_matrix, set_target_matrix = zip(*new_set)
-        sets.append((numpy.array(set_input_matrix),
-                     numpy.array(set_target_matrix)))
+def _contiguous_train_test_sets(sets):
+    """Yield (training_set, testing_set), testing on each of sets in turn."""
+    for i, testing_set in enumerate(sets):
+        other_sets = sets[:i] + sets[i + 1:]
+        yield ((numpy.concatenate([set_[0] for set_ in other_sets]),
+                numpy.concatenate([set_[1] for set_ in other_sets])),
+               testing_set)
 
-        start_pos += set_size
 
-    return sets
+def _check_num_folds(num_samples, num_folds):
+    """Raise ValueError if num_samples cannot be split into num_folds folds."""
+    if num_folds < 2 or num_folds > num_samples:
+        raise ValueError(
+            'num_folds must be between 2 and the number of samples')
 
 
 def make_train_test_sets(input_matrix, label_matrix, train_per_class):
@@ -379,31 +581,14 @@ def make_train_test_sets(input_matrix, label_matrix, train_per_class):
             (numpy.array(testing_inputs), numpy.array(testing_labels)))
 
 
-def _create_train_test_sets(sets):
-    """Organize sets into training and testing groups.
-
-    Each group has one test set, and all others are training.
-    Each group has all (input_matrix, target_matrix) between the train and test set.
-    """
-    train_test_sets = []
-    num_folds = len(sets)
-
-    for i in range(num_folds):
-        test_set = sets[i]
-
-        # Train set is all other sets
-        train_set = [[], []]
-        for j in range(num_folds):
-            if i != j:
-                train_set[0].extend(list(sets[j][0]))
-                train_set[1].extend(list(sets[j][1]))
-
-        # Train, test tuples
-        train_set[0] = numpy.array(train_set[0])
-        train_set[1] = numpy.array(train_set[1])
-        train_test_sets.append((tuple(train_set), test_set))
-
-    return train_test_sets
+def _fold_ranges(num_samples, num_folds):
+    """Return (start, stop) row range of each contiguous set."""
+    set_size = num_samples / num_folds  # rounded down
+    ranges = [(i * set_size, (i + 1) * set_size)
+              for i in range(num_folds - 1)]
+    # Last set has all remaining rows
+    ranges.append(((num_folds - 1) * set_size, num_samples))
+    return ranges
 
 
 #############################
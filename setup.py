@@ -20,7 +20,7 @@ setup(
     package_data={'learning': ['examples/*.py', 'data/datasets/*.data']},
     # Dependencies
     install_requires=[
-        'numpy'
+        'numpy>=1.13'  # For numpy.unique with axis
     ],
 
     # Metadata